@@ -1,7 +1,24 @@
 # api/admin.py
 from fastapi import APIRouter, Depends, HTTPException, Request
 from firebase_admin import db, auth as firebase_auth
+from .archive import delete_user_archive
 from .auth import verify_admin
+from .cache import all_cache_stats
+from .device_access import (
+    USER_DEVICES_ROOT,
+    invalidate_device_access,
+    load_device_access,
+    reindex_device,
+    user_device_path,
+)
+from .device_auth import invalidate_device_credentials
+from .device_status import describe_status, load_device_statuses
+from .ingest_queue import derived_queue, ingest_queue
+from .mqtt_ingest import mqtt_ingest_stats
+from .pubsub import record_broker
+from .rate_limit import rate_limit_stats
+from .record_store import MIGRATION_ROOT, V2_ROOT
+from .user_info import forget_user_info, lookup_users
 from typing import List, Dict, Optional
 import time
 import logging
@@ -74,6 +91,7 @@ async def update_user(user_id: str, req: Request, admin = Depends(verify_admin))
         # Update custom claims if admin status changed
         if "admin" in data:
             firebase_auth.set_custom_user_claims(user_id, {'admin': data["admin"]})
+        forget_user_info(user_id)
         
         return {"status": "ok", "message": "User updated successfully"}
     except Exception as e:
@@ -130,6 +148,7 @@ async def delete_user(user_id: str, admin = Depends(verify_admin)):
         
         # Delete user from Firebase Auth first
         firebase_auth.delete_user(user_id)
+        forget_user_info(user_id)
         logger.info(f"Successfully deleted user {user_id} from Firebase Auth")
         
         # Remove user from devices (keep devices but clear user_id)
@@ -144,6 +163,7 @@ async def delete_user(user_id: str, admin = Depends(verify_admin)):
                     device_data["unregistered_at"] = int(time.time() * 1000)
                     device_data["status"] = "unregistered"
                     device_ref.set(device_data)
+                    reindex_device(device_id, removed=[user_id])
                     logger.debug(f"Removed user from device {device_id}")
             except Exception as e:
                 logger.warning(f"Failed to remove user from device {device_id}: {e}")
@@ -156,6 +176,26 @@ async def delete_user(user_id: str, admin = Depends(verify_admin)):
             except Exception as e:
                 logger.warning(f"Failed to delete record {record_id}: {e}")
         
+        # Clean up the per-user copies of the records and what is derived from them
+        try:
+            db.reference("/").update({
+                f"user_records/{user_id}": None,
+                f"{V2_ROOT}/{user_id}": None,
+                f"{MIGRATION_ROOT}/{user_id}": None,
+                f"user_rollups/{user_id}": None,
+                f"{USER_DEVICES_ROOT}/{user_id}": None,
+            })
+            logger.debug(f"Deleted per-user records, rollups and device index for {user_id}")
+        except Exception as e:
+            logger.warning(f"Failed to delete per-user records: {e}")
+        
+        # Archived partitions, then the index that points at them
+        try:
+            delete_user_archive(user_id)
+            logger.debug(f"Deleted archived records for {user_id}")
+        except Exception as e:
+            logger.warning(f"Failed to delete archived records: {e}")
+        
         # Clean up user's profile
         try:
             db.reference(f"/user_profiles/{user_id}").delete()
@@ -205,39 +245,30 @@ async def get_all_devices(admin = Depends(verify_admin)):
         if not devices:
             return {"devices": [], "total": 0}
         
+        # Last activity comes from the ingest-maintained status index (one read)
+        statuses = load_device_statuses()
+        # Owners' email/name in batched, cached Auth lookups
+        owners = lookup_users(device_data.get("user_id") for device_data in devices.values())
+        
         devices_list = []
         for device_id, device_data in devices.items():
             device_info = {
                 "deviceId": device_id,
                 "userId": device_data.get("user_id"),
                 "registeredAt": device_data.get("registered_at"),
-                "lastActive": None  # Will be populated from records
+                **describe_status(statuses.get(device_id))
             }
             
             # Get user info
             if device_info["userId"]:
-                try:
-                    user = firebase_auth.get_user(device_info["userId"])
-                    device_info["userEmail"] = user.email
-                    device_info["userDisplayName"] = user.display_name
-                except:
+                owner = owners.get(device_info["userId"])
+                if owner:
+                    device_info["userEmail"] = owner["email"]
+                    device_info["userDisplayName"] = owner["display_name"]
+                else:
                     device_info["userEmail"] = "Unknown"
                     device_info["userDisplayName"] = "Deleted User"
             
-            # Get last activity from records - avoid index error
-            records_ref = db.reference("/records")
-            all_records = records_ref.get()
-            latest_timestamp = None
-            
-            if all_records:
-                for record_id, record_data in all_records.items():
-                    if record_data.get("device_id") == device_id:
-                        ts = record_data.get("ts")
-                        if ts and (latest_timestamp is None or ts > latest_timestamp):
-                            latest_timestamp = ts
-            
-            device_info["lastActive"] = latest_timestamp
-            
             devices_list.append(device_info)
         
         # Sort by registration date descending - handle None values
@@ -254,8 +285,16 @@ async def get_all_devices(admin = Depends(verify_admin)):
 async def delete_device(device_id: str, admin = Depends(verify_admin)):
     """Delete a device"""
     try:
+        # Users whose /user_devices index lists this device
+        users = load_device_access(device_id, fresh=True).users
+        
         # Delete device from registry
         db.reference(f"/devices/{device_id}").delete()
+        db.reference(f"/device_status/{device_id}").delete()
+        if users:
+            db.reference("/").update({user_device_path(uid, device_id): None for uid in users})
+        invalidate_device_credentials(device_id)
+        invalidate_device_access(device_id)
         
         # Optionally delete associated records
         # Uncomment if you want to delete records too
@@ -298,30 +337,20 @@ async def get_user_devices(user_id: str, admin = Depends(verify_admin)):
         if not all_devices:
             return {"devices": [], "total": 0}
         
+        owned = {
+            device_id: device_data
+            for device_id, device_data in all_devices.items()
+            if device_data.get("user_id") == user_id
+        }
+        statuses = load_device_statuses() if owned else {}
+        
         devices_list = []
-        for device_id, device_data in all_devices.items():
-            if device_data.get("user_id") != user_id:
-                continue
+        for device_id, device_data in owned.items():
             device_info = {
                 "deviceId": device_id,
                 "registeredAt": device_data.get("registered_at"),
-                "lastActive": None
+                **describe_status(statuses.get(device_id))
             }
-            
-            # Get last activity - avoid index error
-            records_ref = db.reference("/records")
-            all_records = records_ref.get()
-            latest_timestamp = None
-            
-            if all_records:
-                for record_id, record_data in all_records.items():
-                    if record_data.get("device_id") == device_id:
-                        ts = record_data.get("ts")
-                        if ts and (latest_timestamp is None or ts > latest_timestamp):
-                            latest_timestamp = ts
-            
-            device_info["lastActive"] = latest_timestamp
-            
             devices_list.append(device_info)
         
         return {
@@ -358,4 +387,17 @@ async def get_admin_stats(admin = Depends(verify_admin)):
             "timestamp": int(time.time() * 1000)  # Current timestamp in milliseconds
         }
     except Exception as e:
-        raise HTTPException(500, f"Failed to fetch stats: {str(e)}")
\ No newline at end of file
+        raise HTTPException(500, f"Failed to fetch stats: {str(e)}")
+
+@router.get("/metrics")
+async def get_metrics(admin = Depends(verify_admin)):
+    """Get in-process cache and ingest metrics for this server instance"""
+    return {
+        "caches": all_cache_stats(),
+        "ingest_queue": ingest_queue.stats(),
+        "derived_queue": derived_queue.stats(),
+        "mqtt_ingest": mqtt_ingest_stats(),
+        "rate_limits": rate_limit_stats(),
+        "streams": record_broker.stats(),
+        "timestamp": int(time.time() * 1000)
+    }
@@ -0,0 +1,96 @@
+# api/aggregate.py
+"""Vectorized per-bucket statistics over a window of raw records.
+
+Backs GET /api/records/aggregate. Records are turned into NumPy columns once,
+then every bucket's count/mean/min/max/p10/p90 is computed with array
+operations (one sort per metric, `reduceat` for the sums) instead of Python
+loops, so a window of hundreds of thousands of samples stays cheap.
+
+Unlike the stored rollups (api/rollups.py) this works from raw samples, which
+is what the percentiles need. Buckets are UTC-aligned and keyed by their start
+in ms, in the same shape as `summarize_rollup` plus `p10`/`p90`.
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from .rollups import METRICS
+
+BUCKETS = {
+    "5m": 300_000,
+    "1h": 3_600_000,
+    "1d": 86_400_000,
+}
+PERCENTILES = {"p10": 0.10, "p90": 0.90}
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+def record_columns(records: Iterable[Dict[str, Any]]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """(ts, {metric: values}) arrays; missing or non-numeric values become NaN.
+
+    Records without a numeric `ts` are dropped. Accepts legacy `hr`/`bpm` for
+    heart_rate like the rollups do.
+    """
+    rows = [r for r in records if isinstance(r.get("ts"), (int, float))]
+    ts = np.fromiter((r["ts"] for r in rows), dtype=np.int64, count=len(rows))
+    columns = {
+        "heart_rate": np.fromiter(
+            (_number(r.get("heart_rate", r.get("hr", r.get("bpm")))) for r in rows), dtype=np.float64, count=len(rows)
+        ),
+        "spo2": np.fromiter((_number(r.get("spo2")) for r in rows), dtype=np.float64, count=len(rows)),
+    }
+    return ts, columns
+
+
+def _percentile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    # Linear interpolation within each bucket's sorted run (numpy's default method)
+    position = q * (counts - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    low, high = values[starts + lower], values[starts + upper]
+    return low + (high - low) * (position - lower)
+
+
+def _metric_stats(groups: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Bucket IDs that have values for this metric, and their statistics."""
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    buckets, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+    if not len(buckets):
+        return buckets, {}
+    stats = {
+        "count": counts,
+        "mean": np.add.reduceat(values, starts) / counts,
+        "min": values[starts],
+        "max": values[starts + counts - 1],
+    }
+    for name, q in PERCENTILES.items():
+        stats[name] = _percentile(values, starts, counts, q)
+    return buckets, stats
+
+
+def aggregate_records(records: Iterable[Dict[str, Any]], bucket_ms: int) -> List[Dict[str, Any]]:
+    """Per-bucket statistics for `heart_rate` and `spo2`, oldest bucket first."""
+    ts, columns = record_columns(records)
+    if not len(ts):
+        return []
+    groups = ts // bucket_ms
+    buckets, counts = np.unique(groups, return_counts=True)
+    result = {
+        int(bucket): {"bucket": int(bucket) * bucket_ms, "count": int(count), **{metric: None for metric in METRICS}}
+        for bucket, count in zip(buckets, counts)
+    }
+    for metric in METRICS:
+        metric_buckets, stats = _metric_stats(groups, columns[metric])
+        for i, bucket in enumerate(metric_buckets):
+            result[int(bucket)][metric] = {
+                name: (int(values[i]) if name == "count" else float(values[i])) for name, values in stats.items()
+            }
+    return [result[int(bucket)] for bucket in buckets]
@@ -7,6 +7,8 @@ import time
 from firebase_admin import db
 
 from .auth import verify_firebase_token
+from .push_ids import generate_push_id
+from .recent_records import recent_user_records
 
 router = APIRouter(prefix="/api/ai")
 
@@ -25,39 +27,26 @@ def _configure_genai() -> None:
 
 
 def _fetch_recent_user_records(user_id: str, limit: int = 25) -> List[Dict[str, Any]]:
-    """Fetch recent health records for the given user from RTDB."""
-    user_records_ref = db.reference(f"/user_records/{user_id}")
-    try:
-        records = (
-            user_records_ref.order_by_child("ts").limit_to_last(limit).get()
-        ) or {}
-    except Exception:
-        records = user_records_ref.get() or {}
-
-    result: List[Dict[str, Any]] = []
-    for _, value in records.items():
-        if not isinstance(value, dict):
-            continue
-        result.append({
+    """Fetch recent health records for the given user (served from the recent-records buffer)."""
+    return [
+        {
             "ts": value.get("ts"),
             "heart_rate": value.get("heart_rate") or value.get("bpm"),
             "spo2": value.get("spo2"),
             "device_id": value.get("device_id"),
-        })
-
-    result.sort(key=lambda x: x.get("ts", 0), reverse=True)
-    return result[:limit]
+        }
+        for value in recent_user_records(user_id, limit)
+    ]
 
 
 def _append_chat_and_update_meta(uid: str, session_id: str, user_message: str, ai_reply: str) -> None:
     """Append user and assistant messages to a session and update meta."""
     root_ref = db.reference("/")
-    messages_ref = db.reference(f"/ai_chats/{uid}/{session_id}/messages")
 
-    # Reserve keys to do a single multi-path update
-    key_user = messages_ref.push({"_tmp": True}).key
-    key_ai = messages_ref.push({"_tmp": True}).key
+    # Generate keys locally to do a single multi-path update
     now_ms = int(time.time() * 1000)
+    key_user = generate_push_id(now_ms)
+    key_ai = generate_push_id(now_ms + 1)
 
     updates = {
         f"ai_chats/{uid}/{session_id}/messages/{key_user}": {
@@ -0,0 +1,305 @@
+# api/archive.py
+"""Cold-storage tier for old records.
+
+`scripts/archive_user_records.py` moves records older than ARCHIVE_AFTER_DAYS
+out of RTDB into gzip-compressed NDJSON files, one per user and UTC day:
+
+    {uid}/{YYYY-MM-DD}.ndjson.gz
+
+stored under ARCHIVE_DIR on local disk or, if ARCHIVE_BUCKET is set, in that
+Cloud Storage bucket (under ARCHIVE_PREFIX). Each line is
+{"id": key, ...record}, sorted by (ts, key). Archiving is off unless one of
+the two is configured.
+
+Per user, /archive_index/{uid} records what has been moved:
+
+    {"archived_before": <ts ms>, "archived_key": <push ID>,
+     "partitions": {"YYYY-MM-DD": <record count>}, "updated_at": <ms>}
+
+Every archived record has key < archived_key and ts < archived_before. A page
+of records is written to its partition files first and then deleted from
+/user_records and /user_records_v2 in the same multi-path update that
+advances the index, so a crash in between leaves a record in both tiers
+(readers merge by id) but never in neither.
+
+Reads that can reach back past `archived_before` (`query_user_records`, and
+through it pagination, max_points and aggregates; the export) merge the
+archived partitions they touch with the live results.
+"""
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from firebase_admin import db
+
+from .cache import MISSING, TTLCache
+from .push_ids import push_id_floor
+from .record_store import (
+    V2_ROOT,
+    _sort_newest_first,
+    iter_user_record_pages,
+    partition_for,
+)
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "")
+ARCHIVE_BUCKET = os.environ.get("ARCHIVE_BUCKET", "")
+ARCHIVE_PREFIX = os.environ.get("ARCHIVE_PREFIX", "user_records_archive")
+ARCHIVE_ENABLED = bool(ARCHIVE_DIR or ARCHIVE_BUCKET)
+# Records whose ts is older than this many days (rounded down to a UTC day) are archived
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+# How long a user's archive index is reused before it is read again
+ARCHIVE_INDEX_TTL = float(os.environ.get("ARCHIVE_INDEX_TTL", "60"))
+
+ARCHIVE_INDEX_ROOT = "archive_index"
+
+Record = Dict[str, Any]
+
+_index_cache = TTLCache("archive_index", maxsize=10000, ttl=ARCHIVE_INDEX_TTL)
+
+
+class LocalArchiveStore:
+    """Partition files on local disk (development, or a mounted volume)."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, uid: str, day: str) -> Path:
+        return self.root / uid / f"{day}.ndjson.gz"
+
+    def read(self, uid: str, day: str) -> Optional[bytes]:
+        try:
+            return self._path(uid, day).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def write(self, uid: str, day: str, data: bytes) -> None:
+        path = self._path(uid, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def delete_user(self, uid: str) -> None:
+        try:
+            shutil.rmtree(self.root / uid)
+        except FileNotFoundError:
+            pass
+
+
+class BucketArchiveStore:
+    """Partition objects in a Cloud Storage bucket (via firebase_admin.storage)."""
+
+    def __init__(self, bucket_name: str, prefix: str = ARCHIVE_PREFIX):
+        from firebase_admin import storage
+
+        self.bucket = storage.bucket(bucket_name)
+        self.prefix = prefix.strip("/")
+
+    def _name(self, uid: str, day: str) -> str:
+        return f"{self.prefix}/{uid}/{day}.ndjson.gz"
+
+    def read(self, uid: str, day: str) -> Optional[bytes]:
+        from google.cloud.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(self._name(uid, day)).download_as_bytes()
+        except NotFound:
+            return None
+
+    def write(self, uid: str, day: str, data: bytes) -> None:
+        self.bucket.blob(self._name(uid, day)).upload_from_string(data, content_type="application/gzip")
+
+    def delete_user(self, uid: str) -> None:
+        for blob in self.bucket.list_blobs(prefix=f"{self.prefix}/{uid}/"):
+            blob.delete()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def archive_store():
+    """The configured store (bucket if ARCHIVE_BUCKET is set, else ARCHIVE_DIR), or None."""
+    global _store
+    if _store is None and ARCHIVE_ENABLED:
+        with _store_lock:
+            if _store is None:
+                _store = BucketArchiveStore(ARCHIVE_BUCKET) if ARCHIVE_BUCKET else LocalArchiveStore(ARCHIVE_DIR)
+    return _store
+
+
+def encode_partition(records: List[Record]) -> bytes:
+    """gzip NDJSON of `records` ({"id": ..., ...}), oldest first."""
+    rows = sorted(records, key=lambda r: (r.get("ts") or 0, r.get("id", "")))
+    lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in rows)
+    return gzip.compress(lines.encode(), compresslevel=9)
+
+
+def decode_partition(data: Optional[bytes]) -> List[Record]:
+    if not data:
+        return []
+    return [json.loads(line) for line in gzip.decompress(data).decode().splitlines() if line]
+
+
+def archive_cutoff(now_ms: int, days: int = ARCHIVE_AFTER_DAYS) -> int:
+    """Start of the UTC day `days` days before now_ms; records before it get archived."""
+    day = datetime.fromtimestamp(now_ms / 1000, tz=timezone.utc).date() - timedelta(days=days)
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def archive_index(uid: str) -> Dict[str, Any]:
+    """The user's /archive_index entry ({} if nothing is archived), cached briefly."""
+    index = _index_cache.get(uid, MISSING)
+    if index is MISSING:
+        index = db.reference(f"/{ARCHIVE_INDEX_ROOT}/{uid}").get() or {}
+        _index_cache.set(uid, index)
+    return index
+
+
+def _archived_days(index: Dict[str, Any], start_ts: Optional[int], end_ts: Optional[int]) -> List[str]:
+    """Archived partitions overlapping [start_ts, end_ts], oldest first."""
+    days = sorted(index.get("partitions") or {})
+    first = partition_for(start_ts) if start_ts is not None else None
+    last = partition_for(end_ts) if end_ts is not None else None
+    return [d for d in days if (first is None or d >= first) and (last is None or d <= last)]
+
+
+def _in_range(record: Record, start_ts: Optional[int], end_ts: Optional[int]) -> bool:
+    ts = record.get("ts", 0)
+    return (start_ts is None or ts >= start_ts) and (end_ts is None or ts <= end_ts)
+
+
+def read_archived_records(
+    uid: str, start_ts: Optional[int], end_ts: Optional[int], limit: Optional[int] = None
+) -> List[Record]:
+    """Archived records with start_ts <= ts <= end_ts, newest first.
+
+    Partitions are read newest-first and reading stops once `limit` records
+    are collected.
+    """
+    store = archive_store()
+    if store is None:
+        return []
+    records: List[Record] = []
+    for day in reversed(_archived_days(archive_index(uid), start_ts, end_ts)):
+        if limit is not None and len(records) >= limit:
+            break
+        records.extend(r for r in decode_partition(store.read(uid, day)) if _in_range(r, start_ts, end_ts))
+    _sort_newest_first(records)
+    return records if limit is None else records[:limit]
+
+
+def iter_archived_records(uid: str, start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> Iterator[Record]:
+    """Archived records in range, oldest first, one partition in memory at a time."""
+    store = archive_store()
+    if store is None:
+        return
+    for day in _archived_days(archive_index(uid), start_ts, end_ts):
+        for record in decode_partition(store.read(uid, day)):
+            if _in_range(record, start_ts, end_ts):
+                yield record
+
+
+def is_archived(key: str, record: Record, index: Dict[str, Any]) -> bool:
+    """Whether a live record also belongs in the archive (left over by an interrupted run)."""
+    ts = record.get("ts")
+    return (
+        bool(index.get("archived_key"))
+        and key < index["archived_key"]
+        and isinstance(ts, (int, float))
+        and ts < index.get("archived_before", 0)
+    )
+
+
+def with_archived(
+    uid: str, live: List[Record], count: int, start_ts: Optional[int], end_ts: Optional[int]
+) -> List[Record]:
+    """Merge archived records into a newest-first live result of at most `count` rows.
+
+    The archive is only read when the live rows leave room for older records,
+    i.e. fewer than `count` came back or the oldest is older than
+    `archived_before`.
+    """
+    if archive_store() is None:
+        return live
+    before = archive_index(uid).get("archived_before")
+    if not before or (start_ts is not None and start_ts >= before):
+        return live
+    lower = start_ts
+    if len(live) >= count:
+        oldest = live[-1].get("ts") or 0
+        if oldest >= before:
+            return live
+        lower = oldest if lower is None else max(lower, oldest)
+    upper = before - 1 if end_ts is None else min(end_ts, before - 1)
+    archived = read_archived_records(uid, lower, upper, count)
+    if not archived:
+        return live
+    merged = {r["id"]: r for r in archived}
+    merged.update((r["id"], r) for r in live)
+    result = list(merged.values())
+    _sort_newest_first(result)
+    return result[:count]
+
+
+def archive_user_records(uid: str, cutoff_ts: int, page_size: int = 1000, dry_run: bool = False) -> int:
+    """Move the user's records with ts < cutoff_ts to the archive; returns how many.
+
+    Walks /user_records/{uid} in key order up to push_id_floor(cutoff_ts)
+    (a record is never stored before its ts). Each page is merged into its
+    day partitions, then deleted from RTDB in one multi-path update together
+    with the index. Records stored after the cutoff, even with an older ts,
+    stay live until a later run's cutoff passes them.
+    """
+    store = archive_store()
+    if store is None:
+        raise RuntimeError("Archiving is not configured (set ARCHIVE_DIR or ARCHIVE_BUCKET)")
+    cutoff_key = push_id_floor(cutoff_ts)
+    index_path = f"{ARCHIVE_INDEX_ROOT}/{uid}"
+    index = archive_index(uid)
+    before = max(index.get("archived_before") or 0, cutoff_ts)
+    archived_key = max(index.get("archived_key") or "", cutoff_key)
+    archived = 0
+
+    for page in iter_user_record_pages(uid, page_size):
+        by_day: Dict[str, List[Record]] = {}
+        for key, record in page:
+            ts = record.get("ts")
+            if key < cutoff_key and isinstance(ts, (int, float)) and ts < cutoff_ts:
+                by_day.setdefault(partition_for(int(ts)), []).append({"id": key, **record})
+        archived += sum(len(rows) for rows in by_day.values())
+
+        if by_day and not dry_run:
+            updates: Dict[str, Any] = {
+                f"{index_path}/archived_before": before,
+                f"{index_path}/archived_key": archived_key,
+                f"{index_path}/updated_at": int(datetime.now(timezone.utc).timestamp() * 1000),
+            }
+            for day, rows in by_day.items():
+                merged = {r["id"]: r for r in decode_partition(store.read(uid, day))}
+                merged.update((r["id"], r) for r in rows)
+                store.write(uid, day, encode_partition(list(merged.values())))
+                updates[f"{index_path}/partitions/{day}"] = len(merged)
+                for r in rows:
+                    updates[f"user_records/{uid}/{r['id']}"] = None
+                    updates[f"{V2_ROOT}/{uid}/{day}/{r['id']}"] = None
+            db.reference("/").update(updates)
+            _index_cache.invalidate(uid)
+
+        if page and page[-1][0] >= cutoff_key:
+            break
+    return archived
+
+
+def delete_user_archive(uid: str) -> None:
+    """Delete the user's archived partitions, then their /archive_index entry."""
+    store = archive_store()
+    if store is not None:
+        store.delete_user(uid)
+    db.reference(f"/{ARCHIVE_INDEX_ROOT}/{uid}").delete()
+    _index_cache.invalidate(uid)
@@ -0,0 +1,82 @@
+# api/cache.py
+"""Small in-process caches shared by the API routers.
+
+Each cache is bounded (least recently used entries are evicted first), expires
+entries after a TTL and keeps hit/miss counters. Caches register themselves so
+the admin metrics endpoint can report on all of them.
+"""
+import threading
+from typing import Any, Dict, Hashable, List
+
+from cachetools import TTLCache as _TTLCache
+
+MISSING = object()
+_registry: List["TTLCache"] = []
+
+
+class TTLCache:
+    """Thread-safe TTL + LRU cache with hit/miss counters."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = _TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _registry.append(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (which may itself be None) or `default` on a miss."""
+        with self._lock:
+            value = self._data.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def contains(self, key: Hashable) -> bool:
+        """Check for a live entry without touching the counters."""
+        with self._lock:
+            return key in self._data
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else None,
+            }
+
+
+def all_cache_stats() -> List[Dict[str, Any]]:
+    """Stats for every cache created in this process."""
+    return [cache.stats() for cache in _registry]
+
+
+def clear_all_caches() -> None:
+    """Reset every registered cache (used by tests and admin tooling)."""
+    for cache in _registry:
+        cache.clear()
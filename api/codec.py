@@ -0,0 +1,129 @@
+# api/codec.py
+"""Request/response body codecs.
+
+Devices on metered links can send `Content-Type: application/msgpack` and ask
+for `Accept: application/msgpack` to exchange MessagePack instead of JSON.
+Everything else keeps the existing JSON behaviour.
+
+Bulk record reads can also ask for a columnar layout (`columnar`), which
+`compact_json_response` encodes with orjson when it is installed and
+compresses with brotli or gzip according to `Accept-Encoding`.
+"""
+import gzip
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import msgpack
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+
+COLUMNAR_FIELDS = ("id", "ts", "heart_rate", "spo2")
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+
+def _media_types(header_value: str):
+    return {part.split(";")[0].strip().lower() for part in header_value.split(",")}
+
+
+def is_msgpack_request(req: Request) -> bool:
+    return bool(_media_types(req.headers.get("content-type", "")) & MSGPACK_MEDIA_TYPES)
+
+
+def accepts_msgpack(req: Request) -> bool:
+    return bool(_media_types(req.headers.get("accept", "")) & MSGPACK_MEDIA_TYPES)
+
+
+def unpack_msgpack(raw: bytes) -> Any:
+    """Decode a MessagePack document, raising ValueError on malformed input."""
+    try:
+        return msgpack.unpackb(raw, raw=False)
+    except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as e:
+        raise ValueError(f"Invalid MessagePack body: {e}") from e
+
+
+async def read_body(req: Request) -> Any:
+    """Decode the request body according to its Content-Type (JSON by default)."""
+    if is_msgpack_request(req):
+        try:
+            return unpack_msgpack(await req.body())
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    return await req.json()
+
+
+def negotiated_response(req: Request, content: Any, status_code: int = 200) -> Response:
+    """Encode `content` as MessagePack if the client accepts it, else JSON."""
+    if accepts_msgpack(req):
+        return Response(
+            content=msgpack.packb(content, use_bin_type=True),
+            status_code=status_code,
+            media_type=MSGPACK_MEDIA_TYPE,
+        )
+    return JSONResponse(status_code=status_code, content=content)
+
+
+def columnar(records: Iterable[Dict[str, Any]], fields=COLUMNAR_FIELDS) -> Dict[str, List[Any]]:
+    """{"field": [values...]} for a list of records (legacy `hr` fills heart_rate)."""
+    records = list(records)
+    columns = {field: [r.get(field) for r in records] for field in fields}
+    if "heart_rate" in columns:
+        columns["heart_rate"] = [
+            value if value is not None else r.get("hr", r.get("bpm"))
+            for value, r in zip(columns["heart_rate"], records)
+        ]
+    return columns
+
+
+def encode_json(content: Any) -> bytes:
+    """Compact JSON bytes (orjson when installed, stdlib json otherwise)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+def _accepted_encodings(header_value: Optional[str]) -> set:
+    accepted = set()
+    for part in (header_value or "").split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+def compact_json_response(req: Request, content: Any, status_code: int = 200) -> Response:
+    """JSON response encoded with orjson and compressed (br, then gzip) when accepted."""
+    body = encode_json(content)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accepted = _accepted_encodings(req.headers.get("accept-encoding"))
+        if BROTLI_AVAILABLE and "br" in accepted:
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -1,21 +1,21 @@
 # api/command.py
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Request
 from firebase_admin import db
+from .codec import negotiated_response
+from .device_auth import verify_device
+from .rate_limit import device_rate_limit
 
 router = APIRouter(prefix="/api/command")
 
-def verify_device(x_device_id: str = Header(...), x_device_secret: str = Header(...)):
-    expected = db.reference(f"/devices/{x_device_id}/secret").get()
-    if expected != x_device_secret:
-        raise HTTPException(401, "Unauthorized")
-    return x_device_id
+# Per-device token bucket for command polling, checked before device credentials
+limit_command_poll = device_rate_limit("command_poll", rate=1.0, burst=10)
 
-@router.get("/{device_id}")
-async def get_command(device_id: str, verified_id: str = Depends(verify_device)):
+@router.get("/{device_id}", dependencies=[Depends(limit_command_poll)])
+async def get_command(device_id: str, req: Request, verified_id: str = Depends(verify_device)):
     if device_id != verified_id:
         raise HTTPException(403, "Forbidden")
     cmd = db.reference(f"/commands/{device_id}").get()
-    return cmd or {"action": None, "pattern": []}
+    return negotiated_response(req, cmd or {"action": None, "pattern": []})
 
 @router.post("/")
 async def post_command(payload: dict, device_id: str = Depends(verify_device)):
@@ -0,0 +1,185 @@
+# api/dedup.py
+"""Replay detection for device uploads that carry a sequence number.
+
+Devices retry uploads on timeouts. A sample may include `seq`, a per-device
+counter that increases by one for each sample, together with `boot`, an ID
+the device picks anew whenever the counter restarts (e.g. a random value or
+a boot count kept in flash). An upload whose (boot, seq) was already
+ingested is answered with the original record key and is not written again.
+A `seq` without a `boot` is stored but never treated as a replay: after a
+reboot the counter starts over, and without the boot ID new readings could
+not be told apart from retries.
+
+Three layers, all keyed by (device_id, boot, seq):
+
+- an in-memory window (`INGEST_DEDUP_CACHE_TTL` seconds) of recently written
+  pairs and their keys, so a replay reaching the same instance needs no RTDB
+  read;
+- `/device_seq/{device_id}/last` (`{"boots", "seqs", "keys", "updated_at"}`):
+  the samples of the device's last write. It is part of the same multi-path
+  update as the records, so it can never claim a record that wasn't stored,
+  and a retry of the last upload is recognised by any instance right away;
+- `/device_seq/{device_id}/window` (`{"boot", "hwm", "seen", "updated_at"}`):
+  the highest seq stored for the current boot and a bitmap of which of the
+  `INGEST_DEDUP_WINDOW` seqs up to it were stored (`seen`, hex; bit i is seq
+  hwm - i). It is merged in a transaction after the records are written
+  (see `apply_derived` in api/ingest.py), so an upload that arrives out of
+  order never lowers the mark and a failed upload that is retried is not
+  taken for a replay. A new boot ID starts a new window.
+
+A seq inside the window is a replay only if its bit is set; it is then
+reported without its key unless that is still known.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from firebase_admin import db
+
+from .cache import TTLCache
+
+INGEST_DEDUP_WINDOW = int(os.environ.get("INGEST_DEDUP_WINDOW", "1024"))
+INGEST_DEDUP_CACHE_SIZE = int(os.environ.get("INGEST_DEDUP_CACHE_SIZE", "100000"))
+INGEST_DEDUP_CACHE_TTL = float(os.environ.get("INGEST_DEDUP_CACHE_TTL", "300"))
+# Longest accepted `boot` ID
+MAX_BOOT_ID_LENGTH = 64
+
+# (boot, seq) identifying one sample of a device
+SampleId = Tuple[str, int]
+
+_recent = TTLCache("ingest_dedup", INGEST_DEDUP_CACHE_SIZE, INGEST_DEDUP_CACHE_TTL)
+
+
+def parse_seq(value: Any, where: str = "") -> Optional[int]:
+    """Validate an optional `seq` field (a non-negative integer)."""
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise HTTPException(400, f"Invalid seq{where}")
+    return value
+
+
+def parse_boot(value: Any, where: str = "") -> Optional[str]:
+    """Validate an optional `boot` field (a non-empty string or integer) and return it as a string."""
+    if value is None:
+        return None
+    if not isinstance(value, (str, int)) or isinstance(value, bool) or not 0 < len(str(value)) <= MAX_BOOT_ID_LENGTH:
+        raise HTTPException(400, f"Invalid boot{where}")
+    return str(value)
+
+
+def find_replays(device_id: str, ids: Iterable[SampleId]) -> Dict[SampleId, Optional[str]]:
+    """Map each already-ingested (boot, seq) to its original key (None if the key is no longer known)."""
+    replays: Dict[SampleId, Optional[str]] = {}
+    pending = []
+    for sample_id in set(ids):
+        key = _recent.get((device_id, *sample_id))
+        if key is not None:
+            replays[sample_id] = key
+        else:
+            pending.append(sample_id)
+    if not pending:
+        return replays
+
+    state = db.reference(f"/device_seq/{device_id}").get()
+    if not isinstance(state, dict):
+        return replays
+    last = state.get("last") if isinstance(state.get("last"), dict) else {}
+    last_write = dict(zip(zip(last.get("boots") or [], last.get("seqs") or []), last.get("keys") or []))
+    window = state.get("window") if isinstance(state.get("window"), dict) else {}
+    for sample_id in pending:
+        if sample_id in last_write:
+            replays[sample_id] = last_write[sample_id]
+            _recent.set((device_id, *sample_id), last_write[sample_id])
+        elif _window_has(window, *sample_id):
+            replays[sample_id] = None
+    return replays
+
+
+def _parse_window(window: Any, boot: str) -> Tuple[Optional[int], int]:
+    if not isinstance(window, dict) or window.get("boot") != boot or not isinstance(window.get("hwm"), int):
+        return None, 0
+    try:
+        return window["hwm"], int(window.get("seen") or "0", 16)
+    except (TypeError, ValueError):
+        return window["hwm"], 0
+
+
+def _window_has(window: Dict[str, Any], boot: str, seq: int) -> bool:
+    hwm, seen = _parse_window(window, boot)
+    if hwm is None or not 0 <= hwm - seq < INGEST_DEDUP_WINDOW:
+        return False
+    return bool(seen >> (hwm - seq) & 1)
+
+
+def merge_window(window: Any, boot: str, seqs: Iterable[int], now_ms: int) -> Dict[str, Any]:
+    """Return `window` with `seqs` of `boot` marked as stored.
+
+    The high-water mark only moves up; a window kept for a different boot
+    is replaced by a new one.
+    """
+    seqs = list(seqs)
+    hwm, seen = _parse_window(window, boot)
+    top = max(seqs)
+    if hwm is None:
+        hwm, seen = top, 0
+    elif top > hwm:
+        seen <<= top - hwm
+        hwm = top
+    for seq in seqs:
+        if 0 <= hwm - seq < INGEST_DEDUP_WINDOW:
+            seen |= 1 << (hwm - seq)
+    seen &= (1 << INGEST_DEDUP_WINDOW) - 1
+    return {"boot": boot, "hwm": hwm, "seen": format(seen, "x"), "updated_at": now_ms}
+
+
+def remember_uploads(device_id: str, stored: Iterable[Tuple[SampleId, str]]) -> None:
+    """Record ((boot, seq), key) pairs accepted by this instance."""
+    for sample_id, key in stored:
+        _recent.set((device_id, *sample_id), key)
+
+
+def sample_id(record: Dict[str, Any]) -> Optional[SampleId]:
+    """(boot, seq) of a stored record, or None unless it carries both."""
+    boot, seq = record.get("boot"), record.get("seq")
+    if isinstance(boot, str) and isinstance(seq, int) and not isinstance(seq, bool):
+        return boot, seq
+    return None
+
+
+def _ids_by_device(entries: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, List[Tuple[SampleId, str]]]:
+    by_device: Dict[str, List[Tuple[SampleId, str]]] = {}
+    for key, record in entries:
+        ids = sample_id(record)
+        if ids is not None and record.get("device_id"):
+            by_device.setdefault(record["device_id"], []).append((ids, key))
+    return by_device
+
+
+def seq_state_updates(entries: Iterable[Tuple[str, Dict[str, Any]]], now_ms: int) -> Dict[str, Any]:
+    """Multi-path update entries for `/device_seq/{id}/last` covering records that carry a boot and seq."""
+    updates: Dict[str, Any] = {}
+    for device_id, stored in _ids_by_device(entries).items():
+        updates[f"device_seq/{device_id}/last"] = {
+            "boots": [boot for (boot, _), _ in stored],
+            "seqs": [seq for (_, seq), _ in stored],
+            "keys": [key for _, key in stored],
+            "updated_at": now_ms,
+        }
+    return updates
+
+
+def apply_seq_windows(entries: Iterable[Tuple[str, Dict[str, Any]]], now_ms: int) -> None:
+    """Mark stored seqs in each device's `/device_seq/{id}/window`, one transaction per device."""
+    for device_id, stored in _ids_by_device(entries).items():
+        # Boots ordered by last appearance, so a device that rebooted mid-batch ends on its new one
+        by_boot: Dict[str, List[int]] = {}
+        for (boot, seq), _ in stored:
+            by_boot[boot] = by_boot.pop(boot, []) + [seq]
+
+        def merge(current, groups=list(by_boot.items())):
+            for boot, seqs in groups:
+                current = merge_window(current, boot, seqs, now_ms)
+            return current
+
+        db.reference(f"/device_seq/{device_id}/window").transaction(merge)
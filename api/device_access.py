@@ -0,0 +1,236 @@
+# api/device_access.py
+"""Cached device access policy: who may read from or act on a device.
+
+A device is accessible to every user under `/device_users/{device_id}` plus the
+legacy single owner stored at `/devices/{device_id}/user_id`. Both are loaded
+together and cached per device, so authorization checks cost no RTDB reads
+while the entry is warm. Handlers that change membership start from
+`load_device_access(device_id, fresh=True)` (the device node and membership,
+never a cached copy, since a stale legacy owner would be migrated back in),
+apply their change with `change_device_members` (a transaction on
+`/device_users/{device_id}`, so concurrent shares and removals never
+overwrite each other) and store the result with `remember_device_access` (or
+call `invalidate_device_access`).
+
+Each user's devices are also indexed under `/user_devices/{uid}/{device_id}`
+({registered_at, added_by, is_legacy}) so a user's device list is one small
+read. An entry describes only that user's own membership, so membership
+changes write just the entries of the users they add or remove, right after
+their transaction (`reindex_device` repairs a device whose index write
+failed). How many users share a device is not stored in the index, where
+concurrent changes could leave it stale; device lists take it from the
+cached access policy (`DeviceAccess.user_count`). `user_device_entries`
+builds the entries; `scripts/rebuild_user_devices.py` rebuilds it from
+scratch and then marks `/migrations/user_devices` complete. Until that
+marker is set the index may be missing devices, so device lists are built
+from a scan of `/devices` and `/device_users` instead (see
+`read_user_devices`).
+"""
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from firebase_admin import db
+
+from .cache import MISSING, TTLCache
+from .device_auth import remember_device_secret
+from .etags import forget_scope
+
+DEVICE_ACCESS_CACHE_TTL = float(os.environ.get("DEVICE_ACCESS_CACHE_TTL", "60"))
+DEVICE_ACCESS_CACHE_SIZE = int(os.environ.get("DEVICE_ACCESS_CACHE_SIZE", "10000"))
+# How long the /user_devices migration marker is cached
+USER_DEVICES_MIGRATION_CACHE_TTL = float(os.environ.get("USER_DEVICES_MIGRATION_CACHE_TTL", "300"))
+
+USER_DEVICES_ROOT = "user_devices"
+USER_DEVICES_MIGRATION = "migrations/user_devices"
+
+_access = TTLCache(
+    "device_access",
+    maxsize=DEVICE_ACCESS_CACHE_SIZE,
+    ttl=DEVICE_ACCESS_CACHE_TTL,
+)
+_index_migration = TTLCache("user_devices_migration", maxsize=1, ttl=USER_DEVICES_MIGRATION_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class DeviceAccess:
+    device_id: str
+    exists: bool
+    owner: Optional[str] = None
+    registered_at: Optional[int] = None
+    members: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def allows(self, uid: Optional[str]) -> bool:
+        """True if the user is a member or the legacy owner of the device."""
+        return bool(uid) and (uid in self.members or uid == self.owner)
+
+    @property
+    def user_count(self) -> int:
+        """Number of users bound to the device, counting the legacy owner once."""
+        return len(self.members) + (1 if self.owner else 0)
+
+    @property
+    def users(self) -> Set[str]:
+        """Every user bound to the device (members plus the legacy owner)."""
+        return set(self.members) | ({self.owner} if self.owner else set())
+
+
+Members = Dict[str, Dict[str, Any]]
+
+
+def _as_members(members: Any) -> Members:
+    if not isinstance(members, dict):
+        return {}
+    return {uid: (data if isinstance(data, dict) else {}) for uid, data in members.items()}
+
+
+def _read_members(device_id: str) -> Members:
+    return _as_members(db.reference(f"/device_users/{device_id}").get())
+
+
+def load_device_access(device_id: str, fresh: bool = False) -> DeviceAccess:
+    """Return the (possibly cached) access policy for a device.
+
+    `fresh=True` re-reads the device node and membership; handlers that
+    change membership compute their update from that.
+    """
+    cached = MISSING if fresh else _access.get(device_id, MISSING)
+    if cached is not MISSING:
+        return cached
+
+    device_info = db.reference(f"/devices/{device_id}").get()
+    if not isinstance(device_info, dict):
+        access = DeviceAccess(device_id=device_id, exists=False)
+    else:
+        # The device node carries the secret too; keep the credential cache warm
+        remember_device_secret(device_id, device_info.get("secret"))
+        access = DeviceAccess(
+            device_id=device_id,
+            exists=True,
+            owner=device_info.get("user_id"),
+            registered_at=device_info.get("registered_at"),
+            members=_read_members(device_id),
+        )
+    _access.set(device_id, access)
+    return access
+
+
+def user_can_access_device(device_id: str, uid: Optional[str]) -> bool:
+    return load_device_access(device_id).allows(uid)
+
+
+def invalidate_device_access(device_id: str) -> None:
+    """Forget the cached policy after the device or its membership changes."""
+    _access.invalidate(device_id)
+    # Device lists show membership counts, so any user's list may have changed
+    forget_scope("devices")
+
+
+def remember_device_access(access: DeviceAccess) -> None:
+    """Cache the policy a handler just wrote, so its next change stays one read."""
+    _access.set(access.device_id, access)
+    forget_scope("devices")
+
+
+def change_device_members(access: DeviceAccess, change: Callable[[Members], Members]) -> DeviceAccess:
+    """Apply `change` to the device's membership in a transaction; returns the committed policy.
+
+    `change` gets the members as stored when the write is attempted and
+    returns the new ones. If another writer changed them first, RTDB runs it
+    again on their result, so two concurrent changes both take effect.
+    """
+    members = db.reference(f"/device_users/{access.device_id}").transaction(
+        lambda current: change(_as_members(current)) or None
+    )
+    return replace(access, members=_as_members(members))
+
+
+def user_device_path(uid: str, device_id: str) -> str:
+    return f"{USER_DEVICES_ROOT}/{uid}/{device_id}"
+
+
+def user_device_entries(
+    device_id: str,
+    members: Dict[str, Dict[str, Any]],
+    owner: Optional[str] = None,
+    registered_at: Optional[int] = None,
+    removed: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """Multi-path update entries for the device in the given users' /user_devices index.
+
+    `members`, `owner` and `registered_at` describe (some of) the device's
+    users after the change; users in `removed` lose their entry.
+    """
+    updates: Dict[str, Any] = {user_device_path(uid, device_id): None for uid in removed}
+    for uid, data in members.items():
+        updates[user_device_path(uid, device_id)] = {
+            "registered_at": data.get("registered_at"),
+            "added_by": data.get("added_by"),
+            "is_legacy": False,
+        }
+    if owner and owner not in members:
+        updates[user_device_path(owner, device_id)] = {
+            "registered_at": registered_at,
+            "is_legacy": True,
+        }
+    return updates
+
+
+def reindex_device(device_id: str, removed: Iterable[str] = ()) -> None:
+    """Rewrite a device's /user_devices entries from current RTDB data."""
+    access = load_device_access(device_id, fresh=True)
+    updates = user_device_entries(device_id, access.members, access.owner, access.registered_at, removed)
+    if updates:
+        db.reference("/").update(updates)
+    invalidate_device_access(device_id)
+
+
+def build_user_devices_index(devices: Dict[str, Any], device_users: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """The whole /user_devices tree ({uid: {device_id: entry}}) for the given devices."""
+    index: Dict[str, Dict[str, Any]] = {}
+    for device_id, device in devices.items():
+        if not isinstance(device, dict):
+            continue
+        members = {
+            uid: (data if isinstance(data, dict) else {})
+            for uid, data in (device_users.get(device_id) or {}).items()
+        }
+        entries = user_device_entries(device_id, members, device.get("user_id"), device.get("registered_at"))
+        for path, entry in entries.items():
+            _, uid, _ = path.split("/")
+            index.setdefault(uid, {})[device_id] = entry
+    return index
+
+
+def user_devices_index_complete() -> bool:
+    """Whether /user_devices covers every device (the rebuild script has run)."""
+    complete = _index_migration.get(USER_DEVICES_MIGRATION, MISSING)
+    if complete is MISSING:
+        marker = db.reference(f"/{USER_DEVICES_MIGRATION}").get()
+        complete = isinstance(marker, dict) and bool(marker.get("complete"))
+        _index_migration.set(USER_DEVICES_MIGRATION, complete)
+    return complete
+
+
+def read_user_devices(uid: str) -> Dict[str, Dict[str, Any]]:
+    """A user's /user_devices entries keyed by device ID.
+
+    Reads the index once it is complete; before that, scans /devices and
+    /device_users as the device list did before the index existed, caching
+    the access policy of the user's devices on the way.
+    """
+    if user_devices_index_complete():
+        return db.reference(f"/{USER_DEVICES_ROOT}/{uid}").get() or {}
+    devices = db.reference("/devices").get() or {}
+    device_users = db.reference("/device_users").get() or {}
+    entries = build_user_devices_index(devices, device_users).get(uid, {})
+    for device_id in entries:
+        device = devices[device_id]
+        _access.set(device_id, DeviceAccess(
+            device_id=device_id,
+            exists=True,
+            owner=device.get("user_id"),
+            registered_at=device.get("registered_at"),
+            members=_as_members(device_users.get(device_id)),
+        ))
+    return entries
@@ -0,0 +1,106 @@
+# api/device_auth.py
+"""Device credential verification shared by the device-facing routers.
+
+Secrets are read from `/devices/{id}/secret` and kept in a bounded TTL cache so
+steady device traffic does not hit RTDB on every request. A request whose
+secret does not match the cached value is re-checked against RTDB before it is
+rejected, so a freshly (re)provisioned secret works immediately; an old secret
+stops working once its cache entry expires or is invalidated. A device is
+re-checked at most once per DEVICE_CREDENTIAL_RECHECK_SECONDS, so a device (or
+anyone else) retrying a wrong secret, or an unknown device ID, is rejected
+from the cache instead of costing an RTDB read per request.
+
+Channels where the secret should not travel with every message (MQTT) send an
+HMAC-SHA256 keyed with it instead; see `check_device_signature`.
+"""
+import hashlib
+import hmac
+import os
+from typing import Any, Callable
+
+from fastapi import Header, HTTPException
+from firebase_admin import db
+
+from .cache import MISSING, TTLCache
+
+DEVICE_CREDENTIAL_CACHE_TTL = float(os.environ.get("DEVICE_CREDENTIAL_CACHE_TTL", "300"))
+DEVICE_CREDENTIAL_CACHE_SIZE = int(os.environ.get("DEVICE_CREDENTIAL_CACHE_SIZE", "10000"))
+DEVICE_CREDENTIAL_RECHECK_SECONDS = float(os.environ.get("DEVICE_CREDENTIAL_RECHECK_SECONDS", "10"))
+
+_credentials = TTLCache(
+    "device_credentials",
+    maxsize=DEVICE_CREDENTIAL_CACHE_SIZE,
+    ttl=DEVICE_CREDENTIAL_CACHE_TTL,
+)
+# Devices whose secret was read from RTDB after a failed check, recently
+_rechecked = TTLCache(
+    "device_credential_rechecks",
+    maxsize=DEVICE_CREDENTIAL_CACHE_SIZE,
+    ttl=DEVICE_CREDENTIAL_RECHECK_SECONDS,
+)
+
+
+def _load_device_secret(device_id: str):
+    secret = db.reference(f"/devices/{device_id}/secret").get()
+    _credentials.set(device_id, secret)
+    return secret
+
+
+def get_device_secret(device_id: str):
+    """Return the provisioned secret for a device (None if the device is unknown)."""
+    secret = _credentials.get(device_id, MISSING)
+    if secret is MISSING:
+        return _load_device_secret(device_id)
+    return secret
+
+
+def remember_device_secret(device_id: str, secret) -> None:
+    """Seed the cache with a secret read as part of a larger device lookup."""
+    _credentials.set(device_id, secret)
+
+
+def _check_credentials(device_id: str, matches: Callable[[Any], bool]) -> bool:
+    cached = _credentials.get(device_id, MISSING)
+    if cached is not MISSING:
+        if matches(cached):
+            return True
+        if _rechecked.contains(device_id):
+            return False
+        # The cached secret may predate a reprovision; confirm before rejecting
+    if matches(_load_device_secret(device_id)):
+        return True
+    _rechecked.set(device_id, True)
+    return False
+
+
+def check_device_secret(device_id: str, secret) -> bool:
+    """Compare a presented secret with the provisioned one."""
+    return _check_credentials(device_id, lambda expected: expected == secret)
+
+
+def device_signature(secret: str, message: bytes) -> str:
+    """Hex HMAC-SHA256 of `message` keyed with a device secret."""
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def _signature_matches(secret, message: bytes, signature: str) -> bool:
+    if not isinstance(secret, str) or not secret:
+        return False
+    return hmac.compare_digest(device_signature(secret, message).encode(), signature.encode("utf-8"))
+
+
+def check_device_signature(device_id: str, message: bytes, signature: str) -> bool:
+    """Check a `device_signature` of `message` against the provisioned secret."""
+    return _check_credentials(device_id, lambda secret: _signature_matches(secret, message, signature))
+
+
+def invalidate_device_credentials(device_id: str) -> None:
+    """Forget the cached secret, e.g. after a device is deleted or reprovisioned."""
+    _credentials.invalidate(device_id)
+    _rechecked.invalidate(device_id)
+
+
+def verify_device(x_device_id: str = Header(...), x_device_secret: str = Header(...)):
+    if not check_device_secret(x_device_id, x_device_secret):
+        raise HTTPException(401, "Unauthorized")
+    return x_device_id
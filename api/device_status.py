@@ -0,0 +1,91 @@
+# api/device_status.py
+"""Per-device last-seen index maintained at ingest time.
+
+`/device_status/{device_id}` holds:
+
+    {"last_ts": ms, "last_user": uid, "day": "YYYY-MM-DD", "samples_today": n}
+
+`day` is the UTC day `samples_today` counts. `last_ts` and `last_user` are
+plain entries in the same multi-path update as the records
+(`status_updates`), so they cost no extra round trip. Only the daily counter
+needs a transaction, so it rolls over correctly and concurrent writers don't
+lose increments; ingest applies it after each write (or on the derived-data
+queue, see api/ingest_queue.py). The transaction also moves
+`last_ts` forward again if a late write of older samples set it back. Admin
+views read the whole index in a single query instead of scanning `/records`
+per device.
+"""
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from firebase_admin import db
+
+from .record_store import partition_for
+
+
+def status_deltas(records: Iterable[Dict[str, Any]], today: str) -> Dict[str, Dict[str, Any]]:
+    """Fold records into {device_id: {"last_ts", "last_user", "samples_today"}}."""
+    deltas: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        device_id = record.get("device_id")
+        ts = record.get("ts")
+        if not device_id or not isinstance(ts, (int, float)):
+            continue
+        delta = deltas.setdefault(device_id, {"last_ts": None, "last_user": None, "samples_today": 0})
+        if delta["last_ts"] is None or ts > delta["last_ts"]:
+            delta["last_ts"] = ts
+            delta["last_user"] = record.get("userId")
+        if partition_for(int(ts)) == today:
+            delta["samples_today"] += 1
+    return deltas
+
+
+def merge_status(current: Optional[Dict[str, Any]], delta: Dict[str, Any], today: str) -> Dict[str, Any]:
+    """Apply a delta to a stored status, resetting the counter on a new day."""
+    current = current if isinstance(current, dict) else {}
+    merged = dict(current)
+    if current.get("last_ts") is None or delta["last_ts"] > current["last_ts"]:
+        merged["last_ts"] = delta["last_ts"]
+        merged["last_user"] = delta["last_user"]
+    if current.get("day") == today:
+        merged["samples_today"] = (current.get("samples_today") or 0) + delta["samples_today"]
+    elif delta["samples_today"]:
+        merged["day"] = today
+        merged["samples_today"] = delta["samples_today"]
+    return merged
+
+
+def status_updates(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Multi-path update entries for the last-seen fields of the devices in `records`."""
+    updates: Dict[str, Any] = {}
+    for device_id, delta in status_deltas(records, "").items():
+        updates[f"device_status/{device_id}/last_ts"] = delta["last_ts"]
+        updates[f"device_status/{device_id}/last_user"] = delta["last_user"]
+    return updates
+
+
+def apply_device_status(records: Iterable[Dict[str, Any]], now_ms: Optional[int] = None) -> int:
+    """Count `records` into `/device_status`; one transaction per device."""
+    today = partition_for(now_ms if now_ms is not None else int(time.time() * 1000))
+    deltas = status_deltas(records, today)
+    for device_id, delta in deltas.items():
+        db.reference(f"/device_status/{device_id}").transaction(
+            lambda current, delta=delta: merge_status(current, delta, today)
+        )
+    return len(deltas)
+
+
+def load_device_statuses() -> Dict[str, Dict[str, Any]]:
+    """Read the whole index in one query."""
+    return db.reference("/device_status").get() or {}
+
+
+def describe_status(status: Optional[Dict[str, Any]], now_ms: Optional[int] = None) -> Dict[str, Any]:
+    """Admin-facing fields for a stored status (counter is 0 if it is from an earlier day)."""
+    status = status if isinstance(status, dict) else {}
+    today = partition_for(now_ms if now_ms is not None else int(time.time() * 1000))
+    return {
+        "lastActive": status.get("last_ts"),
+        "lastUserId": status.get("last_user"),
+        "samplesToday": status.get("samples_today", 0) if status.get("day") == today else 0,
+    }
@@ -0,0 +1,78 @@
+# api/downsample.py
+"""Largest-Triangle-Three-Buckets downsampling for long chart windows.
+
+LTTB keeps the first and last points and, for each of `n_out - 2` equal-count
+buckets in between, the point forming the largest triangle with the point
+kept from the previous bucket and the mean of the next bucket. Peaks and dips
+survive, which bucket means would flatten.
+
+The bucket-to-bucket dependency is inherently sequential, so the loop runs
+once per output point while all per-candidate work (areas, argmax, next-bucket
+means) is done with NumPy over the bucket's slice; the cost stays O(n) with
+only ~n_out Python iterations.
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .aggregate import record_columns
+from .rollups import METRICS
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the `n_out` points LTTB keeps from (x, y), which must be sorted by x."""
+    if n_out < 3:
+        raise ValueError("LTTB needs at least 3 output points")
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Bucket boundaries over the interior points [1, n - 1)
+    edges = (1 + np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64)
+    edges[-1] = n - 1
+    # Mean of every bucket, with the last point standing in for the one after the final bucket
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        areas = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_records(records: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """At most `max_points` records chosen by LTTB, oldest first.
+
+    Each metric gets an equal share of the budget and its own LTTB pass over
+    the records that have it; the union of the chosen rows is returned, so
+    both the heart_rate and the spo2 curve keep their shape. A budget too
+    small to give every metric LTTB's 3 points goes to the first metric
+    present. Raises ValueError if `max_points` is below 3.
+    """
+    if max_points < 3:
+        raise ValueError("max_points must be at least 3")
+    rows = sorted(
+        (r for r in records if isinstance(r.get("ts"), (int, float))),
+        key=lambda r: (r["ts"], r.get("id", "")),
+    )
+    if len(rows) <= max_points:
+        return rows
+    ts, columns = record_columns(rows)
+    valid = {metric: np.flatnonzero(~np.isnan(columns[metric])) for metric in METRICS}
+    metrics = [metric for metric in METRICS if len(valid[metric])]
+    share = max_points // max(len(metrics), 1)
+    if share < 3:
+        metrics, share = metrics[:1], max_points
+    keep = np.zeros(len(rows), dtype=bool)
+    for metric in metrics:
+        index = valid[metric]
+        keep[index[lttb_indices(ts[index], columns[metric][index], share)]] = True
+    return [rows[i] for i in np.flatnonzero(keep)]
@@ -0,0 +1,87 @@
+# api/etags.py
+"""Conditional GET support for polled read endpoints.
+
+Each endpoint derives a weak ETag from a cheap validator:
+
+* records: the newest push-ID key under `/user_records/{uid}` (keys only grow,
+  so a new record always changes it), read with a single `limit_to_last(1)`
+  query, plus the request parameters
+* profile: the profile's `updated_at`
+* devices: a hash of the device list itself
+
+Validators are cached per user for ETAG_VALIDATOR_TTL seconds, so a poll
+whose `If-None-Match` still matches gets 304 without touching RTDB or
+serializing a body. Responses are marked `private, no-cache`, so browsers
+revalidate cached bodies with `If-None-Match` on their own. Writes handled by
+this instance drop the affected entries right away; writes on other instances
+are picked up once the entry expires.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Hashable, Optional
+
+from fastapi import Response
+
+from .cache import MISSING, TTLCache
+
+ETAG_VALIDATOR_TTL = float(os.environ.get("ETAG_VALIDATOR_TTL", "10"))
+ETAG_VALIDATOR_CACHE_SIZE = int(os.environ.get("ETAG_VALIDATOR_CACHE_SIZE", "10000"))
+
+_validators = TTLCache(
+    "etag_validators",
+    maxsize=ETAG_VALIDATOR_CACHE_SIZE,
+    ttl=ETAG_VALIDATOR_TTL,
+)
+# Bumped to drop every cached validator of a scope at once
+_generations: Dict[str, int] = {}
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+# Let browsers keep the body but revalidate on every request
+_CACHE_CONTROL = "private, no-cache"
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = _CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": _CACHE_CONTROL})
+
+
+def _key(scope: str, uid: str) -> Hashable:
+    return (scope, _generations.get(scope, 0), uid)
+
+
+def cached_validator(scope: str, uid: str) -> Any:
+    """Return the cached validator, or MISSING."""
+    return _validators.get(_key(scope, uid), MISSING)
+
+
+def remember_validator(scope: str, uid: str, value: Any) -> None:
+    _validators.set(_key(scope, uid), value)
+
+
+def forget_validator(scope: str, uid: str) -> None:
+    _validators.invalidate(_key(scope, uid))
+
+
+def forget_scope(scope: str) -> None:
+    """Drop the cached validators of every user in `scope`."""
+    _generations[scope] = _generations.get(scope, 0) + 1
@@ -0,0 +1,96 @@
+# api/export.py
+"""Chunked export of a user's full record history (NDJSON or CSV).
+
+Records are read from `/user_records/{uid}` in key order, EXPORT_PAGE_SIZE at
+a time (see `iter_user_record_pages`), and encoded page by page, so memory
+stays constant however long the history is. Keys are push IDs, so this is
+ingest order: chronological, except that batched or queued samples land
+where they were stored rather than at their `ts`.
+
+`start` also bounds the key range: a sample is never stored before it was
+taken, so records with ts >= start all have keys from
+push_id_floor(start - SINCE_OVERLAP_MS) on. `end` can only filter, since
+late samples may be stored at any time afterwards.
+
+With archiving enabled, records already moved to cold storage are read
+from their day partitions before the live ones.
+"""
+import csv
+import io
+import json
+import os
+from typing import Any, Dict, Iterator, Optional
+
+from .archive import archive_index, archive_store, is_archived, iter_archived_records
+from .push_ids import push_id_floor
+from .record_store import SINCE_OVERLAP_MS, iter_user_record_pages
+
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_CSV_FIELDS = ("id", "ts", "device_id", "heart_rate", "spo2")
+
+Record = Dict[str, Any]
+
+
+def iter_export_records(
+    uid: str,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    page_size: int = EXPORT_PAGE_SIZE,
+) -> Iterator[Record]:
+    """Yield the user's records with start <= ts <= end, one page in memory at a time.
+
+    Archived records (api/archive.py) come first, a day partition at a time,
+    then the live ones; rows left live by an interrupted archive run are
+    skipped, since the archive already has them.
+    """
+    index = {}
+    if archive_store() is not None:
+        index = archive_index(uid)
+        yield from iter_archived_records(uid, start, end)
+    after_key = push_id_floor(max(0, start - SINCE_OVERLAP_MS)) if start is not None else None
+    for page in iter_user_record_pages(uid, page_size, after_key):
+        for key, record in page:
+            if index and is_archived(key, record, index):
+                continue
+            ts = record.get("ts")
+            if start is not None and (not isinstance(ts, (int, float)) or ts < start):
+                continue
+            if end is not None and (not isinstance(ts, (int, float)) or ts > end):
+                continue
+            yield {"id": key, **record}
+
+
+def _csv_row(record: Record) -> list:
+    heart_rate = record.get("heart_rate")
+    if heart_rate is None:
+        heart_rate = record.get("hr", record.get("bpm"))
+    return [record.get("id"), record.get("ts"), record.get("device_id"), heart_rate, record.get("spo2")]
+
+
+def encode_export(records: Iterator[Record], fmt: str, chunk_size: int = EXPORT_PAGE_SIZE) -> Iterator[str]:
+    """Encode records as NDJSON lines or CSV rows, yielding text in chunks of up to `chunk_size` records."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n") if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_CSV_FIELDS)
+    pending = 0
+    for record in records:
+        if writer:
+            writer.writerow(_csv_row(record))
+        else:
+            buffer.write(json.dumps(record, separators=(",", ":")))
+            buffer.write("\n")
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,215 @@
+# api/ingest.py
+"""Shared helpers for turning device samples into RTDB writes.
+
+Used by the single-sample and batched ingest endpoints, the MQTT vitals
+channel and the write-behind queue so they all resolve the record owner and
+lay out the fan-out paths the same way.
+"""
+import logging
+import math
+import time
+
+from fastapi import HTTPException
+from firebase_admin import db
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .dedup import apply_seq_windows, find_replays, parse_boot, parse_seq, remember_uploads, sample_id, seq_state_updates
+from .device_access import load_device_access
+from .device_status import apply_device_status, status_updates
+from .etags import forget_validator
+from .pubsub import publish_records
+from .recent_records import remember_recent
+from .push_ids import generate_push_id
+from .record_store import v2_fanout_updates
+from .rollups import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on samples accepted in one batch (POST /api/records/batch or MQTT)
+MAX_BATCH_SAMPLES = 500
+
+
+def resolve_record_user(device_id: str, x_user_id: Optional[str]) -> str:
+    """Return the user a device sample belongs to, or raise if not allowed."""
+    access = load_device_access(device_id)
+
+    # If X-User-Id is provided, validate against multi-user mapping (or legacy owner)
+    if x_user_id:
+        if not access.allows(x_user_id):
+            raise HTTPException(401, "User not allowed for this device")
+        return x_user_id
+
+    # Backward-compat: fall back to legacy single user binding
+    if not access.owner:
+        raise HTTPException(409, "Device is not yet registered to any user")
+    return access.owner
+
+
+def parse_vitals(spo2: Any, heart_rate: Any, where: str = "") -> Tuple[Any, Any]:
+    """Validate the spo2/heart_rate fields of a sample; both must be finite numbers.
+
+    Anything else (objects, strings, NaN) is refused here rather than handed
+    to a multi-path update RTDB may reject, which would fail the whole batch.
+    """
+    if spo2 is None or heart_rate is None:
+        raise HTTPException(400, f"Missing spo2 or heart_rate{where}")
+    for value in (spo2, heart_rate):
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+            raise HTTPException(400, f"Invalid spo2 or heart_rate{where}")
+    return spo2, heart_rate
+
+
+Sample = Tuple[Any, Any, int, Optional[int], Optional[str]]
+
+
+def parse_sample(sample: Any, index: int, received_at: int) -> Sample:
+    """Validate one buffered sample and return (spo2, heart_rate, ts, seq, boot).
+
+    `ts_offset` is the sample age relative to `received_at` in ms (0 or negative).
+    `seq` and `boot` are the optional device sequence number and boot ID used
+    for replay detection.
+    """
+    if not isinstance(sample, dict):
+        raise HTTPException(400, f"Sample {index} is not an object")
+    spo2, heart_rate = parse_vitals(sample.get("spo2"), sample.get("heart_rate", sample.get("hr")), f" in sample {index}")
+    ts_offset = sample.get("ts_offset", 0)
+    if not isinstance(ts_offset, (int, float)) or isinstance(ts_offset, bool) or ts_offset > 0:
+        raise HTTPException(400, f"Invalid ts_offset in sample {index}")
+    seq = parse_seq(sample.get("seq"), f" in sample {index}")
+    boot = parse_boot(sample.get("boot"), f" in sample {index}")
+    return spo2, heart_rate, received_at + int(ts_offset), seq, boot
+
+
+def compose_record(
+    device_id: str,
+    user_id: str,
+    spo2: Any,
+    heart_rate: Any,
+    ts: int,
+    seq: Optional[int] = None,
+    boot: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build the record stored under /records, /user_records and /user_records_v2."""
+    record = {
+        "userId": user_id,
+        "device_id": device_id,
+        "spo2": spo2,
+        "heart_rate": heart_rate,
+        "ts": ts,
+    }
+    if seq is not None:
+        record["seq"] = seq
+    if boot is not None:
+        record["boot"] = boot
+    return record
+
+
+def compose_entries(
+    device_id: str, user_id: str, samples: List[Sample]
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[Optional[str]]]:
+    """Turn parsed samples into (key, record) entries to write plus one key per sample.
+
+    Samples whose (boot, seq) was already ingested, or repeats one earlier in
+    the same upload, reuse the original key (None if no longer known) and are
+    not written.
+    """
+    ids = [(boot, seq) for *_, seq, boot in samples if seq is not None and boot is not None]
+    replays = find_replays(device_id, ids) if ids else {}
+    entries: List[Tuple[str, Dict[str, Any]]] = []
+    keys: List[Optional[str]] = []
+    fresh: Dict[Tuple[str, int], str] = {}
+    for spo2, heart_rate, ts, seq, boot in samples:
+        identity = (boot, seq) if seq is not None and boot is not None else None
+        if identity is not None and identity in replays:
+            keys.append(replays[identity])
+            continue
+        if identity is not None and identity in fresh:
+            keys.append(fresh[identity])
+            continue
+        key = generate_push_id()
+        entries.append((key, compose_record(device_id, user_id, spo2, heart_rate, ts, seq, boot)))
+        keys.append(key)
+        if identity is not None:
+            fresh[identity] = key
+    return entries, keys
+
+
+def remember_entries(device_id: str, entries: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+    """Add accepted entries that carry a boot and seq to the in-memory replay window."""
+    remember_uploads(device_id, [(sample_id(record), key) for key, record in entries if sample_id(record)])
+
+
+def record_fanout_updates(key: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Multi-path update entries writing a record to the global and per-user paths."""
+    return {
+        f"records/{key}": record,
+        f"user_records/{record['userId']}/{key}": record,
+        **v2_fanout_updates(key, record),
+    }
+
+
+def ingest_updates(entries: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """Coalesce (key, record) pairs into one multi-path update.
+
+    Records carrying a device `boot` and `seq` also set `/device_seq/{device_id}/last` in
+    the same update (see api/dedup.py), and each device's last-seen fields
+    are set (see api/device_status.py).
+    """
+    entries = list(entries)
+    updates: Dict[str, Any] = {}
+    for key, record in entries:
+        updates.update(record_fanout_updates(key, record))
+    updates.update(seq_state_updates(entries, int(time.time() * 1000)))
+    updates.update(status_updates(record for _, record in entries))
+    return updates
+
+
+def write_records(entries: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+    """Write (key, record) pairs to RTDB in a single atomic update, then update derived data.
+
+    Rollups, the device status counters and seq windows are then applied
+    (or, with DERIVED_WRITE_BEHIND, handed to the derived-data queue; see
+    api/ingest_queue.py); live streams are best-effort. The records are
+    already stored when these run, so a failure is logged rather than raised
+    (a retry would double-count them). `scripts/backfill_rollups.py` and
+    `scripts/rebuild_device_status.py` rebuild them from stored records;
+    streams re-sync from RTDB on their own.
+    """
+    # api.ingest_queue builds on this module, so it is imported here
+    from .ingest_queue import offer_derived
+
+    entries = list(entries)
+    updates = ingest_updates(entries)
+    if not updates:
+        return
+    db.reference("/").update(updates)
+    records = [record for _, record in entries]
+    for uid in {record.get("userId") for record in records}:
+        forget_validator("records", uid)
+    remember_recent(entries)
+    offer_derived(entries)
+    try:
+        publish_records(entries)
+    except Exception as e:
+        logger.error(f"Failed to publish {len(entries)} records to live streams: {e}")
+
+
+def apply_derived(entries: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """Fold stored records into their rollups, device status counters and seq windows.
+
+    Runs inline after a write or on the derived-data queue. Never raises: the
+    queue would retry the batch and count it twice.
+    """
+    records = [record for _, record in entries]
+    try:
+        apply_rollups(records)
+    except Exception as e:
+        logger.error(f"Failed to update rollups for {len(entries)} records: {e}")
+    try:
+        apply_device_status(records)
+    except Exception as e:
+        logger.error(f"Failed to update device status for {len(entries)} records: {e}")
+    try:
+        apply_seq_windows(entries, int(time.time() * 1000))
+    except Exception as e:
+        logger.error(f"Failed to update seq windows for {len(entries)} records: {e}")
@@ -0,0 +1,244 @@
+# api/ingest_queue.py
+"""Write-behind buffer for device samples.
+
+Ingest handlers that opt in (`Prefer: respond-async`) validate the request,
+hand the composed records to `ingest_queue` and answer 202 right away. A
+background thread coalesces queued records into large multi-path updates and
+flushes them when `INGEST_FLUSH_SIZE` records are waiting or the oldest record
+has waited `INGEST_FLUSH_INTERVAL` seconds. The buffer is bounded; callers get
+False from `offer` when it is full and should answer 429.
+
+A failed flush goes back to the front of the buffer and is retried. Once a
+batch has failed `INGEST_FLUSH_MAX_ATTEMPTS` times it is split in half on
+every further failure, so records RTDB accepts get through; a record that
+still fails on its own is dropped and counted in `dead_lettered_total`
+rather than blocking every device's writes.
+
+Records still in the buffer when the process dies are lost, so the queue is
+drained on application shutdown. Serverless deployments that freeze the
+process between requests should keep devices on the synchronous path.
+
+Derived-data maintenance (rollup, device status and seq-window
+transactions, see `apply_derived`) runs inline after each write by default:
+the Vercel deployment freezes or recycles the process between requests, so
+anything left in memory would be lost. Long-running deployments can set
+DERIVED_WRITE_BEHIND=true to hand it to `derived_queue` instead, a second
+instance whose flusher folds whatever has accumulated into one transaction
+per touched bucket or device. It never retries a batch, since a partially
+applied one would be counted twice; updates it drops (full buffer, RTDB
+errors, a frozen or recycled process) are rebuilt by
+`scripts/backfill_rollups.py` and `scripts/rebuild_device_status.py`, and a
+dropped seq window only weakens replay detection (see api/dedup.py).
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .ingest import apply_derived, write_records
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_MAX_RECORDS = int(os.environ.get("INGEST_QUEUE_MAX_RECORDS", "10000"))
+INGEST_FLUSH_SIZE = int(os.environ.get("INGEST_FLUSH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "1.0"))
+# Failed flushes of a batch before it is split (and a lone record dropped)
+INGEST_FLUSH_MAX_ATTEMPTS = int(os.environ.get("INGEST_FLUSH_MAX_ATTEMPTS", "5"))
+
+DERIVED_WRITE_BEHIND = os.environ.get("DERIVED_WRITE_BEHIND", "False").lower() in ("true", "1", "yes")
+DERIVED_QUEUE_MAX_RECORDS = int(os.environ.get("DERIVED_QUEUE_MAX_RECORDS", "50000"))
+DERIVED_FLUSH_SIZE = int(os.environ.get("DERIVED_FLUSH_SIZE", "2000"))
+DERIVED_FLUSH_INTERVAL = float(os.environ.get("DERIVED_FLUSH_INTERVAL", "2.0"))
+
+Entry = Tuple[str, Dict[str, Any]]
+# (queued at, entry, failed attempts, most records to flush it with)
+Queued = Tuple[float, Entry, int, int]
+
+
+class IngestQueue:
+    """Bounded in-process buffer with a background coalescing flusher."""
+
+    def __init__(
+        self,
+        max_records: int = INGEST_QUEUE_MAX_RECORDS,
+        flush_size: int = INGEST_FLUSH_SIZE,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+        writer: Callable[[List[Entry]], None] = write_records,
+        max_attempts: int = INGEST_FLUSH_MAX_ATTEMPTS,
+    ):
+        self.max_records = max_records
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._writer = writer
+        self._buffer: Deque[Queued] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.enqueued_total = 0
+        self.rejected_total = 0
+        self.flushed_records_total = 0
+        self.flush_count = 0
+        self.flush_failures = 0
+        self.dead_lettered_total = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def offer(self, entries: List[Entry]) -> bool:
+        """Queue all entries, or none of them if the buffer lacks room."""
+        with self._cond:
+            if self._stopping or len(self._buffer) + len(entries) > self.max_records:
+                self.rejected_total += len(entries)
+                return False
+            now = time.monotonic()
+            self._buffer.extend((now, entry, 0, self.flush_size) for entry in entries)
+            self.enqueued_total += len(entries)
+            self._ensure_started()
+            self._cond.notify()
+        return True
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> List[Queued]:
+        batch: List[Queued] = []
+        limit = self._buffer[0][3] if self._buffer else 0
+        while self._buffer and len(batch) < limit:
+            batch.append(self._buffer.popleft())
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._buffer) >= self.flush_size:
+                        break
+                    if self._buffer:
+                        waited = time.monotonic() - self._buffer[0][0]
+                        if waited >= self.flush_interval:
+                            break
+                        self._cond.wait(self.flush_interval - waited)
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+                batch = self._take_batch()
+            if not self._write(batch):
+                # Back off before retrying so an RTDB outage doesn't spin the thread
+                time.sleep(self.flush_interval)
+
+    def _write(self, batch: List[Queued]) -> bool:
+        if not batch:
+            return True
+        started = time.perf_counter()
+        try:
+            self._writer([entry for _, entry, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Ingest flush of {len(batch)} records failed: {e}")
+            with self._cond:
+                self.flush_failures += 1
+                self._requeue(batch)
+            return False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self.flush_count += 1
+            self.flushed_records_total += len(batch)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._flush_ms_total += elapsed_ms
+        return True
+
+    def _requeue(self, batch: List[Queued]) -> None:
+        """Put a failed batch back at the front, split or dropped once it keeps failing."""
+        attempts = max(queued[2] for queued in batch) + 1
+        if attempts < self.max_attempts:
+            # Back at the front so ordering and data are preserved
+            requeued = [(queued_at, entry, attempts, limit) for queued_at, entry, _, limit in batch]
+        elif len(batch) > 1:
+            # Retry in halves so one record RTDB rejects can't hold back the rest
+            half = (len(batch) + 1) // 2
+            requeued = [(queued_at, entry, attempts, half) for queued_at, entry, _, _ in batch]
+        else:
+            key = batch[0][1][0]
+            logger.error(f"Dropping record {key} after {attempts} failed writes")
+            self.dead_lettered_total += 1
+            return
+        self._buffer.extendleft(reversed(requeued))
+
+    def flush(self) -> int:
+        """Synchronously write everything currently buffered; returns records written."""
+        written = 0
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return written
+            if not self._write(batch):
+                return written
+            written += len(batch)
+
+    def drain(self, timeout: float = 10.0) -> int:
+        """Stop the flusher and write out whatever is left (used on shutdown)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        written = self.flush()
+        remaining = self.depth()
+        if remaining:
+            logger.error(f"Ingest queue drained with {remaining} records unwritten")
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "depth": len(self._buffer),
+                "max_records": self.max_records,
+                "flush_size": self.flush_size,
+                "flush_interval": self.flush_interval,
+                "enqueued_total": self.enqueued_total,
+                "rejected_total": self.rejected_total,
+                "flushed_records_total": self.flushed_records_total,
+                "flush_count": self.flush_count,
+                "flush_failures": self.flush_failures,
+                "dead_lettered_total": self.dead_lettered_total,
+                "last_flush_ms": self.last_flush_ms,
+                "avg_flush_ms": (self._flush_ms_total / self.flush_count) if self.flush_count else None,
+                "max_flush_ms": self.max_flush_ms,
+            }
+
+
+ingest_queue = IngestQueue()
+derived_queue = IngestQueue(
+    max_records=DERIVED_QUEUE_MAX_RECORDS,
+    flush_size=DERIVED_FLUSH_SIZE,
+    flush_interval=DERIVED_FLUSH_INTERVAL,
+    writer=apply_derived,
+)
+
+
+def offer_derived(entries: List[Entry]) -> None:
+    """Queue stored records for derived-data maintenance (inline if write-behind is off)."""
+    if not DERIVED_WRITE_BEHIND:
+        apply_derived(entries)
+    elif not derived_queue.offer(entries):
+        logger.error(f"Derived-data queue full; dropped derived updates for {len(entries)} records")
+
+
+def wants_async(prefer_header: Optional[str]) -> bool:
+    """True if the client asked for write-behind handling via `Prefer: respond-async`."""
+    if not prefer_header:
+        return False
+    return any(p.strip().lower() == "respond-async" for p in prefer_header.split(","))
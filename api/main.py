@@ -83,6 +83,7 @@ from .login import router as login_router
 from .ai import router as ai_router
 from .profile import router as profile_router
 from .schedule import router as schedule_router
+from .ingest_queue import derived_queue, ingest_queue
 
 app = FastAPI()
 app.add_middleware(
@@ -102,4 +103,11 @@ app.include_router(ai_router)
 app.include_router(profile_router)
 app.include_router(schedule_router)
 
+
+@app.on_event("shutdown")
+def drain_ingest_queue():
+    """Flush write-behind ingest records, then their rollups, before the process exits."""
+    ingest_queue.drain()
+    derived_queue.drain()
+
 # Note: On Vercel Python runtime, export ASGI app as `app` (no Mangum wrapper needed)
@@ -0,0 +1,192 @@
+# api/mqtt_ingest.py
+"""Vitals ingestion over MQTT.
+
+Devices publish to `devices/{device_id}/vitals` instead of opening an HTTPS
+connection per reading. The broker account is shared, so it does not tell us
+who published a message, and the secret must not travel in the payload where
+anyone on that account could read it. Each message is instead an envelope
+signed with the device secret:
+
+    {"ts": 1699920000000, "nonce": "9f2c41d07a6e", "sig": "<hex>", "body": "<body JSON text>"}
+
+    sig = hex(HMAC-SHA256(secret, "{device_id}\n{ts}\n{nonce}\n" + body))
+
+`ts` is the device clock in ms and must be within MQTT_SIGNATURE_MAX_SKEW_MS
+of ours; a `nonce` (8-64 characters) is accepted once per window, so a
+captured message cannot be replayed (nonces are remembered per instance). The
+body is one reading or a batch of at most MAX_BATCH_SAMPLES:
+
+    {"user_id": "...", "spo2": 98, "heart_rate": 72}
+    {"user_id": "...", "samples": [{"spo2": 98, "heart_rate": 72, "ts_offset": -1000}, ...]}
+
+Envelope and body may also be MessagePack maps (the packed body then goes in
+`body` as bytes). Samples may carry a device `seq` and `boot`; QoS 1
+redeliveries of stored samples are dropped (see api/dedup.py).
+
+Old firmware that puts `"secret"` in the body itself is only accepted while
+MQTT_ACCEPT_SECRET_PAYLOADS is set. `user_id` plays the role of the
+`X-User-Id` header and may be omitted for legacy single-owner devices.
+Accepted records go through the write-behind ingest queue, which batches them
+into multi-path updates.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from .cache import TTLCache
+from .codec import unpack_msgpack
+from .device_auth import check_device_secret, check_device_signature
+from .ingest import MAX_BATCH_SAMPLES, compose_entries, parse_sample, remember_entries, resolve_record_user
+from .ingest_queue import ingest_queue
+
+logger = logging.getLogger(__name__)
+
+VITALS_TOPIC = "devices/+/vitals"
+
+MQTT_SIGNATURE_MAX_SKEW_MS = int(os.environ.get("MQTT_SIGNATURE_MAX_SKEW_MS", "300000"))
+MQTT_ACCEPT_SECRET_PAYLOADS = os.environ.get("MQTT_ACCEPT_SECRET_PAYLOADS", "False").lower() in ("true", "1", "yes")
+MQTT_NONCE_CACHE_SIZE = int(os.environ.get("MQTT_NONCE_CACHE_SIZE", "100000"))
+
+# Nonces seen within the skew window on either side of now
+_nonces = TTLCache("mqtt_nonces", maxsize=MQTT_NONCE_CACHE_SIZE, ttl=2 * MQTT_SIGNATURE_MAX_SKEW_MS / 1000)
+_nonce_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "messages_received": 0,
+    "records_accepted": 0,
+    "messages_invalid": 0,
+    "messages_unauthorized": 0,
+    "records_dropped": 0,
+    "records_duplicate": 0,
+}
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def vitals_device_id(topic: str) -> Optional[str]:
+    """Return the device ID for a `devices/{id}/vitals` topic, else None."""
+    parts = topic.split("/")
+    if len(parts) == 3 and parts[0] == "devices" and parts[2] == "vitals" and parts[1]:
+        return parts[1]
+    return None
+
+
+def decode_vitals_payload(payload: bytes) -> Dict[str, Any]:
+    """Decode a JSON or MessagePack payload (MessagePack maps never start with '{')."""
+    if payload[:1] == b"{":
+        body = json.loads(payload.decode("utf-8"))
+    else:
+        body = unpack_msgpack(payload)
+    if not isinstance(body, dict):
+        raise ValueError("payload must be an object")
+    return body
+
+
+def signing_message(device_id: str, ts: int, nonce: str, body: bytes) -> bytes:
+    """The bytes a vitals envelope's `sig` covers."""
+    return f"{device_id}\n{ts}\n{nonce}\n".encode("utf-8") + body
+
+
+def _claim_nonce(device_id: str, nonce: str) -> bool:
+    with _nonce_lock:
+        if _nonces.contains((device_id, nonce)):
+            return False
+        _nonces.set((device_id, nonce), True)
+        return True
+
+
+def open_envelope(device_id: str, envelope: Dict[str, Any], now_ms: int) -> Optional[bytes]:
+    """Return the body of a correctly signed, fresh envelope, else None.
+
+    Raises ValueError for a malformed envelope.
+    """
+    ts, nonce, sig, body = (envelope.get(k) for k in ("ts", "nonce", "sig", "body"))
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if (
+        not isinstance(ts, int) or isinstance(ts, bool)
+        or not isinstance(nonce, str) or not 8 <= len(nonce) <= 64
+        or not isinstance(sig, str) or not isinstance(body, bytes)
+    ):
+        raise ValueError("malformed envelope")
+    if abs(now_ms - ts) > MQTT_SIGNATURE_MAX_SKEW_MS:
+        return None
+    if not check_device_signature(device_id, signing_message(device_id, ts, nonce, body), sig):
+        return None
+    if not _claim_nonce(device_id, nonce):
+        return None
+    return body
+
+
+def _secret_matches(device_id: str, secret: Any) -> bool:
+    return isinstance(secret, str) and bool(secret) and check_device_secret(device_id, secret)
+
+
+def handle_vitals_message(topic: str, payload: bytes) -> int:
+    """Authenticate, decode and queue one vitals message; returns records accepted."""
+    device_id = vitals_device_id(topic)
+    if not device_id:
+        return 0
+    _count("messages_received")
+
+    received_at = int(time.time() * 1000)
+    try:
+        body = decode_vitals_payload(payload)
+        if "sig" in body:
+            signed = open_envelope(device_id, body, received_at)
+            body = decode_vitals_payload(signed) if signed is not None else None
+        elif not MQTT_ACCEPT_SECRET_PAYLOADS or not _secret_matches(device_id, body.get("secret")):
+            body = None
+    except (ValueError, UnicodeDecodeError) as e:
+        _count("messages_invalid")
+        logger.warning(f"MQTT vitals from {device_id}: undecodable payload ({e})")
+        return 0
+    if body is None:
+        _count("messages_unauthorized")
+        logger.warning(f"MQTT vitals from {device_id}: invalid device credentials")
+        return 0
+
+    samples = body.get("samples")
+    if samples is None:
+        samples = [body]
+    try:
+        if not isinstance(samples, list) or not samples:
+            raise HTTPException(400, "Expected a non-empty array of samples")
+        if len(samples) > MAX_BATCH_SAMPLES:
+            raise HTTPException(413, f"Too many samples (max {MAX_BATCH_SAMPLES})")
+        # Every value is checked before anything reaches the write-behind queue
+        # that HTTP ingest shares: a record RTDB refuses would hold up its batch
+        parsed = [parse_sample(sample, index, received_at) for index, sample in enumerate(samples)]
+        user_id = resolve_record_user(device_id, body.get("user_id"))
+    except HTTPException as e:
+        counter = "messages_unauthorized" if e.status_code in (401, 409) else "messages_invalid"
+        _count(counter)
+        logger.warning(f"MQTT vitals from {device_id} rejected: {e.detail}")
+        return 0
+
+    entries, keys = compose_entries(device_id, user_id, parsed)
+    if len(entries) < len(keys):
+        _count("records_duplicate", len(keys) - len(entries))
+    if not entries:
+        return 0
+    if not ingest_queue.offer(entries):
+        _count("records_dropped", len(entries))
+        logger.error(f"MQTT vitals from {device_id}: ingest queue full, dropped {len(entries)} records")
+        return 0
+    remember_entries(device_id, entries)
+    _count("records_accepted", len(entries))
+    return len(entries)
+
+
+def mqtt_ingest_stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
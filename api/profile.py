@@ -1,7 +1,9 @@
 # api/profile.py
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
 from firebase_admin import db
 from .auth import verify_firebase_token
+from .cache import MISSING
+from .etags import cached_validator, etag_matches, forget_validator, make_etag, not_modified, remember_validator, set_etag
 from typing import Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
@@ -53,6 +55,7 @@ async def create_profile(profile: UserProfile, user = Depends(verify_firebase_to
         
         # Save to Firebase
         db.reference(f"/user_profiles/{user_id}").set(profile_data)
+        forget_validator("profile", user_id)
         
         return {
             "status": "success",
@@ -64,16 +67,35 @@ async def create_profile(profile: UserProfile, user = Depends(verify_firebase_to
 
 @router.get("")
 @router.get("/")
-async def get_profile(user = Depends(verify_firebase_token)):
-    """Get user profile"""
+async def get_profile(
+    response: Response,
+    user = Depends(verify_firebase_token),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Get user profile
+
+    The ETag is derived from `updated_at`; a matching `If-None-Match` gets 304,
+    without an RTDB read while the validator is cached (see api/etags.py).
+    """
     try:
         user_id = user.get("uid")
         
+        cached_etag = cached_validator("profile", user_id)
+        if cached_etag is not MISSING and etag_matches(if_none_match, cached_etag):
+            return not_modified(cached_etag)
+        
         profile_data = db.reference(f"/user_profiles/{user_id}").get()
         
         if not profile_data:
             raise HTTPException(404, "Profile not found")
         
+        # Profiles written before updated_at existed fall back to a content hash
+        etag = make_etag("profile", profile_data.get("updated_at") or profile_data)
+        remember_validator("profile", user_id, etag)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        
         return {
             "status": "success",
             "profile": profile_data
@@ -117,6 +139,7 @@ async def update_profile(profile_update: ProfileUpdate, user = Depends(verify_fi
         
         # Update in Firebase
         db.reference(f"/user_profiles/{user_id}").update(update_data)
+        forget_validator("profile", user_id)
         
         # Get updated profile
         updated_profile = db.reference(f"/user_profiles/{user_id}").get()
@@ -145,6 +168,7 @@ async def delete_profile(user = Depends(verify_firebase_token)):
         
         # Delete profile
         db.reference(f"/user_profiles/{user_id}").delete()
+        forget_validator("profile", user_id)
         
         return {
             "status": "success",
@@ -0,0 +1,95 @@
+# api/pubsub.py
+"""In-process fan-out of newly stored records to live subscribers.
+
+`write_records` publishes every stored (key, record) pair here; the SSE
+endpoint (`GET /api/records/stream`) subscribes per user. Publishing is safe
+from any thread (the write-behind flusher runs on its own): items are handed
+to each subscriber's event loop with `call_soon_threadsafe`.
+
+Subscriber queues are bounded. A subscriber that falls behind is flagged as
+overflowed instead of blocking ingest; the stream then catches up from RTDB.
+Only records written by this process are published, so streams also re-sync
+from RTDB periodically to pick up writes handled by other instances.
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+STREAM_QUEUE_SIZE = 1000
+
+Entry = Tuple[str, Dict[str, Any]]
+
+
+class Subscription:
+    """One live consumer of a user's records."""
+
+    def __init__(self, uid: str, loop: asyncio.AbstractEventLoop, maxsize: int = STREAM_QUEUE_SIZE):
+        self.uid = uid
+        self.loop = loop
+        self.queue: "asyncio.Queue[Entry]" = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def _offer(self, entry: Entry) -> None:
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class RecordBroker:
+    """Thread-safe registry of subscriptions keyed by user ID."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published_total = 0
+        self.delivered_total = 0
+
+    def subscribe(self, uid: str) -> Subscription:
+        subscription = Subscription(uid, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(uid, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.uid)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.uid]
+
+    def publish(self, entries: Iterable[Entry]) -> int:
+        """Hand stored records to their users' subscribers; returns deliveries scheduled."""
+        delivered = 0
+        published = 0
+        with self._lock:
+            for key, record in entries:
+                published += 1
+                for subscription in list(self._subscribers.get(record.get("userId"), ())):
+                    try:
+                        subscription.loop.call_soon_threadsafe(subscription._offer, (key, record))
+                        delivered += 1
+                    except RuntimeError:
+                        # Event loop already closed; the stream is gone
+                        pass
+            self.published_total += published
+            self.delivered_total += delivered
+        return delivered
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "subscriptions": sum(len(s) for s in self._subscribers.values()),
+                "published_total": self.published_total,
+                "delivered_total": self.delivered_total,
+            }
+
+
+record_broker = RecordBroker()
+
+
+def publish_records(entries: List[Entry]) -> int:
+    return record_broker.publish(entries)
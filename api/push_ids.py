@@ -0,0 +1,69 @@
+# api/push_ids.py
+"""Firebase-compatible push ID generation without a database round trip.
+
+IDs follow the RTDB client algorithm: 8 characters of millisecond timestamp
+followed by 12 random characters, all drawn from an alphabet whose ASCII order
+matches its value order. IDs generated in this process therefore sort
+chronologically; within the same millisecond (or if the clock steps back) the
+random part is incremented so ordering stays strictly monotonic.
+"""
+import secrets
+import threading
+import time
+from typing import List, Optional
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+_lock = threading.Lock()
+_last_ts = 0
+_last_rand: List[int] = [0] * 12
+
+
+def generate_push_id(now_ms: Optional[int] = None) -> str:
+    """Return a new 20-character push ID, strictly greater than the previous one."""
+    global _last_ts, _last_rand
+    ts = int(time.time() * 1000) if now_ms is None else int(now_ms)
+
+    with _lock:
+        if ts <= _last_ts:
+            # Same millisecond or clock moved backwards: keep the last timestamp and
+            # bump the random suffix by one so the new ID still sorts after the last.
+            ts = _last_ts
+            rand = list(_last_rand)
+            i = 11
+            while i >= 0 and rand[i] == 63:
+                rand[i] = 0
+                i -= 1
+            if i < 0:
+                # 64^12 IDs in one millisecond: move on to the next millisecond
+                ts += 1
+                rand = [secrets.randbelow(64) for _ in range(12)]
+            else:
+                rand[i] += 1
+        else:
+            rand = [secrets.randbelow(64) for _ in range(12)]
+        _last_ts = ts
+        _last_rand = rand
+
+    ts_chars = []
+    for _ in range(8):
+        ts_chars.append(PUSH_CHARS[ts % 64])
+        ts //= 64
+    return "".join(reversed(ts_chars)) + "".join(PUSH_CHARS[r] for r in rand)
+
+
+def push_id_floor(ts_ms: int) -> str:
+    """Smallest push ID for a millisecond timestamp (a key-range query bound)."""
+    ts_chars = []
+    for _ in range(8):
+        ts_chars.append(PUSH_CHARS[ts_ms % 64])
+        ts_ms //= 64
+    return "".join(reversed(ts_chars)) + PUSH_CHARS[0] * 12
+
+
+def push_id_timestamp(push_id: str) -> int:
+    """Decode the millisecond timestamp embedded in a push ID."""
+    ts = 0
+    for ch in push_id[:8]:
+        ts = ts * 64 + PUSH_CHARS.index(ch)
+    return ts
@@ -0,0 +1,111 @@
+# api/rate_limit.py
+"""Per-device token-bucket rate limiting for device-facing routes.
+
+Each limited route gets its own bucket per `X-Device-Id`: `burst` tokens that
+refill at `rate` tokens per second. A request that finds the bucket empty gets
+429 with `Retry-After` set to the time until the next token.
+
+The limiter is a path-operation dependency, so FastAPI resolves it before
+`verify_device` and throttled requests never touch RTDB. The flip side is
+that the device ID is not authenticated yet; a client spoofing another
+device's ID can only use up that device's bucket on this instance.
+
+Buckets live in process memory (per serverless instance) and are dropped once
+they would have refilled completely, which is the same as keeping a full one.
+Rate and burst are configured per route through
+`RATE_LIMIT_{ROUTE}_RATE` / `RATE_LIMIT_{ROUTE}_BURST`.
+"""
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from cachetools import TTLCache as _TTLCache
+from fastapi import Header, HTTPException
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "True").lower() in ("true", "1", "yes")
+RATE_LIMIT_MAX_DEVICES = int(os.environ.get("RATE_LIMIT_MAX_DEVICES", "10000"))
+
+_registry: List["TokenBucketLimiter"] = []
+
+
+class TokenBucketLimiter:
+    """Thread-safe token buckets keyed by an arbitrary string."""
+
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int = RATE_LIMIT_MAX_DEVICES):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._buckets = _TTLCache(maxsize=max_keys, ttl=burst / rate)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        _registry.append(self)
+
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                self.allowed += 1
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            self.throttled += 1
+            return (1 - tokens) / self.rate
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self.allowed = 0
+            self.throttled = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "allowed": self.allowed,
+                "throttled": self.throttled,
+                "tracked_devices": len(self._buckets),
+            }
+
+
+def _route_setting(route: str, setting: str, default: float) -> float:
+    return float(os.environ.get(f"RATE_LIMIT_{route.upper()}_{setting}", default))
+
+
+def device_rate_limit(route: str, rate: float, burst: int):
+    """Build a dependency limiting `route` per X-Device-Id (env overrides rate/burst)."""
+    limiter = TokenBucketLimiter(
+        route,
+        rate=_route_setting(route, "RATE", rate),
+        burst=int(_route_setting(route, "BURST", burst)),
+    )
+
+    async def limit_device(x_device_id: Optional[str] = Header(default=None)):
+        # Requests without a device ID are left for verify_device to reject
+        if not RATE_LIMIT_ENABLED or not x_device_id:
+            return
+        retry_after = limiter.acquire(x_device_id)
+        if retry_after:
+            raise HTTPException(
+                429,
+                "Too many requests from this device",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    return limit_device
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    return {limiter.name: limiter.stats() for limiter in _registry}
+
+
+def reset_rate_limits() -> None:
+    """Refill every bucket and zero the counters (used by tests)."""
+    for limiter in _registry:
+        limiter.reset()
@@ -0,0 +1,139 @@
+# api/recent_records.py
+"""Per-user buffer of the most recent records, kept in process memory.
+
+Serves the "last N readings" reads (GET /api/records without a range, the AI
+chat context and /api/ai/sumerize) and the pages of GET /api/records whose
+range the buffer covers (the dashboard's first page of its live window)
+without querying RTDB every time. Each active user gets a buffer of their
+RECENT_RECORDS_PER_USER newest records by `ts` (sized for the endpoint's
+default limit); the LRU cache behind it evicts users who have gone quiet.
+
+A buffer is seeded by one RTDB read the first time a user is asked for (by
+a read that reaches the present), then `write_records` appends every record
+stored by this instance. Records stored by other instances are not seen, so
+a buffer is only served while its newest key matches the user's newest key
+in RTDB (the ETag validator, which is itself cached for a few seconds);
+otherwise it is seeded again.
+"""
+import bisect
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .cache import MISSING, TTLCache
+from .etags import cached_validator, remember_validator
+from .record_store import newest_user_record_key, query_user_records
+
+RECENT_RECORDS_ENABLED = os.environ.get("RECENT_RECORDS_ENABLED", "True").lower() in ("true", "1", "yes")
+RECENT_RECORDS_PER_USER = int(os.environ.get("RECENT_RECORDS_PER_USER", "1000"))
+RECENT_RECORDS_MAX_USERS = int(os.environ.get("RECENT_RECORDS_MAX_USERS", "1000"))
+RECENT_RECORDS_TTL = float(os.environ.get("RECENT_RECORDS_TTL", "3600"))
+
+Record = Dict[str, Any]
+
+_buffers = TTLCache(
+    "recent_records",
+    maxsize=RECENT_RECORDS_MAX_USERS,
+    ttl=RECENT_RECORDS_TTL,
+)
+_lock = threading.Lock()
+
+
+def _order(record: Record) -> Tuple[Any, str]:
+    return (record.get("ts") or 0, record.get("id", ""))
+
+
+class _UserBuffer:
+    """The newest records of one user, oldest first, capped at `size`."""
+
+    def __init__(self, newest_key: str, records: Iterable[Record], size: int = RECENT_RECORDS_PER_USER):
+        self.newest_key = newest_key
+        self.size = size
+        self.records = sorted(records, key=_order)[-size:]
+
+    def add(self, key: str, record: Record) -> None:
+        record = {"id": key, **record}
+        position = bisect.bisect([_order(r) for r in self.records], _order(record))
+        self.records.insert(position, record)
+        del self.records[:-self.size]
+        self.newest_key = max(self.newest_key, key)
+
+    def newest(self, limit: int) -> List[Record]:
+        return [dict(r) for r in reversed(self.records[-limit:])]
+
+    def query(self, count: int, start_ts: Optional[int], end_ts: Optional[int]) -> Optional[List[Record]]:
+        """The newest `count` records with start_ts <= ts <= end_ts, or None if the buffer can't tell.
+
+        Records missing from the buffer are older than all it holds, so the
+        answer is exact once `count` in-range records are buffered, or when
+        the buffer holds the user's whole history or reaches back past start_ts.
+        """
+        rows = [
+            r for r in reversed(self.records)
+            if (start_ts is None or (r.get("ts") or 0) >= start_ts) and (end_ts is None or (r.get("ts") or 0) <= end_ts)
+        ]
+        complete = len(self.records) < self.size or (
+            start_ts is not None and bool(self.records) and start_ts > (self.records[0].get("ts") or 0)
+        )
+        if len(rows) < count and not complete:
+            return None
+        return [dict(r) for r in rows[:count]]
+
+
+def newest_record_key(uid: str) -> str:
+    """The user's newest record key, from the ETag validator cache or one tiny read."""
+    newest_key = cached_validator("records", uid)
+    if newest_key is MISSING:
+        newest_key = newest_user_record_key(uid)
+        remember_validator("records", uid, newest_key)
+    return newest_key
+
+
+def recent_user_records(uid: str, limit: int, newest_key: Optional[str] = None) -> List[Record]:
+    """The user's `limit` newest records by ts, newest first (same shape as query_user_records)."""
+    return query_recent_records(uid, limit, newest_key=newest_key)
+
+
+def query_recent_records(
+    uid: str,
+    count: int,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    newest_key: Optional[str] = None,
+) -> List[Record]:
+    """`query_user_records`, answered from the user's buffer when it covers the query.
+
+    An open-ended query (no end_ts) of at most RECENT_RECORDS_PER_USER records
+    seeds the buffer if there is none or it is stale, since the buffer always
+    covers it; other queries only use a buffer that is already current.
+    """
+    seed = end_ts is None and count <= RECENT_RECORDS_PER_USER
+    if not RECENT_RECORDS_ENABLED or not (seed or _buffers.contains(uid)):
+        return query_user_records(uid, count, start_ts, end_ts)
+    if newest_key is None:
+        newest_key = newest_record_key(uid)
+    with _lock:
+        buffer = _buffers.get(uid)
+        if buffer is not None and buffer.newest_key >= newest_key:
+            rows = buffer.query(count, start_ts, end_ts)
+            if rows is not None:
+                return rows
+    if not seed:
+        return query_user_records(uid, count, start_ts, end_ts)
+    buffer = _UserBuffer(newest_key, query_user_records(uid, RECENT_RECORDS_PER_USER))
+    with _lock:
+        _buffers.set(uid, buffer)
+        rows = buffer.query(count, start_ts, end_ts)
+    return rows if rows is not None else query_user_records(uid, count, start_ts, end_ts)
+
+
+def remember_recent(entries: Iterable[Tuple[str, Record]]) -> None:
+    """Append stored records to the buffers of users that have one."""
+    if not RECENT_RECORDS_ENABLED:
+        return
+    with _lock:
+        for key, record in entries:
+            uid = record.get("userId")
+            buffer = _buffers.get(uid) if _buffers.contains(uid) else None
+            if buffer is not None:
+                buffer.add(key, record)
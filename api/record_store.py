@@ -0,0 +1,280 @@
+# api/record_store.py
+"""Readers and layout helpers for per-user records.
+
+Besides the flat `/user_records/{uid}/{key}` node, ingest also writes each
+record to a day-partitioned layout:
+
+    /user_records_v2/{uid}/{YYYY-MM-DD}/{key}
+
+Days are UTC. A read lists the user's days (one shallow read), then walks
+the days its range touches newest-first until it has enough records, so no
+query ever runs over a user's whole history. Each day is one query on its
+`ts` index (`".indexOn": "ts"` under `user_records_v2/$uid/$day`), or a
+plain read of that one day where the index is missing.
+
+Older records are copied over by `scripts/migrate_user_records_v2.py`, which
+keeps a per-user checkpoint under `/migrations/user_records_v2/{uid}`. Once
+that checkpoint is marked complete (see `v2_migration_complete`), ranged
+reads (`query_user_records`, behind GET /api/records, aggregates and
+`max_points`) are served from the partitions; until then from the flat node.
+"""
+import base64
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from firebase_admin import db, exceptions as fa_exceptions
+
+from .cache import MISSING, TTLCache
+from .push_ids import push_id_floor, push_id_timestamp
+
+USER_RECORDS_V2_ENABLED = os.environ.get("USER_RECORDS_V2_ENABLED", "True").lower() in ("true", "1", "yes")
+# How long a user's migration checkpoint is cached
+V2_MIGRATION_CACHE_TTL = float(os.environ.get("V2_MIGRATION_CACHE_TTL", "300"))
+# How far /since re-reads before the client's watermark, covering clock skew
+# between instances and records still in the write-behind queue
+SINCE_OVERLAP_MS = int(os.environ.get("SINCE_OVERLAP_MS", "5000"))
+
+V2_ROOT = "user_records_v2"
+MIGRATION_ROOT = "migrations/user_records_v2"
+
+Record = Dict[str, Any]
+
+_migrated = TTLCache("v2_migration", maxsize=10000, ttl=V2_MIGRATION_CACHE_TTL)
+
+
+def partition_for(ts: int) -> str:
+    """UTC day partition (YYYY-MM-DD) for a millisecond timestamp."""
+    return datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def v2_record_path(uid: str, ts: int, key: str) -> str:
+    return f"{V2_ROOT}/{uid}/{partition_for(ts)}/{key}"
+
+
+def v2_fanout_updates(key: str, record: Record) -> Dict[str, Any]:
+    """Multi-path update entries for the day-partitioned copy of a record."""
+    if not USER_RECORDS_V2_ENABLED or not isinstance(record.get("ts"), (int, float)):
+        return {}
+    return {v2_record_path(record["userId"], int(record["ts"]), key): record}
+
+
+def _read_partition(
+    uid: str, day: str, limit: int, start_ts: Optional[int], end_ts: Optional[int]
+) -> Dict[str, Record]:
+    ref = db.reference(f"/{V2_ROOT}/{uid}/{day}")
+    try:
+        query = ref.order_by_child("ts")
+        if start_ts is not None:
+            query = query.start_at(start_ts)
+        if end_ts is not None:
+            query = query.end_at(end_ts)
+        return query.limit_to_last(limit).get() or {}
+    except fa_exceptions.InvalidArgumentError:
+        # No ts index on the partitions (local/test environments); one day is small
+        return ref.get() or {}
+
+
+def _as_list(records: Dict[str, Record]) -> List[Record]:
+    return [{"id": key, **value} for key, value in records.items() if isinstance(value, dict)]
+
+
+def read_recent_user_records(
+    uid: str, limit: int, start_ts: Optional[int] = None, end_ts: Optional[int] = None
+) -> List[Record]:
+    """The `limit` most recent records (optionally within [start_ts, end_ts]), newest first.
+
+    A shallow read lists the user's day partitions (keys only); partitions are
+    then queried newest-first, each for at most the records still needed,
+    until enough are collected.
+    """
+    days = sorted((db.reference(f"/{V2_ROOT}/{uid}").get(shallow=True) or {}).keys(), reverse=True)
+    first_day = partition_for(start_ts) if start_ts is not None else None
+    last_day = partition_for(end_ts) if end_ts is not None else None
+    records: List[Record] = []
+    for day in days:
+        if len(records) >= limit or (first_day and day < first_day):
+            break
+        if last_day and day > last_day:
+            continue
+        rows = _read_partition(uid, day, limit - len(records), start_ts, end_ts)
+        records.extend(r for r in _as_list(rows) if _in_range(r.get("ts", 0), start_ts, end_ts))
+    _sort_newest_first(records)
+    return records[:limit]
+
+
+def _in_range(ts: Any, start_ts: Optional[int], end_ts: Optional[int]) -> bool:
+    return (start_ts is None or ts >= start_ts) and (end_ts is None or ts <= end_ts)
+
+
+def _sort_newest_first(records: List[Record]) -> None:
+    # (ts, key) descending; keys break ties between records in the same ms
+    records.sort(key=lambda r: (r.get("ts") or 0, r.get("id", "")), reverse=True)
+
+
+def query_user_records(
+    uid: str, count: int, start_ts: Optional[int] = None, end_ts: Optional[int] = None
+) -> List[Record]:
+    """Up to `count` newest records with start_ts <= ts <= end_ts, newest first.
+
+    Served from the partitioned layout once the user is migrated, else from
+    the `ts` index on /user_records/{uid} (without it, a full read).
+    Records moved to cold storage are merged in when the range reaches them
+    (see api/archive.py).
+    """
+    # api.archive builds on this module, so it is imported here
+    from .archive import with_archived
+
+    return with_archived(uid, _query_live_records(uid, count, start_ts, end_ts), count, start_ts, end_ts)
+
+
+def _query_live_records(
+    uid: str, count: int, start_ts: Optional[int], end_ts: Optional[int]
+) -> List[Record]:
+    if v2_migration_complete(uid):
+        return read_recent_user_records(uid, count, start_ts, end_ts)
+    ref = db.reference(f"/user_records/{uid}")
+    try:
+        query = ref.order_by_child("ts")
+        if start_ts is not None:
+            query = query.start_at(start_ts)
+        if end_ts is not None:
+            query = query.end_at(end_ts)
+        records = query.limit_to_last(count).get()
+    except fa_exceptions.InvalidArgumentError:
+        # Fallback when RTDB index is not defined in local/test environments
+        records = ref.get() or {}
+    result = [r for r in _as_list(records or {}) if _in_range(r.get("ts", 0), start_ts, end_ts)]
+    _sort_newest_first(result)
+    return result[:count]
+
+
+def encode_cursor(ts: int, key: str, skip: int) -> str:
+    """Opaque `before` cursor: records older than (ts, key).
+
+    `skip` counts records with this exact `ts` already returned, so the next
+    query (which can only bound by ts) fetches enough rows to get past them.
+    """
+    raw = json.dumps([ts, key, skip], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str, int]:
+    """Parse a cursor from `encode_cursor`; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, key, skip = json.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(ts, int) or not isinstance(key, str) or not isinstance(skip, int) or skip < 0:
+        raise ValueError("Invalid cursor")
+    return ts, key, skip
+
+
+def page_user_records(
+    uid: str,
+    limit: int,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    before: Optional[str] = None,
+    query: Callable[..., List[Record]] = query_user_records,
+) -> Tuple[List[Record], Optional[str]]:
+    """One page of records newest-first plus the cursor for the next (older) page.
+
+    `query` reads the rows (same signature as `query_user_records`).
+    """
+    cursor_ts, cursor_key, skip = decode_cursor(before) if before else (None, None, 0)
+    upper = end_ts
+    if cursor_ts is not None:
+        upper = cursor_ts if upper is None else min(upper, cursor_ts)
+
+    rows = query(uid, limit + skip + 1, start_ts, upper)
+    if cursor_ts is not None:
+        # Drop rows at or after the cursor: same ts with key >= cursor key
+        rows = [r for r in rows if r.get("ts") != cursor_ts or r.get("id", "") < cursor_key]
+
+    page, more = rows[:limit], len(rows) > limit
+    next_cursor = None
+    if more and page:
+        last = page[-1]
+        same_ts = sum(1 for r in page if r.get("ts") == last.get("ts"))
+        if last.get("ts") == cursor_ts:
+            same_ts += skip
+        next_cursor = encode_cursor(last.get("ts") or 0, last.get("id", ""), same_ts)
+    return page, next_cursor
+
+
+def v2_migration_complete(uid: str) -> bool:
+    """Whether the v2 layout holds this user's full history (cached briefly)."""
+    complete = _migrated.get(uid, MISSING)
+    if complete is MISSING:
+        checkpoint = db.reference(f"/{MIGRATION_ROOT}/{uid}").get()
+        complete = isinstance(checkpoint, dict) and bool(checkpoint.get("complete"))
+        _migrated.set(uid, complete)
+    return complete
+
+
+def iter_user_record_pages(
+    uid: str, page_size: int, after_key: Optional[str] = None
+) -> Iterator[List[Tuple[str, Record]]]:
+    """Yield a user's flat-layout records as (key, record) pages in key order."""
+    return iter_record_pages(f"/user_records/{uid}", page_size, after_key)
+
+
+def iter_record_pages(
+    path: str, page_size: int, after_key: Optional[str] = None
+) -> Iterator[List[Tuple[str, Record]]]:
+    """Yield the records under `path` as (key, record) pages in key order."""
+    ref = db.reference(path)
+    last_key = after_key
+    while True:
+        query = ref.order_by_key()
+        requested = page_size
+        if last_key is not None:
+            # start_at is inclusive, so ask for one extra and drop the cursor row
+            query = query.start_at(last_key)
+            requested += 1
+        page = query.limit_to_first(requested).get() or {}
+        keys = sorted(k for k in page if k != last_key)
+        if not keys:
+            return
+        yield [(k, page[k]) for k in keys if isinstance(page[k], dict)]
+        last_key = keys[-1]
+        if len(page) < requested:
+            return
+
+
+def read_user_records_since(
+    uid: str, since_ms: int, limit: int, after_key: Optional[str] = None
+) -> Tuple[List[Record], int, Optional[str]]:
+    """Records ingested after `since_ms`, newest first, the new watermark and a continuation key.
+
+    The watermark is ingest time as encoded in the push-ID keys, not the sample
+    `ts`: batched and queued samples can be stored well after their `ts`. The
+    key index needs no RTDB rule, so this is always an indexed range read.
+    The first call starts SINCE_OVERLAP_MS before `since_ms`, so callers may
+    see a record twice and should de-duplicate by `id`. If more records
+    remain, the returned key is set: pass it back as `after_key` to continue
+    right after the last returned record (no overlap), else it is None.
+    """
+    query = db.reference(f"/user_records/{uid}").order_by_key()
+    if after_key is not None:
+        # start_at is inclusive, so ask for one extra and drop the cursor row
+        rows = query.start_at(after_key).limit_to_first(limit + 2).get() or {}
+    else:
+        start_key = push_id_floor(max(0, since_ms - SINCE_OVERLAP_MS))
+        rows = query.start_at(start_key).limit_to_first(limit + 1).get() or {}
+    keys = sorted(k for k in rows if k != after_key)
+    more = len(keys) > limit
+    keys = keys[:limit]
+    watermark = max([since_ms] + [push_id_timestamp(k) for k in keys])
+    records = _as_list({k: rows[k] for k in keys})
+    _sort_newest_first(records)
+    return records, watermark, (keys[-1] if more else None)
+
+
+def newest_user_record_key(uid: str) -> str:
+    """Key of the most recently stored record ("" if none); one tiny key-index read."""
+    rows = db.reference(f"/user_records/{uid}").order_by_key().limit_to_last(1).get()
+    return max(rows) if isinstance(rows, dict) and rows else ""
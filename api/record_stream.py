@@ -0,0 +1,129 @@
+# api/record_stream.py
+"""Server-Sent Events feed of a user's new records (GET /api/records/stream).
+
+Each stored record is sent as
+
+    id: <record key>
+    event: record
+    data: {"id": ..., "userId": ..., "spo2": ..., "heart_rate": ..., "ts": ...}
+
+Records written by this instance arrive through the in-process broker
+(api/pubsub.py). Serverless instances don't share memory, so the stream also
+re-syncs from RTDB every STREAM_RESYNC_SECONDS and whenever its queue has
+overflowed, using the same push-ID watermark as GET /api/records/since.
+Idle streams get a comment line every STREAM_HEARTBEAT_SECONDS so proxies
+keep the connection open, and every stream ends after STREAM_MAX_SECONDS to
+stay under the platform's function timeout. Clients reconnect with
+`Last-Event-ID` (or `last_event_id` / `since`) and get what they missed; like
+/since, a resumed stream may repeat a few records, so merge by `id`.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+from .pubsub import record_broker
+from .push_ids import push_id_timestamp
+from .record_store import read_user_records_since
+
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT_SECONDS", "15"))
+STREAM_RESYNC_SECONDS = float(os.environ.get("STREAM_RESYNC_SECONDS", "30"))
+STREAM_MAX_SECONDS = float(os.environ.get("STREAM_MAX_SECONDS", "280"))
+# Client reconnect delay advertised in the `retry:` field
+STREAM_RETRY_MS = 3000
+# Records per RTDB read when catching up, and reads per catch-up
+STREAM_SYNC_LIMIT = 500
+STREAM_SYNC_ROUNDS = 10
+# Recently sent keys remembered to avoid sending a record twice
+_SENT_KEYS = 4096
+
+
+def resume_point(last_event_id: Optional[str], since: Optional[int]) -> Optional[int]:
+    """Watermark (ms) to catch up from, or None to start with new records only.
+
+    Raises ValueError for a malformed event ID.
+    """
+    if last_event_id:
+        if len(last_event_id) != 20:
+            raise ValueError("Invalid event ID")
+        return push_id_timestamp(last_event_id)
+    return since
+
+
+def format_event(key: str, record: Dict[str, Any]) -> str:
+    data = json.dumps({**record, "id": key}, separators=(",", ":"))
+    return f"id: {key}\nevent: record\ndata: {data}\n\n"
+
+
+class _StreamState:
+    """Watermark and recently sent keys of one stream."""
+
+    def __init__(self, uid: str, watermark: int):
+        self.uid = uid
+        self.watermark = watermark
+        self._sent: "OrderedDict[str, None]" = OrderedDict()
+
+    def event(self, key: str, record: Dict[str, Any]) -> Optional[str]:
+        if key in self._sent:
+            return None
+        self._sent[key] = None
+        if len(self._sent) > _SENT_KEYS:
+            self._sent.popitem(last=False)
+        return format_event(key, record)
+
+    async def sync(self) -> AsyncIterator[str]:
+        """Events for records stored since the watermark, oldest first.
+
+        The RTDB reads block, so they run in the threadpool rather than on the
+        event loop that serves every open stream.
+        """
+        after_key = None
+        for _ in range(STREAM_SYNC_ROUNDS):
+            records, self.watermark, after_key = await run_in_threadpool(
+                read_user_records_since, self.uid, self.watermark, STREAM_SYNC_LIMIT, after_key
+            )
+            for record in reversed(records):
+                record = dict(record)
+                event = self.event(record.pop("id"), record)
+                if event:
+                    yield event
+            if after_key is None:
+                return
+
+
+async def record_events(req: Request, uid: str, resume_from: Optional[int]) -> AsyncIterator[str]:
+    subscription = record_broker.subscribe(uid)
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        started = time.monotonic()
+        state = _StreamState(uid, resume_from if resume_from is not None else int(time.time() * 1000))
+        if resume_from is not None:
+            async for event in state.sync():
+                yield event
+        next_sync = started + STREAM_RESYNC_SECONDS
+
+        while True:
+            remaining = started + STREAM_MAX_SECONDS - time.monotonic()
+            if remaining <= 0 or await req.is_disconnected():
+                return
+            try:
+                key, record = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=min(STREAM_HEARTBEAT_SECONDS, remaining)
+                )
+                event = state.event(key, record)
+                if event:
+                    yield event
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+            if subscription.overflowed or (STREAM_RESYNC_SECONDS > 0 and time.monotonic() >= next_sync):
+                subscription.overflowed = False
+                async for event in state.sync():
+                    yield event
+                next_sync = time.monotonic() + STREAM_RESYNC_SECONDS
+    finally:
+        record_broker.unsubscribe(subscription)
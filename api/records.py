@@ -1,112 +1,405 @@
 # api/records.py
-from fastapi import APIRouter, Request, Depends, HTTPException, Header
+from fastapi import APIRouter, Request, Depends, HTTPException, Header, Query
+from fastapi.responses import Response, StreamingResponse
 from firebase_admin import db, exceptions as fa_exceptions
 import time
+from dataclasses import replace
+from functools import partial
 from .auth import verify_firebase_token
+from .codec import columnar, compact_json_response, negotiated_response, read_body
+from .device_access import (
+    change_device_members,
+    load_device_access,
+    read_user_devices,
+    remember_device_access,
+    user_device_entries,
+)
+from .device_auth import check_device_secret, verify_device
+from .aggregate import BUCKETS, aggregate_records
+from .cache import MISSING
+from .downsample import downsample_records
+from .export import EXPORT_FORMATS, encode_export, iter_export_records
+from .etags import cached_validator, etag_matches, make_etag, not_modified, remember_validator, set_etag
+from .dedup import parse_boot, parse_seq
+from .ingest import (
+    MAX_BATCH_SAMPLES,
+    compose_entries,
+    parse_sample,
+    parse_vitals,
+    remember_entries,
+    resolve_record_user,
+    write_records,
+)
+from .ingest_queue import ingest_queue, wants_async
+from .rate_limit import device_rate_limit
+from .recent_records import newest_record_key, query_recent_records, recent_user_records
+from .record_store import page_user_records, query_user_records, read_user_records_since
+from .record_stream import record_events, resume_point
+from .rollups import GRANULARITIES, bucket_start, summarize_rollup
+from .user_info import lookup_users
 from typing import Optional
 
 router = APIRouter(prefix="/api/records")
 
-def verify_device(x_device_id: str = Header(...), x_device_secret: str = Header(...)):
-    expected = db.reference(f"/devices/{x_device_id}/secret").get()
-    if expected != x_device_secret:
-        raise HTTPException(401, "Unauthorized")
-    return x_device_id
+# Upper bound on records returned by one GET /api/records page
+MAX_RECORDS_PAGE = 5000
+# Upper bound on buckets returned by GET /api/records/rollups
+MAX_ROLLUP_BUCKETS = 1000
+# Response layouts offered by GET /api/records
+RECORD_FORMATS = ("rows", "columnar")
+# Upper bound on raw records read for GET /api/records/aggregate and max_points
+MAX_AGGREGATE_RECORDS = 500_000
 
-@router.post("")
-@router.post("/")
+# Per-device token buckets, checked before device credentials (see api/rate_limit.py)
+limit_records = device_rate_limit("records", rate=2.0, burst=20)
+limit_records_batch = device_rate_limit("records_batch", rate=0.5, burst=10)
+
+@router.post("", dependencies=[Depends(limit_records)])
+@router.post("/", dependencies=[Depends(limit_records)])
 async def post_records(
     req: Request,
     device_id: str = Depends(verify_device),
     x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
+    prefer: Optional[str] = Header(default=None),
 ):
     """Submit sensor data from devices.
 
-    Expected payload from device: {"spo2": number, "heart_rate": number}
+    Expected payload from device:
+    {"spo2": number, "heart_rate": number, "seq": number (optional), "boot": string (optional)}
     Server will stamp current timestamp (ms) and determine userId from device registry.
+    A retried upload with an already-stored `boot` and `seq` gets the original
+    key back (`"duplicate": true`) and is not written again (see api/dedup.py).
+    With `Prefer: respond-async` the record is queued for a background write and
+    the server answers 202 without waiting for RTDB. Bodies and responses may be
+    MessagePack (see api/codec.py).
     """
-    body = await req.json()
+    body = await read_body(req)
+    if not isinstance(body, dict):
+        raise HTTPException(400, "Expected an object body")
 
     # Validate input fields (accept legacy 'hr' as alias for 'heart_rate')
-    spo2 = body.get("spo2")
-    heart_rate = body.get("heart_rate", body.get("hr"))
-    if spo2 is None or heart_rate is None:
-        raise HTTPException(400, "Missing spo2 or heart_rate")
+    spo2, heart_rate = parse_vitals(body.get("spo2"), body.get("heart_rate", body.get("hr")))
+
+    seq = parse_seq(body.get("seq"))
+    boot = parse_boot(body.get("boot"))
 
     # Determine/validate user for this device
-    # If X-User-Id is provided, validate against multi-user mapping
-    if x_user_id:
-        allowed = db.reference(f"/device_users/{device_id}/{x_user_id}").get()
-        if not allowed:
-            # backward-compat: also allow legacy single binding if matches
-            legacy_user = db.reference(f"/devices/{device_id}/user_id").get()
-            if legacy_user != x_user_id:
-                raise HTTPException(401, "User not allowed for this device")
-        user_id = x_user_id
-    else:
-        # Backward-compat: fall back to legacy single user binding
-        device_info = db.reference(f"/devices/{device_id}").get()
-        user_id = device_info.get("user_id") if device_info else None
-        if not user_id:
-            raise HTTPException(409, "Device is not yet registered to any user")
-
-    # Compose record and stamp server time
-    record = {
-        "userId": user_id,
-        "device_id": device_id,
-        "spo2": spo2,
-        "heart_rate": heart_rate,
-        "ts": int(time.time() * 1000),
-    }
+    user_id = resolve_record_user(device_id, x_user_id)
 
-    # Generate key and perform fan-out write to both global and per-user paths
-    records_ref = db.reference("/records")
-    key = records_ref.push({"_tmp": True}).key  # reserve a key
-    root_ref = db.reference("/")
-    updates = {
-        f"records/{key}": record,
-        f"user_records/{user_id}/{key}": record,
-    }
-    root_ref.update(updates)
+    # Compose record, stamp server time and generate its key locally
+    entries, keys = compose_entries(device_id, user_id, [(spo2, heart_rate, int(time.time() * 1000), seq, boot)])
+    key = keys[0]
+    if not entries:
+        # Retry of an upload we already stored: answer with the original key
+        return negotiated_response(req, {"status": "ok", "key": key, "duplicate": True})
+
+    # Fan-out write to both global and per-user paths
+    if wants_async(prefer):
+        _enqueue_or_throttle(entries)
+        remember_entries(device_id, entries)
+        return negotiated_response(req, {"status": "accepted", "key": key}, status_code=202)
+    write_records(entries)
+    remember_entries(device_id, entries)
 
-    return {"status": "ok", "key": key}
+    return negotiated_response(req, {"status": "ok", "key": key})
+
+@router.post("/batch", dependencies=[Depends(limit_records_batch)])
+async def post_records_batch(
+    req: Request,
+    device_id: str = Depends(verify_device),
+    x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
+    prefer: Optional[str] = Header(default=None),
+):
+    """Submit several buffered samples from one device in a single request.
+
+    Expected payload: [{"spo2": number, "heart_rate": number, "ts_offset": number}, ...]
+    (or {"samples": [...]}). `ts_offset` is the sample age relative to the time the
+    server receives the batch, in ms (0 or negative). Device credentials and the user
+    binding are checked once and all samples are written in one multi-path update.
+    Samples may carry a `seq` and `boot`; already-stored samples are skipped and reported
+    with their original key in `keys` (counted in `duplicates`).
+    Supports `Prefer: respond-async` and MessagePack like the single-sample endpoint.
+    """
+    body = await read_body(req)
+    samples = body.get("samples") if isinstance(body, dict) else body
+    if not isinstance(samples, list) or not samples:
+        raise HTTPException(400, "Expected a non-empty array of samples")
+    if len(samples) > MAX_BATCH_SAMPLES:
+        raise HTTPException(413, f"Too many samples (max {MAX_BATCH_SAMPLES})")
+
+    received_at = int(time.time() * 1000)
+    parsed = [parse_sample(sample, index, received_at) for index, sample in enumerate(samples)]
+
+    user_id = resolve_record_user(device_id, x_user_id)
+
+    entries, keys = compose_entries(device_id, user_id, parsed)
+    result = {"count": len(entries), "keys": keys, "duplicates": len(keys) - len(entries)}
+    if not entries:
+        return negotiated_response(req, {"status": "ok", **result})
+    if wants_async(prefer):
+        _enqueue_or_throttle(entries)
+        remember_entries(device_id, entries)
+        return negotiated_response(req, {"status": "accepted", **result}, status_code=202)
+    write_records(entries)
+    remember_entries(device_id, entries)
+
+    return negotiated_response(req, {"status": "ok", **result})
+
+def _enqueue_or_throttle(entries):
+    """Hand records to the write-behind queue or signal backpressure."""
+    if not ingest_queue.offer(entries):
+        raise HTTPException(429, "Ingest queue is full, retry later", headers={"Retry-After": "1"})
 
 @router.get("")
 @router.get("/")
 async def get_records(
+    req: Request,
+    response: Response,
     user = Depends(verify_firebase_token),
-    limit: int = 1000
+    limit: int = 1000,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    before: Optional[str] = None,
+    max_points: Optional[int] = None,
+    format: str = "rows",
+    if_none_match: Optional[str] = Header(default=None),
 ):
-    """Get user's health records"""
+    """Get user's health records, newest first.
+
+    With no range parameters this returns a plain list of the newest `limit`
+    records. With `start_ts`/`end_ts` (ms, inclusive) and/or a `before` cursor
+    it returns one page as {"records": [...], "next_cursor": str | null,
+    "watermark": int}; pass `next_cursor` back as `before` to fetch the next
+    (older) page, and `watermark` to GET /api/records/since to poll for new data.
+    With `max_points` the whole window is returned in one response, reduced to
+    at most `max_points` records by LTTB (see api/downsample.py), with
+    `downsampled_from` set to the number of records in the window.
+    `format=columnar` sends the records as {"id": [...], "ts": [...],
+    "heart_rate": [...], "spo2": [...]} (compressed if the client accepts it).
+    Responses carry an ETag; a matching `If-None-Match` gets 304 (see api/etags.py).
+    """
     user_id = user.get("uid")
-    
-    # Query records for this user from per-user folder
-    user_records_ref = db.reference(f"/user_records/{user_id}")
+    if limit < 1 or limit > MAX_RECORDS_PAGE:
+        raise HTTPException(400, f"limit must be between 1 and {MAX_RECORDS_PAGE}")
+    if max_points is not None:
+        if max_points < 3 or max_points > MAX_RECORDS_PAGE:
+            raise HTTPException(400, f"max_points must be between 3 and {MAX_RECORDS_PAGE}")
+        if before is not None:
+            raise HTTPException(400, "max_points cannot be combined with a cursor")
+    if format not in RECORD_FORMATS:
+        raise HTTPException(400, f"format must be one of: {', '.join(RECORD_FORMATS)}")
+
+    # Read before the records, so a record stored in between only costs an extra 200
+    newest_key = newest_record_key(user_id)
+    etag = make_etag("records", newest_key, limit, start_ts, end_ts, before, max_points, format)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    if start_ts is None and end_ts is None and before is None and max_points is None:
+        # Newest records, from the in-process buffer while it is current
+        result = recent_user_records(user_id, limit, newest_key)
+    else:
+        if start_ts is not None and end_ts is not None and start_ts > end_ts:
+            raise HTTPException(400, "start_ts must not be after end_ts")
+        watermark = int(time.time() * 1000)
+        if max_points is not None:
+            window = query_recent_records(user_id, MAX_AGGREGATE_RECORDS, start_ts, end_ts, newest_key)
+            records = downsample_records(window, max_points)
+            records.reverse()
+            result = {
+                "records": records,
+                "next_cursor": None,
+                "watermark": watermark,
+                "downsampled_from": len(window),
+                "truncated": len(window) >= MAX_AGGREGATE_RECORDS,
+            }
+        else:
+            try:
+                # The first page of a live window usually comes from the in-process buffer
+                records, next_cursor = page_user_records(
+                    user_id, limit, start_ts, end_ts, before,
+                    query=partial(query_recent_records, newest_key=newest_key),
+                )
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+            result = {"records": records, "next_cursor": next_cursor, "watermark": watermark}
+
+    if format == "columnar":
+        return _columnar_response(req, result, etag)
+    return result
+
+def _columnar_response(req: Request, result, etag: str) -> Response:
+    """Re-shape a get_records result into columns and encode it compactly."""
+    if isinstance(result, list):
+        content = columnar(result)
+    else:
+        content = {**result, "records": columnar(result["records"])}
+    columnar_response = compact_json_response(req, content)
+    set_etag(columnar_response, etag)
+    return columnar_response
+
+@router.get("/since")
+async def get_records_since(
+    ts: int,
+    user = Depends(verify_firebase_token),
+    limit: int = 1000,
+    after: Optional[str] = None,
+):
+    """Delta sync: records stored after the watermark `ts` (ms).
+
+    Returns {"records": [...], "watermark": int, "has_more": bool,
+    "next_after": str | null}. Poll with the returned watermark; a response
+    may repeat a few records from just before it, so merge by `id`. While
+    `has_more` is set, pass `next_after` back as `after` (with the new
+    watermark) to get the rest. Start from the `watermark` of a paged
+    GET /api/records response.
+    """
+    if limit < 1 or limit > MAX_RECORDS_PAGE:
+        raise HTTPException(400, f"limit must be between 1 and {MAX_RECORDS_PAGE}")
+    if ts < 0:
+        raise HTTPException(400, "ts must not be negative")
+    if after is not None and len(after) != 20:
+        raise HTTPException(400, "Invalid after key")
+    records, watermark, next_after = read_user_records_since(user.get("uid"), ts, limit, after)
+    return {"records": records, "watermark": watermark, "has_more": next_after is not None, "next_after": next_after}
+
+@router.get("/stream")
+async def stream_records(
+    req: Request,
+    user = Depends(verify_firebase_token),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    last_event_id_param: Optional[str] = Query(default=None, alias="last_event_id"),
+    since: Optional[int] = None,
+):
+    """Live feed of new records as Server-Sent Events (see api/record_stream.py).
+
+    To resume after a disconnect, send the last received event ID as
+    `Last-Event-ID` (or the `last_event_id` query parameter); `since` (ms)
+    resumes from a watermark such as the one returned by GET /api/records.
+    Without either, only records stored after connecting are sent.
+    """
+    if since is not None and since < 0:
+        raise HTTPException(400, "since must not be negative")
+    try:
+        resume_from = resume_point(last_event_id or last_event_id_param, since)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return StreamingResponse(
+        record_events(req, user.get("uid"), resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/rollups")
+async def get_rollups(
+    user = Depends(verify_firebase_token),
+    granularity: str = "hour",
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    limit: int = 500,
+):
+    """Get pre-aggregated vitals buckets (minute/hour/day) for charts.
+
+    Defaults to the most recent `limit` buckets ending now. Each bucket carries
+    count/mean/min/max for heart_rate and spo2 (see api/rollups.py).
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(400, f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if limit < 1 or limit > MAX_ROLLUP_BUCKETS:
+        raise HTTPException(400, f"limit must be between 1 and {MAX_ROLLUP_BUCKETS}")
+    user_id = user.get("uid")
+
+    end_ts = end_ts if end_ts is not None else int(time.time() * 1000)
+    if start_ts is None:
+        start_ts = end_ts - GRANULARITIES[granularity] * limit
+    if start_ts > end_ts:
+        raise HTTPException(400, "start_ts must not be after end_ts")
+    first_bucket = bucket_start(start_ts, granularity)
+
+    rollups_ref = db.reference(f"/user_rollups/{user_id}/{granularity}")
     try:
-        records = (
-            user_records_ref
-            .order_by_child("ts")
+        buckets = (
+            rollups_ref
+            .order_by_key()
+            .start_at(str(first_bucket))
+            .end_at(str(end_ts))
             .limit_to_last(limit)
             .get()
         )
     except fa_exceptions.InvalidArgumentError:
-        # Fallback when RTDB index is not defined in local/test environments
-        records = user_records_ref.get() or {}
-    
-    if not records:
-        return []
-    
-    # Convert to list format
-    records_list = []
-    for key, value in records.items():
-        record = {"id": key, **value}
-        records_list.append(record)
-    
-    # Sort by timestamp descending
-    records_list.sort(key=lambda x: x.get("ts", 0), reverse=True)
-    
-    # Trim to requested limit after sorting (in case of fallback path)
-    return records_list[:limit]
+        buckets = rollups_ref.get() or {}
+
+    result = []
+    for key, value in (buckets or {}).items():
+        try:
+            bucket = int(key)
+        except (TypeError, ValueError):
+            continue
+        if first_bucket <= bucket <= end_ts and isinstance(value, dict):
+            result.append(summarize_rollup(bucket, value))
+    result.sort(key=lambda x: x["bucket"])
+    return {"granularity": granularity, "buckets": result[-limit:]}
+
+@router.get("/aggregate")
+async def get_aggregate(
+    user = Depends(verify_firebase_token),
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    bucket: str = "1h",
+):
+    """Per-bucket mean/min/max/p10/p90 of heart_rate and spo2 over raw records.
+
+    `start`/`end` are ms (inclusive; default: the last 24 hours) and `bucket`
+    is one of 5m/1h/1d. Returns {"bucket", "start", "end", "buckets": [...],
+    "truncated": bool}; `truncated` means the window held more than
+    MAX_AGGREGATE_RECORDS records and only the newest were used (the stored
+    rollups at GET /api/records/rollups cover any range cheaply, without
+    percentiles).
+    """
+    if bucket not in BUCKETS:
+        raise HTTPException(400, f"bucket must be one of: {', '.join(BUCKETS)}")
+    bucket_ms = BUCKETS[bucket]
+    end = end if end is not None else int(time.time() * 1000)
+    start = start if start is not None else end - 86_400_000
+    if start > end:
+        raise HTTPException(400, "start must not be after end")
+    if (end - start) // bucket_ms >= MAX_ROLLUP_BUCKETS:
+        raise HTTPException(400, f"Range spans more than {MAX_ROLLUP_BUCKETS} buckets; use a larger bucket")
+
+    records = query_user_records(user.get("uid"), MAX_AGGREGATE_RECORDS, start, end)
+    return {
+        "bucket": bucket,
+        "start": start,
+        "end": end,
+        "buckets": aggregate_records(records, bucket_ms),
+        "truncated": len(records) >= MAX_AGGREGATE_RECORDS,
+    }
+
+@router.get("/export")
+async def export_records(
+    user = Depends(verify_firebase_token),
+    format: str = "ndjson",
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+):
+    """Download the user's full history as NDJSON or CSV (see api/export.py).
+
+    `start`/`end` are optional ms bounds on `ts` (inclusive). Records are read
+    in bounded pages and streamed, so any history length is served in
+    constant memory. Rows come in storage (ingest) order.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if start is not None and end is not None and start > end:
+        raise HTTPException(400, "start must not be after end")
+    records = iter_export_records(user.get("uid"), start, end)
+    filename = f"records-{int(time.time())}.{format}"
+    return StreamingResponse(
+        encode_export(records, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
 
 @router.get("/check-auth")
 async def check_records_auth(user = Depends(verify_firebase_token)):
@@ -132,40 +425,50 @@ async def register_device(req: Request, user = Depends(verify_firebase_token)):
         raise HTTPException(400, "Missing device_id or device_secret")
     
     user_id = user.get("uid")
-    device_ref = db.reference(f"/devices/{device_id}")
-    existing = device_ref.get()
+    access = load_device_access(device_id, fresh=True)
 
     # Enforce: device must pre-exist and have a secret provisioned by the system
-    if not existing:
+    if not access.exists:
         raise HTTPException(404, "Device not found. Please contact support.")
 
     # Secret must match exactly
-    if existing.get("secret") != device_secret:
+    if not check_device_secret(device_id, device_secret):
         raise HTTPException(401, "Invalid device credentials")
 
     # Check if user is already registered for this device
-    device_user_ref = db.reference(f"/device_users/{device_id}/{user_id}")
-    if device_user_ref.get():
+    if user_id in access.members:
         return {"status": "ok", "message": "Device already registered to this user"}
 
+    now = int(time.time() * 1000)
+    registered_at = access.registered_at or now
+    updates = {}
+
     # For backward compatibility, check legacy single user binding
-    legacy_user = existing.get("user_id")
-    if legacy_user and legacy_user != user_id:
-        # Device has legacy single user - convert to multi-user format
-        # Add the legacy user to the new multi-user structure
-        legacy_user_ref = db.reference(f"/device_users/{device_id}/{legacy_user}")
-        legacy_user_ref.set({"registered_at": existing.get("registered_at", int(time.time() * 1000))})
-        
-        # Remove the legacy user_id field from device
-        device_ref.child("user_id").delete()
-
-    # Add current user to device_users mapping
-    device_user_ref.set({"registered_at": int(time.time() * 1000)})
-    
+    legacy_owner = access.owner if access.owner and access.owner != user_id else None
+    if legacy_owner:
+        # Remove the legacy user_id field from device once it is in device_users
+        updates[f"devices/{device_id}/user_id"] = None
+
+    def add_user(members):
+        if legacy_owner:
+            # Device has legacy single user - convert to multi-user format
+            members.setdefault(legacy_owner, {"registered_at": registered_at})
+        members[user_id] = {"registered_at": now}
+        return members
+
+    # Add current user to device_users mapping (a transaction, so concurrent changes all land)
+    access = change_device_members(access, add_user)
+    owner = None if legacy_owner else access.owner
+
     # Update device registration timestamp if not set
-    if not existing.get("registered_at"):
-        device_ref.update({"registered_at": int(time.time() * 1000)})
+    if not access.registered_at:
+        updates[f"devices/{device_id}/registered_at"] = now
 
+    # Then the /user_devices entries of the users this changed
+    changed = {uid: access.members[uid] for uid in (user_id, legacy_owner) if uid in access.members}
+    updates.update(user_device_entries(device_id, changed, owner, registered_at))
+    db.reference("/").update(updates)
+    remember_device_access(replace(access, owner=owner, registered_at=registered_at))
     return {"status": "ok", "message": "Device registered successfully"}
 
 @router.post("/device/{device_id}/add-user")
@@ -185,20 +488,16 @@ async def add_user_to_device(
     current_user_id = user.get("uid")
     
     # Verify device exists and secret is correct
-    device_ref = db.reference(f"/devices/{device_id}")
-    device_info = device_ref.get()
+    access = load_device_access(device_id, fresh=True)
     
-    if not device_info:
+    if not access.exists:
         raise HTTPException(404, "Device not found")
     
-    if device_info.get("secret") != device_secret:
+    if not check_device_secret(device_id, device_secret):
         raise HTTPException(401, "Invalid device credentials")
     
     # Verify current user has access to this device
-    current_user_access = db.reference(f"/device_users/{device_id}/{current_user_id}").get()
-    legacy_user = device_info.get("user_id")
-    
-    if not current_user_access and legacy_user != current_user_id:
+    if not access.allows(current_user_id):
         raise HTTPException(403, "You don't have permission to add users to this device")
     
     # Find target user by email using Firebase Auth
@@ -210,15 +509,15 @@ async def add_user_to_device(
         raise HTTPException(404, f"User with email {target_user_email} not found")
     
     # Check if target user is already registered
-    target_user_ref = db.reference(f"/device_users/{device_id}/{target_user_id}")
-    if target_user_ref.get():
+    if target_user_id in access.members:
         return {"status": "ok", "message": "User is already registered to this device"}
     
-    # Add target user to device
-    target_user_ref.set({
-        "registered_at": int(time.time() * 1000),
-        "added_by": current_user_id
-    })
+    # Add target user to device (a transaction, so concurrent shares all land)
+    entry = {"registered_at": int(time.time() * 1000), "added_by": current_user_id}
+    access = change_device_members(access, lambda members: {**members, target_user_id: entry})
+    # Then the device to the target's index
+    db.reference("/").update(user_device_entries(device_id, {target_user_id: entry}))
+    remember_device_access(access)
     
     return {"status": "ok", "message": f"User {target_user_email} added to device successfully"}
 
@@ -232,38 +531,24 @@ async def remove_user_from_device(
     current_user_id = user.get("uid")
     
     # Verify device exists
-    device_ref = db.reference(f"/devices/{device_id}")
-    device_info = device_ref.get()
+    access = load_device_access(device_id, fresh=True)
     
-    if not device_info:
+    if not access.exists:
         raise HTTPException(404, "Device not found")
     
     # Verify current user has access to this device
-    current_user_access = db.reference(f"/device_users/{device_id}/{current_user_id}").get()
-    legacy_user = device_info.get("user_id")
-    
-    if not current_user_access and legacy_user != current_user_id:
+    if not access.allows(current_user_id):
         raise HTTPException(403, "You don't have permission to remove users from this device")
     
-    # Cannot remove yourself if you're the only user
-    device_users_ref = db.reference(f"/device_users/{device_id}")
-    all_device_users = device_users_ref.get() or {}
-    
-    if legacy_user:
-        # Count legacy user as one user
-        total_users = len(all_device_users) + 1
-    else:
-        total_users = len(all_device_users)
-    
-    if current_user_id == target_user_id and total_users <= 1:
+    # Cannot remove yourself if you're the only user (legacy owner counts as one user)
+    if current_user_id == target_user_id and access.user_count <= 1:
         raise HTTPException(400, "Cannot remove the last user from device")
     
     # Remove target user
-    target_user_ref = db.reference(f"/device_users/{device_id}/{target_user_id}")
-    if not target_user_ref.get():
+    if target_user_id not in access.members:
         raise HTTPException(404, "User is not registered to this device")
     
-    target_user_ref.delete()
+    _remove_device_member(access, target_user_id)
     
     return {"status": "ok", "message": "User removed from device successfully"}
 
@@ -283,17 +568,13 @@ async def remove_user_from_device_by_email(
     current_user_id = user.get("uid")
     
     # Verify device exists
-    device_ref = db.reference(f"/devices/{device_id}")
-    device_info = device_ref.get()
+    access = load_device_access(device_id, fresh=True)
     
-    if not device_info:
+    if not access.exists:
         raise HTTPException(404, "Device not found")
     
     # Verify current user has access to this device
-    current_user_access = db.reference(f"/device_users/{device_id}/{current_user_id}").get()
-    legacy_user = device_info.get("user_id")
-    
-    if not current_user_access and legacy_user != current_user_id:
+    if not access.allows(current_user_id):
         raise HTTPException(403, "You don't have permission to remove users from this device")
     
     # Find user ID by email
@@ -307,126 +588,124 @@ async def remove_user_from_device_by_email(
         raise HTTPException(400, f"Error looking up user: {str(e)}")
     
     # Check if user is registered to this device
-    device_users_ref = db.reference(f"/device_users/{device_id}")
-    all_device_users = device_users_ref.get() or {}
-    
-    if target_user_id not in all_device_users and legacy_user != target_user_id:
+    if not access.allows(target_user_id):
         raise HTTPException(404, "User is not registered to this device")
     
-    # Cannot remove yourself if you're the only user
-    if legacy_user:
-        # Count legacy user as one user
-        total_users = len(all_device_users) + 1
-    else:
-        total_users = len(all_device_users)
-    
-    if current_user_id == target_user_id and total_users <= 1:
+    # Cannot remove yourself if you're the only user (legacy owner counts as one user)
+    if current_user_id == target_user_id and access.user_count <= 1:
         raise HTTPException(400, "Cannot remove the last user from device")
     
     # Remove target user
-    if target_user_id in all_device_users:
-        target_user_ref = db.reference(f"/device_users/{device_id}/{target_user_id}")
-        target_user_ref.delete()
-    elif legacy_user == target_user_id:
+    if target_user_id in access.members:
+        _remove_device_member(access, target_user_id)
+    elif access.owner == target_user_id:
         # Cannot remove legacy user without migrating device ownership
         raise HTTPException(400, "Cannot remove the device owner. Transfer ownership first.")
     
     return {"status": "ok", "message": "User removed from device successfully"}
 
+def _remove_device_member(access, target_user_id: str) -> None:
+    """Drop a member in a transaction, then their index entry."""
+    device_id = access.device_id
+    access = change_device_members(
+        access, lambda members: {uid: data for uid, data in members.items() if uid != target_user_id}
+    )
+    if target_user_id == access.owner:
+        # Still the legacy owner: their entry goes back to the legacy form
+        updates = user_device_entries(device_id, {}, access.owner, access.registered_at)
+    else:
+        updates = user_device_entries(device_id, {}, removed=[target_user_id])
+    db.reference("/").update(updates)
+    remember_device_access(access)
+
 @router.get("/device/{device_id}/users")
 async def get_device_users(device_id: str, user = Depends(verify_firebase_token)):
     """Get list of users registered to a device"""
     current_user_id = user.get("uid")
     
     # Verify device exists
-    device_ref = db.reference(f"/devices/{device_id}")
-    device_info = device_ref.get()
+    access = load_device_access(device_id)
     
-    if not device_info:
+    if not access.exists:
         raise HTTPException(404, "Device not found")
     
     # Verify current user has access to this device
-    current_user_access = db.reference(f"/device_users/{device_id}/{current_user_id}").get()
-    legacy_user = device_info.get("user_id")
-    
-    if not current_user_access and legacy_user != current_user_id:
+    if not access.allows(current_user_id):
         raise HTTPException(403, "You don't have permission to view users of this device")
     
-    # Get all users for this device
-    device_users_ref = db.reference(f"/device_users/{device_id}")
-    device_users = device_users_ref.get() or {}
-    
     users_list = []
-    
-    # Add legacy user if exists
-    if legacy_user:
-        from firebase_admin import auth
-        try:
-            legacy_user_info = auth.get_user(legacy_user)
-            users_list.append({
-                "user_id": legacy_user,
-                "email": legacy_user_info.email,
-                "registered_at": device_info.get("registered_at"),
-                "is_legacy": True
-            })
-        except Exception:
-            # Skip if user no longer exists
-            pass
+    # One batched (and cached) Auth lookup for everyone on the device
+    infos = lookup_users([access.owner, *access.members])
+    
+    # Add legacy user if exists (skipped if the user no longer exists)
+    legacy_user = access.owner
+    if legacy_user and infos.get(legacy_user):
+        users_list.append({
+            "user_id": legacy_user,
+            "email": infos[legacy_user]["email"],
+            "registered_at": access.registered_at,
+            "is_legacy": True
+        })
     
     # Add multi-user entries
-    from firebase_admin import auth
-    for user_id, user_data in device_users.items():
-        try:
-            user_info = auth.get_user(user_id)
-            users_list.append({
-                "user_id": user_id,
-                "email": user_info.email,
-                "registered_at": user_data.get("registered_at"),
-                "added_by": user_data.get("added_by"),
-                "is_legacy": False
-            })
-        except Exception:
+    for user_id, user_data in access.members.items():
+        if not infos.get(user_id):
             # Skip if user no longer exists
             continue
+        users_list.append({
+            "user_id": user_id,
+            "email": infos[user_id]["email"],
+            "registered_at": user_data.get("registered_at"),
+            "added_by": user_data.get("added_by"),
+            "is_legacy": False
+        })
     
     return {"device_id": device_id, "users": users_list}
 
 @router.get("/user/devices")
-async def get_user_devices(user = Depends(verify_firebase_token)):
-    """Get list of devices registered to current user"""
+async def get_user_devices(
+    response: Response,
+    user = Depends(verify_firebase_token),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """Get list of devices registered to current user
+
+    Served from the user's `/user_devices/{uid}` index (see
+    api/device_access.py): one read, however many devices exist, once the
+    index has been rebuilt; until then from a scan of all devices.
+    `user_count` comes from each device's cached access policy (a read of
+    the device only when it isn't cached), never from the index, and
+    entries for devices the user no longer has access to are skipped.
+    The ETag is a hash of the list; a matching `If-None-Match` gets 304, without
+    any RTDB read while the list's validator is cached (see api/etags.py).
+    """
     user_id = user.get("uid")
+    cached_etag = cached_validator("devices", user_id)
+    if cached_etag is not MISSING and etag_matches(if_none_match, cached_etag):
+        return not_modified(cached_etag)
     
     devices_list = []
+    index = read_user_devices(user_id)
     
-    # Check for legacy single-user devices
-    devices_ref = db.reference("/devices")
-    all_devices = devices_ref.get() or {}
-    
-    for device_id, device_data in all_devices.items():
-        if device_data.get("user_id") == user_id:
-            devices_list.append({
-                "device_id": device_id,
-                "registered_at": device_data.get("registered_at"),
-                "is_legacy": True,
-                "user_count": 1
-            })
-    
-    # Check for multi-user devices
-    device_users_ref = db.reference("/device_users")
-    all_device_users = device_users_ref.get() or {}
-    
-    for device_id, users_data in all_device_users.items():
-        if user_id in users_data:
-            # Skip if already added as legacy device
-            if any(d["device_id"] == device_id for d in devices_list):
-                continue
-                
-            devices_list.append({
-                "device_id": device_id,
-                "registered_at": users_data[user_id].get("registered_at"),
-                "added_by": users_data[user_id].get("added_by"),
-                "is_legacy": False,
-                "user_count": len(users_data)
-            })
-    
+    for device_id, entry in sorted(index.items()):
+        if not isinstance(entry, dict):
+            continue
+        access = load_device_access(device_id)
+        if not access.allows(user_id):
+            continue
+        device = {
+            "device_id": device_id,
+            "registered_at": entry.get("registered_at"),
+            "is_legacy": bool(entry.get("is_legacy")),
+            "user_count": access.user_count
+        }
+        if not device["is_legacy"]:
+            device["added_by"] = entry.get("added_by")
+        devices_list.append(device)
+    
+    etag = make_etag("devices", devices_list)
+    remember_validator("devices", user_id, etag)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return {"devices": devices_list}
@@ -0,0 +1,128 @@
+# api/rollups.py
+"""Per-user vitals rollups maintained at ingest time.
+
+Layout: `/user_rollups/{uid}/{granularity}/{bucket_start_ms}` where each bucket
+holds a count plus count/sum/min/max for `heart_rate` and `spo2`. Buckets are
+UTC-aligned and keyed by their start timestamp (13-digit ms, so key order is
+time order).
+
+`merge_rollups` is commutative and associative, so records can be folded in
+any order or grouping. Writers fold a batch locally and apply one RTDB
+transaction per touched bucket, which keeps concurrent writers correct.
+Ingest does this after each write, or on the derived-data queue
+(api/ingest_queue.py) when DERIVED_WRITE_BEHIND is set, so several
+requests' records share each transaction.
+"""
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from firebase_admin import db
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "True").lower() in ("true", "1", "yes")
+
+GRANULARITIES = {
+    "minute": 60_000,
+    "hour": 3_600_000,
+    "day": 86_400_000,
+}
+METRICS = ("heart_rate", "spo2")
+
+BucketId = Tuple[str, str, int]
+
+
+def bucket_start(ts: int, granularity: str) -> int:
+    size = GRANULARITIES[granularity]
+    return ts - ts % size
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def record_rollup(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Rollup of a single record."""
+    rollup: Dict[str, Any] = {"count": 1}
+    for metric in METRICS:
+        value = record.get(metric)
+        if metric == "heart_rate" and value is None:
+            value = record.get("hr", record.get("bpm"))
+        if _is_number(value):
+            rollup[metric] = {"count": 1, "sum": value, "min": value, "max": value}
+    return rollup
+
+
+def merge_rollups(a: Optional[Dict[str, Any]], b: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine two rollups (order-independent)."""
+    a = a if isinstance(a, dict) else {}
+    b = b if isinstance(b, dict) else {}
+    merged: Dict[str, Any] = {"count": (a.get("count") or 0) + (b.get("count") or 0)}
+    for metric in METRICS:
+        x, y = a.get(metric), b.get(metric)
+        if not isinstance(x, dict):
+            x = None
+        if not isinstance(y, dict):
+            y = None
+        if x is None and y is None:
+            continue
+        if x is None or y is None:
+            merged[metric] = dict(x or y)
+            continue
+        merged[metric] = {
+            "count": x["count"] + y["count"],
+            "sum": x["sum"] + y["sum"],
+            "min": min(x["min"], y["min"]),
+            "max": max(x["max"], y["max"]),
+        }
+    return merged
+
+
+def compute_rollups(records: Iterable[Dict[str, Any]], granularities: Iterable[str] = GRANULARITIES) -> Dict[BucketId, Dict[str, Any]]:
+    """Fold records into {(uid, granularity, bucket_start): rollup}."""
+    granularities = list(granularities)
+    result: Dict[BucketId, Dict[str, Any]] = {}
+    for record in records:
+        uid = record.get("userId")
+        ts = record.get("ts")
+        if not uid or not _is_number(ts):
+            continue
+        single = record_rollup(record)
+        for granularity in granularities:
+            bucket = (uid, granularity, bucket_start(int(ts), granularity))
+            result[bucket] = merge_rollups(result.get(bucket), single)
+    return result
+
+
+def rollup_path(uid: str, granularity: str, bucket: int) -> str:
+    return f"/user_rollups/{uid}/{granularity}/{bucket}"
+
+
+def apply_rollups(records: Iterable[Dict[str, Any]]) -> int:
+    """Merge records into stored rollups; one transaction per touched bucket."""
+    if not ROLLUPS_ENABLED:
+        return 0
+    deltas = compute_rollups(records)
+    for (uid, granularity, bucket), delta in deltas.items():
+        db.reference(rollup_path(uid, granularity, bucket)).transaction(
+            lambda current, delta=delta: merge_rollups(current, delta)
+        )
+    return len(deltas)
+
+
+def summarize_rollup(bucket: int, rollup: Dict[str, Any]) -> Dict[str, Any]:
+    """Client-facing view of a stored bucket with means filled in."""
+    summary: Dict[str, Any] = {"bucket": bucket, "count": rollup.get("count", 0)}
+    for metric in METRICS:
+        stats = rollup.get(metric)
+        if isinstance(stats, dict) and stats.get("count"):
+            summary[metric] = {
+                "count": stats["count"],
+                "mean": stats["sum"] / stats["count"],
+                "min": stats["min"],
+                "max": stats["max"],
+            }
+        else:
+            summary[metric] = None
+    return summary
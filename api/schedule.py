@@ -10,6 +10,8 @@ import pytz
 import logging
 import atexit
 from .auth import verify_firebase_token
+from .device_access import load_device_access, user_can_access_device
+from .mqtt_ingest import VITALS_TOPIC, handle_vitals_message, vitals_device_id
 import os
 
 try:
@@ -34,6 +36,8 @@ MQTT_USERNAME = "phamngocthai"
 MQTT_PASSWORD = "Thai2005"
 # Set MOCK_MQTT from environment variable (default: False)
 MOCK_MQTT = os.getenv("MOCK_MQTT", "False").lower() in ("true", "1", "yes")
+# Subscribe to devices/+/vitals and ingest readings (default: True)
+MQTT_INGEST_ENABLED = os.getenv("MQTT_INGEST_ENABLED", "True").lower() in ("true", "1", "yes")
 
 # Global MQTT client for persistent connection
 mqtt_client = None
@@ -58,6 +62,11 @@ def mqtt_on_connect(client, userdata, flags, rc):
         for device_id in device_subscriptions:
             client.subscribe(device_id, qos=1)
             logger.info(f"MQTT resubscribed to topic: {device_id}")
+        
+        # Vitals ingestion channel (devices/{id}/vitals)
+        if MQTT_INGEST_ENABLED:
+            client.subscribe(VITALS_TOPIC, qos=1)
+            logger.info(f"MQTT subscribed to vitals topic: {VITALS_TOPIC}")
     else:
         mqtt_connected = False
         logger.error(f"MQTT connection failed with code {rc}")
@@ -76,6 +85,13 @@ def mqtt_on_subscribe(client, userdata, mid, granted_qos):
 
 def mqtt_on_message(client, userdata, message):
     """Callback for MQTT message reception"""
+    if vitals_device_id(message.topic):
+        # Legacy vitals payloads carry the device secret, so never log vitals
+        try:
+            handle_vitals_message(message.topic, message.payload)
+        except Exception as e:
+            logger.error(f"MQTT vitals handling failed on {message.topic}: {str(e)}")
+        return
     logger.info(f"MQTT message received on topic {message.topic}: {message.payload.decode()}")
 
 def mqtt_on_publish(client, userdata, mid):
@@ -413,16 +429,12 @@ async def create_schedule(request: Request):
                 raise HTTPException(status_code=400, detail=f"Missing {field} in schedule_time")
         
         # Check device access
-        device_ref = db.reference(f"/devices/{device_id}")
-        device_data = device_ref.get()
+        access = load_device_access(device_id)
         
-        if not device_data:
+        if not access.exists:
             raise HTTPException(status_code=404, detail="Device not found")
         
-        device_users_ref = db.reference(f"/device_users/{device_id}")
-        device_users = device_users_ref.get()
-        
-        if not device_users or uid not in device_users:
+        if not access.allows(uid):
             raise HTTPException(status_code=403, detail="You don't have access to this device")
         
         # Get user's timezone
@@ -607,6 +619,7 @@ async def get_scheduler_status():
                 "username": MQTT_USERNAME,
                 "connected": mqtt_connected,
                 "mock_mode": MOCK_MQTT,
+                "ingest_enabled": MQTT_INGEST_ENABLED,
                 "subscriptions": list(device_subscriptions)
             }
         }
@@ -622,10 +635,7 @@ async def test_mqtt_notification(device_id: str, user=Depends(verify_firebase_to
         uid = user.get("uid")
         
         # Check device access
-        device_users_ref = db.reference(f"/device_users/{device_id}")
-        device_users = device_users_ref.get()
-        
-        if not device_users or uid not in device_users:
+        if not user_can_access_device(device_id, uid):
             raise HTTPException(403, "You don't have access to this device")
         
         # Send test notification
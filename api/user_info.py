@@ -0,0 +1,70 @@
+# api/user_info.py
+"""Cached, batched Firebase Auth lookups for showing users in device views.
+
+`lookup_users` resolves many uids at once: cached entries are served from
+memory and the rest are fetched with `auth.get_users`, AUTH_BATCH_SIZE
+identifiers per call, instead of one `auth.get_user` round trip per user.
+Users that don't exist are cached as None. If an Auth call fails, the users
+in that batch get uid-only entries (email and name None), which are not
+cached, so the next lookup retries them. Handlers that change or delete a
+user must call `forget_user_info`.
+"""
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional
+
+from firebase_admin import auth as firebase_auth
+
+from .cache import MISSING, TTLCache
+
+USER_INFO_CACHE_TTL = float(os.environ.get("USER_INFO_CACHE_TTL", "300"))
+USER_INFO_CACHE_SIZE = int(os.environ.get("USER_INFO_CACHE_SIZE", "10000"))
+# Most identifiers auth.get_users accepts per call
+AUTH_BATCH_SIZE = 100
+
+UserInfo = Dict[str, Any]
+
+logger = logging.getLogger(__name__)
+
+_user_info = TTLCache(
+    "user_info",
+    maxsize=USER_INFO_CACHE_SIZE,
+    ttl=USER_INFO_CACHE_TTL,
+)
+
+
+def lookup_users(uids: Iterable[Optional[str]]) -> Dict[str, Optional[UserInfo]]:
+    """uid -> {"email", "display_name"}, or None if the user doesn't exist.
+
+    Never raises for Auth errors: a failed batch comes back uid-only.
+    """
+    result: Dict[str, Optional[UserInfo]] = {}
+    missing = []
+    for uid in dict.fromkeys(uid for uid in uids if uid):
+        info = _user_info.get(uid, MISSING)
+        if info is MISSING:
+            missing.append(uid)
+        else:
+            result[uid] = info
+
+    for start in range(0, len(missing), AUTH_BATCH_SIZE):
+        batch = missing[start:start + AUTH_BATCH_SIZE]
+        try:
+            found = firebase_auth.get_users([firebase_auth.UidIdentifier(uid) for uid in batch])
+        except Exception as e:
+            logger.warning(f"Auth lookup of {len(batch)} users failed: {str(e)}")
+            for uid in batch:
+                result[uid] = {"email": None, "display_name": None}
+            continue
+        for user in found.users:
+            result[user.uid] = {"email": user.email, "display_name": user.display_name}
+        for uid in batch:
+            # Anything not returned is in found.not_found
+            result.setdefault(uid, None)
+            _user_info.set(uid, result[uid])
+    return result
+
+
+def forget_user_info(uid: str) -> None:
+    """Drop a cached entry after the user is updated or deleted."""
+    _user_info.invalidate(uid)
@@ -4,7 +4,7 @@ import LoadingSpinner from '../LoadingSpinner'
 import AnimatedElement from '../AnimatedElement'
 import styles from '../../styles/components/dashboard.module.css'
 
-const ChartsSection = ({ records, rangeHours, dateRange, dataLoading }) => {
+const ChartsSection = ({ records, rangeHours, dateRange, dataLoading, buckets = null, truncated = false }) => {
   if (dataLoading) {
     return (
       <AnimatedElement animation="fadeInUp" className={styles.chartLoading}>
@@ -25,6 +25,8 @@ const ChartsSection = ({ records, rangeHours, dateRange, dataLoading }) => {
           {dateRange?.start && dateRange?.end
             ? <>Dữ liệu {dateRange.start} → {dateRange.end} • {records?.length || 0} điểm dữ liệu</>
             : <>Chọn khoảng ngày để xem dữ liệu • {records?.length || 0} điểm dữ liệu</>}
+          {/* The aggregate only covered the newest records of the window */}
+          {truncated && <> • Chỉ hiển thị phần dữ liệu mới nhất của khoảng này</>}
         </div>
       </div>
       
@@ -42,7 +44,7 @@ const ChartsSection = ({ records, rangeHours, dateRange, dataLoading }) => {
             </div>
           </div>
           <div className={styles.chartWrapper}>
-            <HeartRateChart records={records} rangeHours={rangeHours} dateRange={dateRange} />
+            <HeartRateChart records={records} rangeHours={rangeHours} dateRange={dateRange} buckets={buckets} />
           </div>
         </AnimatedElement>
 
@@ -59,7 +61,7 @@ const ChartsSection = ({ records, rangeHours, dateRange, dataLoading }) => {
             </div>
           </div>
           <div className={styles.chartWrapper}>
-            <Spo2Chart records={records} rangeHours={rangeHours} dateRange={dateRange} />
+            <Spo2Chart records={records} rangeHours={rangeHours} dateRange={dateRange} buckets={buckets} />
           </div>
         </AnimatedElement>
       </div>
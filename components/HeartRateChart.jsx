@@ -12,10 +12,11 @@ import {
   Filler
 } from 'chart.js'
 import 'chartjs-adapter-date-fns'
+import { bandDatasets, summarizeBuckets, summarizeValues } from '../lib/chartSeries'
 
 ChartJS.register(TimeScale, LinearScale, PointElement, LineElement, Title, Tooltip, Legend, Filler)
 
-export default function HeartRateChart({ records, rangeHours, dateRange }) {
+export default function HeartRateChart({ records, rangeHours, dateRange, buckets = null }) {
   const toMs = (ts) => (!ts ? 0 : ts < 1e12 ? ts * 1000 : ts)
   const nowMs = Date.now()
   const cutoffMs = rangeHours != null ? nowMs - rangeHours * 3600 * 1000 : null
@@ -32,21 +33,20 @@ export default function HeartRateChart({ records, rangeHours, dateRange }) {
   const heartRateValues = filtered
     .map((r) => (typeof r.heart_rate === 'number' ? r.heart_rate : r.bpm))
     .filter((v) => typeof v === 'number' && !isNaN(v))
-  const minHeart = heartRateValues.length ? Math.min(...heartRateValues) : '-'
-  const maxHeart = heartRateValues.length ? Math.max(...heartRateValues) : '-'
-  const avgHeart = heartRateValues.length
-    ? heartRateValues.reduce((sum, v) => sum + v, 0) / heartRateValues.length
-    : '-'
-  const lastHeart = heartRateValues.length ? heartRateValues[heartRateValues.length - 1] : '-'
+  // Long ranges arrive as server-side buckets instead of raw records
+  const bucketStats = buckets ? buckets.filter((b) => b.heart_rate).map((b) => ({ t: b.bucket, ...b.heart_rate })) : null
+  const summary = bucketStats ? summarizeBuckets(bucketStats) : summarizeValues(heartRateValues)
+  const { min: minHeart, max: maxHeart, avg: avgHeart, last: lastHeart } = summary
 
-  const labels = filtered.map((r) => new Date(toMs(r.ts)))
+  const labels = bucketStats ? bucketStats.map((s) => new Date(s.t)) : filtered.map((r) => new Date(toMs(r.ts)))
 
   const chartData = {
     labels,
     datasets: [
+      ...(bucketStats ? bandDatasets(bucketStats, 'rgba(255, 107, 107, 0.15)') : []),
       {
         label: 'Nhịp tim (BPM)',
-        data: filtered.map((r) => r.heart_rate ?? r.bpm ?? 0),
+        data: bucketStats ? bucketStats.map((s) => s.mean) : filtered.map((r) => r.heart_rate ?? r.bpm ?? 0),
         borderColor: '#e25563',
         backgroundColor: (ctx) => {
           const { ctx: gctx, chartArea } = ctx.chart
@@ -56,7 +56,7 @@ export default function HeartRateChart({ records, rangeHours, dateRange }) {
           gradient.addColorStop(1, 'rgba(255, 107, 107, 0.02)')
           return gradient
         },
-        fill: 'origin',
+        fill: bucketStats ? false : 'origin',
         tension: 0.35,
         pointRadius: 0,
         borderWidth: 2.5
@@ -104,6 +104,7 @@ export default function HeartRateChart({ records, rangeHours, dateRange }) {
       tooltip: {
         mode: 'index',
         intersect: false,
+        filter: (item) => !['p10', 'p90'].includes(item.dataset.label),
         callbacks: {
           title: (items) => items?.[0]?.label || '',
           label: (item) => `Nhịp tim: ${item.formattedValue} BPM`
@@ -120,7 +121,7 @@ export default function HeartRateChart({ records, rangeHours, dateRange }) {
           Min: {minHeart}{minHeart !== '-' ? ' BPM' : ''} / Max: {maxHeart}{maxHeart !== '-' ? ' BPM' : ''} / Avg: {avgHeart !== '-' ? avgHeart.toFixed(1) + ' BPM' : '-'} / Last: {lastHeart}{lastHeart !== '-' ? ' BPM' : ''}
         </div>
       </div>
-      {filtered.length > 0 ? (
+      {(bucketStats ? bucketStats.length : filtered.length) > 0 ? (
         <div style={{ height: 360 }}>
           <Line data={chartData} options={chartOptions} />
         </div>
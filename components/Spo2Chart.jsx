@@ -12,10 +12,11 @@ import {
   Filler
 } from 'chart.js'
 import 'chartjs-adapter-date-fns'
+import { bandDatasets, summarizeBuckets, summarizeValues } from '../lib/chartSeries'
 
 ChartJS.register(TimeScale, LinearScale, PointElement, LineElement, Title, Tooltip, Legend, Filler)
 
-export default function Spo2Chart({ records, rangeHours, dateRange }) {
+export default function Spo2Chart({ records, rangeHours, dateRange, buckets = null }) {
   const toMs = (ts) => (!ts ? 0 : ts < 1e12 ? ts * 1000 : ts)
   const nowMs = Date.now()
   const cutoffMs = rangeHours != null ? nowMs - rangeHours * 3600 * 1000 : null
@@ -30,19 +31,20 @@ export default function Spo2Chart({ records, rangeHours, dateRange }) {
 
   // Tính toán các giá trị thống kê SpO2
   const spo2Values = filtered.map((r) => r.spo2).filter((v) => typeof v === 'number' && !isNaN(v))
-  const minSpo2 = spo2Values.length ? Math.min(...spo2Values) : '-'
-  const maxSpo2 = spo2Values.length ? Math.max(...spo2Values) : '-'
-  const avgSpo2 = spo2Values.length ? spo2Values.reduce((a, b) => a + b, 0) / spo2Values.length : '-'
-  const lastSpo2 = spo2Values.length ? spo2Values[spo2Values.length - 1] : '-'
+  // Long ranges arrive as server-side buckets instead of raw records
+  const bucketStats = buckets ? buckets.filter((b) => b.spo2).map((b) => ({ t: b.bucket, ...b.spo2 })) : null
+  const summary = bucketStats ? summarizeBuckets(bucketStats) : summarizeValues(spo2Values)
+  const { min: minSpo2, max: maxSpo2, avg: avgSpo2, last: lastSpo2 } = summary
 
-  const labels = filtered.map((r) => new Date(toMs(r.ts)))
+  const labels = bucketStats ? bucketStats.map((s) => new Date(s.t)) : filtered.map((r) => new Date(toMs(r.ts)))
 
   const chartData = {
     labels,
     datasets: [
+      ...(bucketStats ? bandDatasets(bucketStats, 'rgba(78, 205, 196, 0.15)') : []),
       {
         label: 'SpO₂ (%)',
-        data: filtered.map((r) => r.spo2 ?? 0),
+        data: bucketStats ? bucketStats.map((s) => s.mean) : filtered.map((r) => r.spo2 ?? 0),
         borderColor: '#4ecdc4',
         backgroundColor: (ctx) => {
           const { ctx: gctx, chartArea } = ctx.chart
@@ -52,7 +54,7 @@ export default function Spo2Chart({ records, rangeHours, dateRange }) {
           gradient.addColorStop(1, 'rgba(78, 205, 196, 0.02)')
           return gradient
         },
-        fill: 'origin',
+        fill: bucketStats ? false : 'origin',
         tension: 0.35,
         pointRadius: 0,
         borderWidth: 2
@@ -100,6 +102,7 @@ export default function Spo2Chart({ records, rangeHours, dateRange }) {
       tooltip: {
         mode: 'index',
         intersect: false,
+        filter: (item) => !['p10', 'p90'].includes(item.dataset.label),
         callbacks: {
           title: (items) => items?.[0]?.label || '',
           label: (item) => `SpO₂: ${item.formattedValue} %`
@@ -117,7 +120,7 @@ export default function Spo2Chart({ records, rangeHours, dateRange }) {
           Min: {minSpo2}{minSpo2 !== '-' ? ' %' : ''} / Max: {maxSpo2}{maxSpo2 !== '-' ? ' %' : ''} / Avg: {avgSpo2 !== '-' ? avgSpo2.toFixed(1) + ' %' : '-'} / Last: {lastSpo2}{lastSpo2 !== '-' ? ' %' : ''}
         </div>
       </div>
-      {filtered.length > 0 ? (
+      {(bucketStats ? bucketStats.length : filtered.length) > 0 ? (
         <div style={{ height: 360 }}>
           <Line data={chartData} options={chartOptions} />
         </div>
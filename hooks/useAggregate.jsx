@@ -0,0 +1,72 @@
+// hooks/useAggregate.jsx
+import { useEffect, useState } from 'react'
+import axios from 'axios'
+import { useAuth } from '../contexts/AuthContext'
+import { pickAggregateBucket, rollupGranularity, ROLLUP_MS, MAX_ROLLUP_BUCKETS } from '../lib/chartSeries'
+
+/**
+ * Per-bucket vitals statistics for long windows from /api/records/aggregate.
+ * Returns `buckets: null` when the window is short enough to chart raw records.
+ * The aggregate reads at most MAX_AGGREGATE_RECORDS raw records, newest first;
+ * when it reports `truncated`, the window is charted from the pre-aggregated
+ * /api/records/rollups instead (no p10/p90 band). If that fails too, the
+ * truncated buckets are kept and `truncated` is true so the chart can say so.
+ */
+export function useAggregate({ startTs = null, endTs = null } = {}) {
+  const { user } = useAuth()
+  const [buckets, setBuckets] = useState(null)
+  const [truncated, setTruncated] = useState(false)
+  const [error, setError] = useState(null)
+  const bucket = pickAggregateBucket(startTs, endTs)
+
+  useEffect(() => {
+    setBuckets(null)
+    setTruncated(false)
+    if (!user || !bucket) return
+    let cancelled = false
+
+    const fetchRollups = async (headers) => {
+      const granularity = rollupGranularity(bucket)
+      const limit = Math.min(MAX_ROLLUP_BUCKETS, Math.ceil((endTs - startTs) / ROLLUP_MS[granularity]) + 1)
+      const resp = await axios.get('/api/records/rollups', {
+        headers,
+        params: { granularity, start_ts: startTs, end_ts: endTs, limit },
+      })
+      return resp.data?.buckets || []
+    }
+
+    const load = async () => {
+      try {
+        const token = await user.getIdToken()
+        const headers = { Authorization: `Bearer ${token}` }
+        const resp = await axios.get('/api/records/aggregate', {
+          headers,
+          params: { start: startTs, end: endTs, bucket },
+        })
+        if (!resp.data?.truncated) {
+          if (!cancelled) setBuckets(resp.data?.buckets || [])
+          return
+        }
+        try {
+          const rollups = await fetchRollups(headers)
+          if (!cancelled) setBuckets(rollups)
+        } catch (err) {
+          if (!cancelled) {
+            setBuckets(resp.data.buckets || [])
+            setTruncated(true)
+          }
+        }
+      } catch (err) {
+        if (!cancelled) setError(err)
+      }
+    }
+    load()
+    return () => {
+      cancelled = true
+    }
+  }, [user, bucket, startTs, endTs])
+
+  return { buckets, bucket, truncated, error }
+}
+
+export default useAggregate
@@ -1,113 +1,265 @@
 // hooks/useRecords.jsx
-import { useEffect, useRef, useState } from 'react'
+import { useCallback, useEffect, useRef, useState } from 'react'
 import axios from 'axios'
 import { useAuth } from '../contexts/AuthContext'
 
+const toMs = (ts) => (!ts ? 0 : ts < 1e12 ? ts * 1000 : ts)
+const delay = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+const normalize = (rows) =>
+  (Array.isArray(rows) ? rows : [])
+    .map((r) => ({
+      id: r.id,
+      userId: r.userId,
+      device_id: r.device_id,
+      spo2: r.spo2,
+      heart_rate: r.heart_rate ?? r.hr,
+      ts: r.ts,
+    }))
+    .sort((a, b) => toMs(b.ts) - toMs(a.ts))
+
+const computeHash = (arr) => {
+  if (!Array.isArray(arr) || arr.length === 0) return 'empty'
+  const newestTs = arr[0]?.ts || 0
+  const ids = arr
+    .slice(0, 20)
+    .map((r) => r.id || `${r.userId}-${r.device_id}-${r.ts}`)
+    .join('|')
+  return `${newestTs}:${ids}:${arr.length}`
+}
+
+const inWindow = (r, startTs, endTs) =>
+  (startTs == null || toMs(r.ts) >= startTs) && (endTs == null || toMs(r.ts) <= endTs)
+
+// Add newly synced records (the server may repeat a few) to what is loaded
+const mergeNew = (current, fresh) => {
+  if (fresh.length === 0) return current
+  const ids = new Set(current.map((r) => r.id))
+  const added = fresh.filter((r) => !ids.has(r.id))
+  if (added.length === 0) return current
+  return [...added, ...current].sort((a, b) => toMs(b.ts) - toMs(a.ts))
+}
+
+// Upper bound on back-to-back /since calls per poll when the server reports more
+const MAX_SYNC_ROUNDS = 5
+// Consecutive stream failures before falling back to polling, and reconnect delay
+const MAX_STREAM_FAILURES = 3
+const STREAM_RETRY_MS = 3000
+
 /**
  * Fetch user health records from backend using Firebase ID token.
- * - Normalizes fields and sorts by timestamp desc
- * - Polls periodically
+ * - Loads one page (`pageSize`) of the [startTs, endTs] window, newest first
+ * - `loadMore()` fetches the next older page via the server's `next_cursor`
+ * - Follows `/api/records/stream` (Server-Sent Events) for new records,
+ *   resuming from the last event ID after each reconnect
+ * - Falls back to polling `/api/records/since` every `pollMs` if the stream
+ *   keeps failing
  */
-export function useRecords({ limit = 1000, pollMs = 15000 } = {}) {
+export function useRecords({ pageSize = 500, pollMs = 15000, startTs = null, endTs = null } = {}) {
   const { user } = useAuth()
   const [records, setRecords] = useState([])
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
-  const hasLoadedOnceRef = useRef(false)
+  const [nextCursor, setNextCursor] = useState(null)
   const lastHashRef = useRef('')
+  const watermarkRef = useRef(null)
+
+  const authedGet = useCallback(
+    async (url, params) => {
+      const request = async () => {
+        const token = await user.getIdToken()
+        const resp = await axios.get(url, {
+          headers: { Authorization: `Bearer ${token}` },
+          params,
+        })
+        return resp.data
+      }
+      try {
+        return await request()
+      } catch (err) {
+        // Retry once for minor clock skew
+        const detail = err?.response?.data?.detail || ''
+        const status = err?.response?.status || 0
+        const tooEarly = typeof detail === 'string' && detail.toLowerCase().includes('too early')
+        if (status === 401 && tooEarly) {
+          await delay(3000)
+          return request()
+        }
+        throw err
+      }
+    },
+    [user]
+  )
+
+  const fetchPage = useCallback(
+    async (before = null) => {
+      const params = { limit: pageSize, start_ts: startTs ?? 0 }
+      if (endTs != null) params.end_ts = endTs
+      if (before) params.before = before
+      const data = await authedGet('/api/records/', params)
+      return { rows: normalize(data?.records), cursor: data?.next_cursor || null, watermark: data?.watermark ?? null }
+    },
+    [authedGet, pageSize, startTs, endTs]
+  )
+
+  const fetchSince = useCallback(async () => {
+    let rows = []
+    let after = null
+    for (let round = 0; round < MAX_SYNC_ROUNDS; round++) {
+      const params = { ts: watermarkRef.current, limit: pageSize }
+      if (after) params.after = after
+      const data = await authedGet('/api/records/since', params)
+      rows = rows.concat(normalize(data?.records).filter((r) => inWindow(r, startTs, endTs)))
+      watermarkRef.current = data?.watermark ?? watermarkRef.current
+      after = data?.next_after || null
+      if (!data?.has_more || !after) break
+    }
+    return rows
+  }, [authedGet, pageSize, startTs, endTs])
+
+  const openStream = useCallback(
+    async ({ lastEventId, signal, onEvent }) => {
+      const token = await user.getIdToken()
+      const headers = { Authorization: `Bearer ${token}`, Accept: 'text/event-stream' }
+      const params = new URLSearchParams()
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId
+      else if (watermarkRef.current != null) params.set('since', watermarkRef.current)
+      const resp = await fetch(`/api/records/stream?${params}`, { headers, signal })
+      if (!resp.ok || !resp.body) throw new Error(`Stream failed with status ${resp.status}`)
+
+      const reader = resp.body.pipeThrough(new TextDecoderStream()).getReader()
+      let buffer = ''
+      for (;;) {
+        const { value, done } = await reader.read()
+        if (done) return
+        buffer += value
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+          const block = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+          let id = null
+          let data = ''
+          for (const line of block.split('\n')) {
+            if (line.startsWith('id: ')) id = line.slice(4)
+            else if (line.startsWith('data: ')) data += line.slice(6)
+          }
+          if (id && data) onEvent(id, normalize([JSON.parse(data)]))
+        }
+      }
+    },
+    [user]
+  )
 
   useEffect(() => {
     if (!user) return
 
     let cancelled = false
     let interval = null
+    let retryTimer = null
+    const controller = new AbortController()
+    lastHashRef.current = ''
+    watermarkRef.current = null
+    setRecords([])
+    setNextCursor(null)
+
+    const applyRows = (rows) =>
+      setRecords((current) => {
+        const merged = mergeNew(current, rows)
+        const newHash = computeHash(merged)
+        if (newHash === lastHashRef.current) return current
+        lastHashRef.current = newHash
+        return merged
+      })
+
+    const pollSince = async () => {
+      try {
+        const rows = await fetchSince()
+        if (!cancelled) applyRows(rows)
+      } catch (err) {
+        if (!cancelled) setError(err)
+      }
+    }
 
-    const toMs = (ts) => (!ts ? 0 : ts < 1e12 ? ts * 1000 : ts)
-    const delay = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
-
-    const computeHash = (arr) => {
-      if (!Array.isArray(arr) || arr.length === 0) return 'empty'
-      const newestTs = arr[0]?.ts || 0
-      const ids = arr
-        .slice(0, 20)
-        .map((r) => r.id || `${r.userId}-${r.device_id}-${r.ts}`)
-        .join('|')
-      return `${newestTs}:${ids}`
+    // Follow the live stream, reconnecting where it left off; fall back to
+    // polling /since if it keeps failing (e.g. a proxy that buffers responses)
+    const followStream = async () => {
+      let lastEventId = null
+      let failures = 0
+      while (!cancelled) {
+        try {
+          await openStream({
+            lastEventId,
+            signal: controller.signal,
+            onEvent: (id, rows) => {
+              lastEventId = id
+              applyRows(rows.filter((r) => inWindow(r, startTs, endTs)))
+            },
+          })
+          failures = 0
+        } catch (err) {
+          if (cancelled) return
+          failures += 1
+          if (failures >= MAX_STREAM_FAILURES) {
+            interval = setInterval(pollSince, pollMs)
+            return
+          }
+        }
+        await delay(STREAM_RETRY_MS)
+      }
     }
 
-    const fetchOnce = async () => {
+    const start = async () => {
       try {
-        if (!hasLoadedOnceRef.current) setLoading(true)
+        setLoading(true)
         setError(null)
-        const token = await user.getIdToken()
-        const resp = await axios.get('/api/records/', {
-          headers: { Authorization: `Bearer ${token}` },
-          params: { limit },
-        })
+        const page = await fetchPage()
         if (cancelled) return
-        const normalized = (Array.isArray(resp.data) ? resp.data : [])
-          .map((r) => ({
-            id: r.id,
-            userId: r.userId,
-            device_id: r.device_id,
-            spo2: r.spo2,
-            heart_rate: r.heart_rate ?? r.hr,
-            ts: r.ts,
-          }))
-          .sort((a, b) => toMs(b.ts) - toMs(a.ts))
-        const newHash = computeHash(normalized)
-        if (newHash !== lastHashRef.current) {
-          lastHashRef.current = newHash
-          setRecords(normalized)
-        }
+        watermarkRef.current = page.watermark
+        setNextCursor(page.cursor)
+        applyRows(page.rows)
       } catch (err) {
-        // Retry once for minor clock skew
-        const detail = err?.response?.data?.detail || ''
-        const status = err?.response?.status || 0
-        const tooEarly = typeof detail === 'string' && detail.toLowerCase().includes('too early')
-        if (!cancelled && status === 401 && tooEarly) {
-          try {
-            await delay(3000)
-            const token2 = await user.getIdToken()
-            const resp2 = await axios.get('/api/records/', {
-              headers: { Authorization: `Bearer ${token2}` },
-              params: { limit },
-            })
-            if (cancelled) return
-            const normalized2 = (Array.isArray(resp2.data) ? resp2.data : [])
-              .map((r) => ({ id: r.id, userId: r.userId, device_id: r.device_id, spo2: r.spo2, heart_rate: r.heart_rate ?? r.hr, ts: r.ts }))
-              .sort((a, b) => toMs(b.ts) - toMs(a.ts))
-            const newHash2 = computeHash(normalized2)
-            if (newHash2 !== lastHashRef.current) {
-              lastHashRef.current = newHash2
-              setRecords(normalized2)
-            }
-          } catch (e2) {
-            if (!cancelled) setError(e2)
-          }
-        } else {
-          if (!cancelled) setError(err)
-        }
-      } finally {
         if (!cancelled) {
-          if (!hasLoadedOnceRef.current) setLoading(false)
-          hasLoadedOnceRef.current = true
+          setError(err)
+          retryTimer = setTimeout(start, pollMs)
         }
+        return
+      } finally {
+        if (!cancelled) setLoading(false)
       }
+      // A window that ended in the past gets no new records
+      if (endTs != null && endTs < Date.now()) return
+      followStream()
     }
 
-    fetchOnce()
-    interval = setInterval(fetchOnce, pollMs)
+    start()
 
     return () => {
       cancelled = true
+      controller.abort()
       if (interval) clearInterval(interval)
+      if (retryTimer) clearTimeout(retryTimer)
+    }
+  }, [user, pollMs, startTs, endTs, fetchPage, fetchSince, openStream])
+
+  const loadMore = useCallback(async () => {
+    if (!user || !nextCursor || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const { rows, cursor } = await fetchPage(nextCursor)
+      const seen = new Set()
+      setRecords((current) =>
+        [...current, ...rows].filter((r) => (seen.has(r.id) ? false : seen.add(r.id)))
+      )
+      setNextCursor(cursor)
+    } catch (err) {
+      setError(err)
+    } finally {
+      setLoadingMore(false)
     }
-  }, [user, limit, pollMs])
+  }, [user, nextCursor, loadingMore, fetchPage])
 
-  return { records, loading, error }
+  return { records, loading, error, hasMore: Boolean(nextCursor), loadingMore, loadMore }
 }
 
 export default useRecords
-
-
@@ -0,0 +1,68 @@
+// lib/chartSeries.js
+// Helpers shared by the vitals charts for server-side aggregates (/api/records/aggregate)
+// and pre-aggregated rollups (/api/records/rollups)
+
+const HOUR_MS = 3600 * 1000
+const DAY_MS = 24 * HOUR_MS
+
+// Rollup bucket sizes, and the most buckets one /rollups call returns
+export const ROLLUP_MS = { hour: HOUR_MS, day: DAY_MS }
+export const MAX_ROLLUP_BUCKETS = 1000
+
+// Bucket size for a window, or null when raw records are small enough to plot
+export const pickAggregateBucket = (startTs, endTs) => {
+  if (startTs == null || endTs == null) return null
+  const span = endTs - startTs
+  if (span <= DAY_MS) return null
+  if (span <= 3 * DAY_MS) return '5m'
+  if (span <= 40 * DAY_MS) return '1h'
+  return '1d'
+}
+
+// Rollup granularity standing in for an aggregate bucket (minutes would exceed the bucket cap)
+export const rollupGranularity = (bucket) => (bucket === '1d' ? 'day' : 'hour')
+
+// Min / max / average / last over raw values ('-' when empty)
+export const summarizeValues = (values) => {
+  if (!values.length) return { min: '-', max: '-', avg: '-', last: '-' }
+  return {
+    min: Math.min(...values),
+    max: Math.max(...values),
+    avg: values.reduce((sum, v) => sum + v, 0) / values.length,
+    last: values[values.length - 1],
+  }
+}
+
+// The same summary over per-bucket stats ({count, mean, min, max, ...}), oldest first
+export const summarizeBuckets = (stats) => {
+  if (!stats.length) return { min: '-', max: '-', avg: '-', last: '-' }
+  const total = stats.reduce((sum, s) => sum + s.count, 0)
+  return {
+    min: Math.min(...stats.map((s) => s.min)),
+    max: Math.max(...stats.map((s) => s.max)),
+    avg: stats.reduce((sum, s) => sum + s.mean * s.count, 0) / total,
+    last: Number(stats[stats.length - 1].mean.toFixed(1)),
+  }
+}
+
+// p10–p90 band datasets drawn behind the mean line (none for rollups, which carry no percentiles)
+export const bandDatasets = (stats, color) => {
+  if (!stats.some((s) => s.p10 != null)) return []
+  return [
+    {
+      label: 'p90',
+      data: stats.map((s) => s.p90),
+      borderWidth: 0,
+      pointRadius: 0,
+      fill: false,
+    },
+    {
+      label: 'p10',
+      data: stats.map((s) => s.p10),
+      borderWidth: 0,
+      pointRadius: 0,
+      backgroundColor: color,
+      fill: '-1',
+    },
+  ]
+}
@@ -3,6 +3,7 @@ import { useAuth } from '../contexts/AuthContext'
 import { useAdmin } from '../contexts/AdminContext'
 import { useRouter } from 'next/router'
 import useRecords from '../hooks/useRecords'
+import useAggregate from '../hooks/useAggregate'
 import { useAnime } from '../hooks/useAnime.jsx'
 
 // Dashboard Components
@@ -43,7 +44,18 @@ export default function Dashboard() {
       document.removeEventListener('keydown', onKey)
     }
   }, [pickerOpen])
-  const { records, loading: dataLoading } = useRecords({ limit: 1000, pollMs: 15000 })
+  // Fetch only the selected window; older pages are loaded on demand
+  const startTs = dateRange?.start ? new Date(`${dateRange.start}T00:00:00`).getTime() : null
+  const endTs = dateRange?.end ? new Date(`${dateRange.end}T23:59:59.999`).getTime() : null
+  const {
+    records,
+    loading: dataLoading,
+    hasMore,
+    loadingMore,
+    loadMore,
+  } = useRecords({ pageSize: 500, pollMs: 15000, startTs, endTs })
+  // Windows longer than a day are charted from server-side buckets
+  const { buckets, truncated } = useAggregate({ startTs, endTs })
   const { animate } = useAnime()
 
   // Redirect if not authenticated
@@ -130,8 +142,18 @@ export default function Dashboard() {
           rangeHours={range} 
           dateRange={dateRange}
           dataLoading={dataLoading} 
+          buckets={buckets}
+          truncated={truncated}
         />
 
+        {hasMore && (
+          <div className={styles.loadMoreRow}>
+            <button onClick={loadMore} disabled={loadingMore} className={styles.rangeToggleBtn}>
+              {loadingMore ? 'Đang tải...' : 'Tải thêm dữ liệu cũ hơn'}
+            </button>
+          </div>
+        )}
+
         {/* Health Insights */}
         <HealthInsights 
           records={records} 
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Move old /user_records entries to cold storage (see api/archive.py).
+
+Records whose ts is before the start of the UTC day ARCHIVE_AFTER_DAYS ago
+(override with --days) are appended to gzip NDJSON day partitions under
+ARCHIVE_DIR or in ARCHIVE_BUCKET, then deleted from /user_records and
+/user_records_v2 one page per multi-path update. Safe to re-run or interrupt:
+partitions are merged by record key, and /archive_index/{uid} only advances
+together with each page's deletes.
+
+Examples:
+  ARCHIVE_DIR=/var/lib/vitals-archive python scripts/archive_user_records.py --uid uid_abc
+  ARCHIVE_BUCKET=my-project.appspot.com python scripts/archive_user_records.py --all --days 180
+  python scripts/archive_user_records.py --all --dry-run     # count only
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from provision_device import ensure_firebase_initialized, load_environment  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Archive old /user_records to cold storage")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--uid", action="append", help="User UID to archive (repeatable)")
+    target.add_argument("--all", action="store_true", help="Archive every user under /user_records")
+    parser.add_argument("--days", type=int, help="Archive records older than this many days (default: ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Records deleted per multi-path update")
+    parser.add_argument("--dry-run", action="store_true", help="Count records without writing or deleting")
+    return parser.parse_args()
+
+
+def iter_user_ids() -> Iterator[str]:
+    from firebase_admin import db
+
+    for uid in (db.reference("/user_records").get(shallow=True) or {}):
+        yield uid
+
+
+def main() -> None:
+    args = parse_args()
+    load_environment()
+    ensure_firebase_initialized()
+
+    # Imported after load_environment so ARCHIVE_* settings are picked up
+    from api.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_ENABLED, archive_cutoff, archive_user_records
+
+    if not ARCHIVE_ENABLED:
+        print("❌ Set ARCHIVE_DIR or ARCHIVE_BUCKET to choose where archives are written", file=sys.stderr)
+        sys.exit(2)
+
+    days = args.days if args.days is not None else ARCHIVE_AFTER_DAYS
+    cutoff = archive_cutoff(int(time.time() * 1000), days)
+    uids = args.uid if args.uid else iter_user_ids()
+    total = 0
+    for uid in uids:
+        archived = archive_user_records(uid, cutoff, args.page_size, args.dry_run)
+        total += archived
+        print(f"✓ {uid}: archived {archived} records")
+
+    action = "Would archive" if args.dry_run else "Archived"
+    print(f"✅ {action} {total} records older than {days} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Rebuild per-user vitals rollups (/user_rollups) from /user_records.
+
+Reads each user's records in key-ordered pages, folds them with the same
+merge used at ingest time (api/rollups.py) and overwrites the rebuilt buckets
+with multi-path updates. Buckets that exist but have no source records are
+left untouched.
+
+Records ingested while a user is being rebuilt may be overwritten in the
+buckets they touch; run it before enabling ROLLUPS_ENABLED, or re-run it for
+the affected users afterwards.
+
+Examples:
+  python scripts/backfill_rollups.py --uid uid_abc
+  python scripts/backfill_rollups.py --all --granularity hour --granularity day
+  python scripts/backfill_rollups.py --all --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from provision_device import ensure_firebase_initialized, load_environment  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    from api.rollups import GRANULARITIES
+
+    parser = argparse.ArgumentParser(description="Backfill /user_rollups from /user_records")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--uid", action="append", help="User UID to rebuild (repeatable)")
+    target.add_argument("--all", action="store_true", help="Rebuild every user under /user_records")
+    parser.add_argument(
+        "--granularity",
+        action="append",
+        choices=list(GRANULARITIES),
+        help="Granularity to rebuild (repeatable, default: all)",
+    )
+    parser.add_argument("--page-size", type=int, default=2000, help="Records read per RTDB query")
+    parser.add_argument("--write-batch", type=int, default=500, help="Buckets per multi-path update")
+    parser.add_argument("--dry-run", action="store_true", help="Compute rollups without writing")
+    return parser.parse_args()
+
+
+def iter_user_ids() -> Iterator[str]:
+    from firebase_admin import db
+
+    for uid in (db.reference("/user_records").get(shallow=True) or {}):
+        yield uid
+
+
+def rebuild_user(uid: str, granularities: List[str], args: argparse.Namespace) -> Tuple[int, int]:
+    from firebase_admin import db
+    from api.record_store import iter_user_record_pages
+    from api.rollups import compute_rollups, merge_rollups, rollup_path
+
+    rollups: Dict[tuple, dict] = {}
+    record_count = 0
+    for page in iter_user_record_pages(uid, args.page_size):
+        records = [dict(record, userId=record.get("userId") or uid) for _, record in page]
+        record_count += len(records)
+        for bucket, rollup in compute_rollups(records, granularities).items():
+            rollups[bucket] = merge_rollups(rollups.get(bucket), rollup)
+
+    if not args.dry_run:
+        items = list(rollups.items())
+        for i in range(0, len(items), args.write_batch):
+            updates = {
+                rollup_path(bucket_uid, granularity, bucket).lstrip("/"): rollup
+                for (bucket_uid, granularity, bucket), rollup in items[i:i + args.write_batch]
+            }
+            db.reference("/").update(updates)
+    return record_count, len(rollups)
+
+
+def main() -> None:
+    args = parse_args()
+    load_environment()
+    ensure_firebase_initialized()
+    from api.rollups import GRANULARITIES
+
+    granularities = args.granularity or list(GRANULARITIES)
+    uids = args.uid if args.uid else iter_user_ids()
+
+    total_records = total_buckets = 0
+    for uid in uids:
+        records, buckets = rebuild_user(uid, granularities, args)
+        total_records += records
+        total_buckets += buckets
+        print(f"✓ {uid}: {records} records → {buckets} buckets")
+
+    action = "Would write" if args.dry_run else "Wrote"
+    print(f"✅ {action} {total_buckets} buckets from {total_records} records")
+
+
+if __name__ == "__main__":
+    main()
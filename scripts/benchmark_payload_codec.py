@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Compare JSON and MessagePack device payloads: bytes on the wire and server decode time.
+
+Decode time is measured through a Starlette `Request`, i.e. the current
+`await req.json()` path versus `api.codec.read_body` with a MessagePack body,
+for a single reading, a 30-sample batch and a command response.
+
+Examples:
+  python scripts/benchmark_payload_codec.py
+  python scripts/benchmark_payload_codec.py --iterations 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import msgpack
+from starlette.requests import Request
+from tabulate import tabulate
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from api.codec import read_body  # noqa: E402
+
+
+def make_request(body: bytes, content_type: str) -> Request:
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/records/",
+        "headers": [(b"content-type", content_type.encode())],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+async def time_decode(body: bytes, content_type: str, iterations: int, decoder) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await decoder(make_request(body, content_type))
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def json_path(req: Request):
+    return await req.json()
+
+
+def payloads() -> dict:
+    random.seed(7)
+    single = {"spo2": 98, "heart_rate": 72}
+    batch = {"samples": [
+        {"spo2": random.randint(94, 100), "heart_rate": random.randint(55, 110), "ts_offset": -1000 * (29 - i)}
+        for i in range(30)
+    ]}
+    command = {"action": "blink", "pattern": [1, 0, 1, 0, 1, 1, 0, 0]}
+    return {"single reading": single, "30-sample batch": batch, "command": command}
+
+
+async def run(iterations: int) -> None:
+    rows = []
+    for name, payload in payloads().items():
+        as_json = json.dumps(payload, separators=(",", ":")).encode()
+        as_msgpack = msgpack.packb(payload, use_bin_type=True)
+        json_us = await time_decode(as_json, "application/json", iterations, json_path)
+        msgpack_us = await time_decode(as_msgpack, "application/msgpack", iterations, read_body)
+        rows.append([
+            name,
+            len(as_json),
+            len(as_msgpack),
+            f"{(1 - len(as_msgpack) / len(as_json)) * 100:.0f}%",
+            f"{json_us:.1f}",
+            f"{msgpack_us:.1f}",
+        ])
+    print(tabulate(
+        rows,
+        headers=["Payload", "JSON bytes", "MsgPack bytes", "Saved", "JSON decode µs", "MsgPack decode µs"],
+        tablefmt="grid",
+    ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs MessagePack device payloads")
+    parser.add_argument("--iterations", type=int, default=5000, help="Decodes per payload")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Compare GET /api/records response layouts: bytes on the wire and encode time.
+
+`rows` is the current list-of-dicts body encoded the way FastAPI does it
+(`jsonable_encoder` + stdlib json). `columnar` is `api.codec.columnar`, encoded
+with stdlib json and, when installed, orjson. Each body is also compressed with
+gzip and brotli (if installed) to show what `Accept-Encoding` saves.
+
+Examples:
+  python scripts/benchmark_records_format.py
+  python scripts/benchmark_records_format.py --records 5000 --iterations 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from tabulate import tabulate
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from api.codec import BROTLI_AVAILABLE, ORJSON_AVAILABLE, columnar  # noqa: E402
+
+if ORJSON_AVAILABLE:
+    import orjson
+if BROTLI_AVAILABLE:
+    import brotli
+
+
+def make_records(count: int) -> list:
+    random.seed(7)
+    start = 1_699_920_000_000
+    return [
+        {
+            "id": f"-NjX{i:016d}",
+            "userId": "uid_0123456789abcdefghij",
+            "device_id": "esp32_a1b2c3",
+            "ts": start + i * 1000,
+            "spo2": random.randint(94, 100),
+            "heart_rate": random.randint(55, 110),
+        }
+        for i in range(count)
+    ][::-1]
+
+
+def time_encode(encode, iterations: int) -> tuple:
+    body = encode()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encode()
+    return body, (time.perf_counter() - started) / iterations * 1e3
+
+
+def stdlib_json(content) -> bytes:
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+def run(count: int, iterations: int) -> None:
+    records = make_records(count)
+    encoders = {
+        "rows (jsonable_encoder + json)": lambda: json.dumps(jsonable_encoder(records)).encode(),
+        "columnar (json)": lambda: stdlib_json(columnar(records)),
+    }
+    if ORJSON_AVAILABLE:
+        encoders["columnar (orjson)"] = lambda: orjson.dumps(columnar(records))
+
+    rows = []
+    for name, encode in encoders.items():
+        body, encode_ms = time_encode(encode, iterations)
+        rows.append([
+            name,
+            len(body),
+            len(gzip.compress(body, compresslevel=6)),
+            len(brotli.compress(body, quality=5)) if BROTLI_AVAILABLE else "-",
+            f"{encode_ms:.2f}",
+        ])
+    print(f"{count} records, {iterations} iterations")
+    print(tabulate(
+        rows,
+        headers=["Layout", "Raw bytes", "gzip bytes", "br bytes", "Encode ms"],
+        tablefmt="grid",
+    ))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark rows vs columnar record responses")
+    parser.add_argument("--records", type=int, default=1000, help="Records per response")
+    parser.add_argument("--iterations", type=int, default=200, help="Encodes per layout")
+    args = parser.parse_args()
+    run(args.records, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
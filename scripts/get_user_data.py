@@ -5,10 +5,14 @@ Fetch and print user data from Firebase (Auth profile, devices, recent records).
 Usage:
   python scripts/get_user_data.py --uid <UID> [--limit 20] [--format json|table]
   python scripts/get_user_data.py --email <EMAIL> [--limit 20] [--format json|table]
+  python scripts/get_user_data.py --uid <UID> --export ndjson|csv [--start MS] [--end MS] [--output FILE]
 
 Notes:
   - Loads env vars from project-root `.env.local` if present
   - Requires FIREBASE_* service account envs; uses FIREBASE_DB_URL for RTDB
+  - --export writes the user's full record history (optionally bounded by ts)
+    using the same paged reader as GET /api/records/export, so memory stays
+    constant; other output is skipped
 """
 
 import os
@@ -23,6 +27,9 @@ from dotenv import load_dotenv
 from firebase_admin import credentials, initialize_app, auth, db, exceptions as fa_exceptions
 from tabulate import tabulate
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from api.export import EXPORT_FORMATS, encode_export, iter_export_records  # noqa: E402
+
 
 def load_env() -> None:
     """Load environment variables from project root .env.local (best-effort)."""
@@ -128,6 +135,26 @@ def fetch_user_records(user_id: str, limit: int) -> List[Dict[str, Any]]:
     return records[:limit]
 
 
+def export_user_records(user_id: str, fmt: str, start: Optional[int], end: Optional[int], output: Optional[str]) -> int:
+    """Stream the user's records to `output` (stdout if None); returns the record count."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in iter_export_records(user_id, start, end):
+            count += 1
+            yield record
+
+    out = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+    try:
+        for chunk in encode_export(counted(), fmt):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+    return count
+
+
 def print_table(user_info: Dict[str, Any], devices: Dict[str, Dict[str, Any]], records: List[Dict[str, Any]], limit: int) -> None:
     # User summary
     print("\nUser")
@@ -198,6 +225,10 @@ def main() -> None:
     parser.add_argument("--email", help="User email")
     parser.add_argument("--limit", type=int, default=20, help="Max number of recent records to fetch")
     parser.add_argument("--format", choices=["json", "table"], default="json", help="Output format")
+    parser.add_argument("--export", choices=list(EXPORT_FORMATS), help="Export full record history in this format")
+    parser.add_argument("--start", type=int, help="Export: earliest record ts (ms)")
+    parser.add_argument("--end", type=int, help="Export: latest record ts (ms)")
+    parser.add_argument("--output", help="Export: file to write (default: stdout)")
     args = parser.parse_args()
 
     if not args.uid and not args.email:
@@ -219,6 +250,18 @@ def main() -> None:
         print(f"Error fetching user: {e}", file=sys.stderr)
         sys.exit(1)
 
+    if args.export:
+        if not has_db:
+            print("Error: FIREBASE_DB_URL is required for --export", file=sys.stderr)
+            sys.exit(1)
+        try:
+            count = export_user_records(user.uid, args.export, args.start, args.end, args.output)
+        except Exception as e:
+            print(f"Error exporting records: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Exported {count} records for {user.uid}", file=sys.stderr)
+        return
+
     user_info: Dict[str, Any] = {
         "uid": user.uid,
         "email": user.email,
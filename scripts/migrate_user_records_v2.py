@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Copy /user_records into the day-partitioned /user_records_v2 layout.
+
+Works incrementally: each user's records are copied in key-ordered pages, and
+each page is written together with the user's checkpoint
+(/migrations/user_records_v2/{uid}) in one multi-path update. An interrupted
+run resumes after the last copied key. Once a pass reaches the end of a user's
+records, the checkpoint is marked complete and the API starts serving that
+user's ranged reads from the v2 layout (see api/record_store.py). Add
+`".indexOn": "ts"` under `user_records_v2/$uid/$day` in the RTDB rules first
+so each day is a limited query.
+
+Records ingested while the migration runs are already dual-written by the API,
+so copying them again is harmless (same key, same value).
+
+Examples:
+  python scripts/migrate_user_records_v2.py --uid uid_abc
+  python scripts/migrate_user_records_v2.py --all --page-size 1000
+  python scripts/migrate_user_records_v2.py --all --restart     # ignore checkpoints
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from provision_device import ensure_firebase_initialized, load_environment  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Migrate /user_records to /user_records_v2")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--uid", action="append", help="User UID to migrate (repeatable)")
+    target.add_argument("--all", action="store_true", help="Migrate every user under /user_records")
+    parser.add_argument("--page-size", type=int, default=1000, help="Records copied per multi-path update")
+    parser.add_argument("--restart", action="store_true", help="Ignore existing checkpoints and copy from the start")
+    parser.add_argument("--dry-run", action="store_true", help="Count records without writing")
+    return parser.parse_args()
+
+
+def iter_user_ids() -> Iterator[str]:
+    from firebase_admin import db
+
+    for uid in (db.reference("/user_records").get(shallow=True) or {}):
+        yield uid
+
+
+def migrate_user(uid: str, args: argparse.Namespace) -> int:
+    from firebase_admin import db
+    from api.record_store import MIGRATION_ROOT, iter_user_record_pages, v2_record_path
+
+    checkpoint_path = f"{MIGRATION_ROOT}/{uid}"
+    checkpoint = {} if args.restart else (db.reference(f"/{checkpoint_path}").get() or {})
+    last_key = checkpoint.get("last_key")
+    copied_total = checkpoint.get("copied", 0)
+    copied = 0
+
+    for page in iter_user_record_pages(uid, args.page_size, after_key=last_key):
+        updates = {}
+        for key, record in page:
+            ts = record.get("ts")
+            if isinstance(ts, (int, float)):
+                updates[v2_record_path(record.get("userId") or uid, int(ts), key)] = record
+        last_key = page[-1][0] if page else last_key
+        copied += len(updates)
+        if args.dry_run:
+            continue
+        updates[checkpoint_path] = {
+            "last_key": last_key,
+            "copied": copied_total + copied,
+            "complete": False,
+            "updated_at": int(time.time() * 1000),
+        }
+        db.reference("/").update(updates)
+
+    if not args.dry_run:
+        db.reference(f"/{checkpoint_path}").update({
+            "last_key": last_key,
+            "copied": copied_total + copied,
+            "complete": True,
+            "updated_at": int(time.time() * 1000),
+        })
+    return copied
+
+
+def main() -> None:
+    args = parse_args()
+    load_environment()
+    ensure_firebase_initialized()
+
+    uids = args.uid if args.uid else iter_user_ids()
+    total = 0
+    for uid in uids:
+        copied = migrate_user(uid, args)
+        total += copied
+        print(f"✓ {uid}: copied {copied} records")
+
+    action = "Would copy" if args.dry_run else "Copied"
+    print(f"✅ {action} {total} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Local-broker harness for the MQTT vitals ingestion channel.
+
+Publishes simulated readings to `devices/{id}/vitals` the way firmware would,
+either one message per reading or buffered batches (`samples` array). Each
+message is an envelope signed with the device secret (HMAC-SHA256 over the
+device ID, timestamp, nonce and body), so the secret never goes on the wire.
+Defaults target a local plaintext broker (e.g. `mosquitto -p 1883`).
+
+With --serve the script also runs the server-side ingest pipeline
+(api/mqtt_ingest.py) against the same broker and writes to Firebase RTDB, so
+the whole path can be exercised without the FastAPI app or the shared broker.
+
+Examples:
+  Publish 10 single readings to a local broker:
+    python scripts/mqtt_vitals_harness.py --id dev123 --secret s123 --user uid_abc --count 10
+
+  Publish 3 batches of 30 buffered samples:
+    python scripts/mqtt_vitals_harness.py --id dev123 --secret s123 --count 3 --batch 30
+
+  Run the ingest side locally (needs FIREBASE_* env in .env.local):
+    python scripts/mqtt_vitals_harness.py --serve
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import sys
+import time
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="MQTT vitals ingestion harness")
+    parser.add_argument("--host", default="localhost", help="Broker host")
+    parser.add_argument("--port", type=int, default=1883, help="Broker port")
+    parser.add_argument("--username", default=None, help="Broker username")
+    parser.add_argument("--password", default=None, help="Broker password")
+    parser.add_argument("--serve", action="store_true", help="Run the server-side ingest pipeline")
+    parser.add_argument("--id", dest="device_id", help="Device ID")
+    parser.add_argument("--secret", dest="device_secret", help="Device secret")
+    parser.add_argument("--user", dest="user_uid", default=None, help="User UID (omit for legacy owner)")
+    parser.add_argument("--count", type=int, default=10, help="Number of messages to publish")
+    parser.add_argument("--batch", type=int, default=0, help="Samples per message (0 = single reading)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between messages")
+    return parser.parse_args()
+
+
+def make_client(args: argparse.Namespace) -> mqtt.Client:
+    client = mqtt.Client(protocol=mqtt.MQTTv311)
+    if args.username:
+        client.username_pw_set(args.username, args.password)
+    return client
+
+
+def build_payload(args: argparse.Namespace) -> dict:
+    payload = {}
+    if args.user_uid:
+        payload["user_id"] = args.user_uid
+    if args.batch:
+        payload["samples"] = [
+            {
+                "spo2": random.randint(95, 100),
+                "heart_rate": random.randint(60, 100),
+                "ts_offset": -int((args.batch - 1 - i) * 1000),
+            }
+            for i in range(args.batch)
+        ]
+    else:
+        payload["spo2"] = random.randint(95, 100)
+        payload["heart_rate"] = random.randint(60, 100)
+    return payload
+
+
+def sign_payload(args: argparse.Namespace, body: dict) -> dict:
+    """Wrap a body in the signed envelope api/mqtt_ingest.py expects."""
+    text = json.dumps(body)
+    ts = int(time.time() * 1000)
+    nonce = secrets.token_hex(8)
+    message = f"{args.device_id}\n{ts}\n{nonce}\n".encode() + text.encode()
+    sig = hmac.new(args.device_secret.encode(), message, hashlib.sha256).hexdigest()
+    return {"ts": ts, "nonce": nonce, "sig": sig, "body": text}
+
+
+def publish(args: argparse.Namespace) -> None:
+    if not args.device_id or not args.device_secret:
+        print("Error: --id and --secret are required to publish", file=sys.stderr)
+        sys.exit(2)
+
+    client = make_client(args)
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    topic = f"devices/{args.device_id}/vitals"
+    print(f"🚀 Publishing {args.count} message(s) to {topic} on {args.host}:{args.port}")
+    try:
+        for i in range(args.count):
+            info = client.publish(topic, json.dumps(sign_payload(args, build_payload(args))), qos=1)
+            info.wait_for_publish()
+            print(f"✓ Published message {i + 1}/{args.count} (mid={info.mid})")
+            if i + 1 < args.count:
+                time.sleep(args.interval)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def serve(args: argparse.Namespace) -> None:
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import api.main  # noqa: F401  (loads .env.local and initializes Firebase Admin)
+    from api.ingest_queue import ingest_queue
+    from api.mqtt_ingest import VITALS_TOPIC, handle_vitals_message, mqtt_ingest_stats
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(VITALS_TOPIC, qos=1)
+            print(f"✅ Listening on {VITALS_TOPIC} at {args.host}:{args.port}")
+        else:
+            print(f"❌ Connection failed with code {rc}")
+
+    def on_message(client, userdata, message):
+        accepted = handle_vitals_message(message.topic, message.payload)
+        print(f"← {message.topic}: accepted {accepted} record(s)")
+
+    client = make_client(args)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port, 60)
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping, draining ingest queue...")
+    finally:
+        client.disconnect()
+        written = ingest_queue.drain()
+        print(f"Flushed {written} record(s); stats: {mqtt_ingest_stats()}")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        publish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,11 @@
 Provision a device entry in Firebase RTDB.
 
 - Creates/updates /devices/{device_id} with secret and optional user_id
+- Rewrites the device's /user_devices index entries to match
 - Requires FIREBASE_* env vars and FIREBASE_DB_URL (loaded from .env.local)
+- Running API servers cache device secrets: a new secret is accepted on the
+  device's next request, the previous one stops working within
+  DEVICE_CREDENTIAL_CACHE_TTL seconds (see api/device_auth.py)
 
 Examples:
   python scripts/provision_device.py --id esp-test --secret s123 --user uid_abc
@@ -118,6 +122,15 @@ def main() -> None:
         payload["registered_at"] = int(time.time() * 1000)
 
     ref.set(payload)
+
+    # Keep the users' /user_devices index in step (see api/device_access.py)
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from api.device_access import reindex_device
+
+    # An owner replaced (or dropped) by this provision loses their index entry
+    previous_owner = existing.get("user_id") if isinstance(existing, dict) else None
+    removed = [previous_owner] if previous_owner and previous_owner != args.user_uid else []
+    reindex_device(args.device_id, removed=removed)
     print("✅ Provisioned device:", args.device_id, payload)
 
 
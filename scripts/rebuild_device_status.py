@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Rebuild the device last-seen index (/device_status) from /records.
+
+The API keeps /device_status up to date on ingest; run this once to seed it
+for devices that have not sent data since, or to repair it. /records is read
+in key-ordered pages, so memory stays bounded by the number of devices.
+
+Examples:
+  python scripts/rebuild_device_status.py
+  python scripts/rebuild_device_status.py --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from provision_device import ensure_firebase_initialized, load_environment  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Rebuild /device_status from /records")
+    parser.add_argument("--page-size", type=int, default=5000, help="Records read per RTDB query")
+    parser.add_argument("--dry-run", action="store_true", help="Print the rebuilt index without writing")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    load_environment()
+    ensure_firebase_initialized()
+    from firebase_admin import db
+    from api.device_status import status_deltas
+    from api.record_store import iter_record_pages, partition_for
+
+    today = partition_for(int(time.time() * 1000))
+    statuses: dict = {}
+    scanned = 0
+    for page in iter_record_pages("/records", args.page_size):
+        scanned += len(page)
+        for device_id, delta in status_deltas((record for _, record in page), today).items():
+            status = statuses.setdefault(device_id, {"last_ts": None, "last_user": None, "day": today, "samples_today": 0})
+            if status["last_ts"] is None or delta["last_ts"] > status["last_ts"]:
+                status["last_ts"] = delta["last_ts"]
+                status["last_user"] = delta["last_user"]
+            status["samples_today"] += delta["samples_today"]
+        print(f"… scanned {scanned} records, {len(statuses)} devices")
+
+    if args.dry_run:
+        for device_id, status in sorted(statuses.items()):
+            print(f"{device_id}: {status}")
+    elif statuses:
+        db.reference("/").update({f"device_status/{device_id}": status for device_id, status in statuses.items()})
+    action = "Would write" if args.dry_run else "Wrote"
+    print(f"✅ {action} status for {len(statuses)} devices from {scanned} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Rebuild the per-user device index (/user_devices) from /devices and /device_users.
+
+The API keeps /user_devices up to date whenever membership changes; run this
+once to seed it, or to repair it. The whole index is replaced, so stale
+entries are dropped; memberships of devices that no longer exist under
+/devices are skipped. Afterwards /migrations/user_devices is marked complete,
+which switches GET /api/records/user/devices from scanning every device to
+reading the index.
+
+Examples:
+  python scripts/rebuild_user_devices.py
+  python scripts/rebuild_user_devices.py --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from provision_device import ensure_firebase_initialized, load_environment  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Rebuild /user_devices from /devices and /device_users")
+    parser.add_argument("--dry-run", action="store_true", help="Print the rebuilt index without writing")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    load_environment()
+    ensure_firebase_initialized()
+    from firebase_admin import db
+    from api.device_access import USER_DEVICES_MIGRATION, USER_DEVICES_ROOT, build_user_devices_index
+
+    devices = db.reference("/devices").get() or {}
+    device_users = db.reference("/device_users").get() or {}
+    index = build_user_devices_index(devices, device_users)
+    entries = sum(len(user_devices) for user_devices in index.values())
+
+    if args.dry_run:
+        for uid, user_devices in sorted(index.items()):
+            print(f"{uid}: {sorted(user_devices)}")
+    else:
+        db.reference(f"/{USER_DEVICES_ROOT}").set(index)
+        db.reference(f"/{USER_DEVICES_MIGRATION}").set({"complete": True, "completed_at": int(time.time() * 1000)})
+    action = "Would write" if args.dry_run else "Wrote"
+    print(f"✅ {action} {entries} entries for {len(index)} users from {len(devices)} devices")
+
+
+if __name__ == "__main__":
+    main()
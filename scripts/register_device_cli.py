@@ -146,6 +146,15 @@ def main() -> None:
         payload["user_id"] = user_uid
 
     ref.set(payload)
+
+    # Keep the users' /user_devices index in step (see api/device_access.py);
+    # an owner replaced (or dropped) here loses their entry
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from api.device_access import reindex_device
+
+    previous_owner = existing.get("user_id") if isinstance(existing, dict) else None
+    removed = [previous_owner] if previous_owner and previous_owner != user_uid else []
+    reindex_device(device_id, removed=removed)
     print("✅ Device registered/updated successfully")
     print("Device:", device_id)
     print("Data:", payload)
@@ -1,5 +1,6 @@
 """Test configuration and fixtures."""
 import pytest
+import copy
 import os
 import tempfile
 from fastapi.testclient import TestClient
@@ -7,6 +8,165 @@ from unittest.mock import Mock, patch
 import firebase_admin
 from firebase_admin import credentials, db, auth as firebase_auth
 
+from api.push_ids import push_id_floor
+
+# 2023-11-14T00:00:00Z, the start of a UTC day
+T0 = 1_699_920_000_000
+HOUR = 3_600_000
+DAY = 86_400_000
+
+
+def make_record(ts, uid="test_user_123", device_id="test_device_123", heart_rate=72, spo2=98):
+    """A stored vitals record."""
+    return {"userId": uid, "device_id": device_id, "ts": ts, "spo2": spo2, "heart_rate": heart_rate}
+
+
+def push_key(ts, suffix="aaaaaaaaaaaa"):
+    """A push ID generated at `ts`."""
+    return push_id_floor(ts)[:8] + suffix
+
+
+class FakeDatabase(dict):
+    """The in-memory RTDB tree; `reads` logs every query FakeRef.get served."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+
+class FakeRef:
+    """A db.reference over an in-memory tree.
+    
+    Supports key or child ordering with bounds and limits, shallow reads,
+    set/update (multi-path)/delete and transactions.
+    """
+    
+    def __init__(self, tree, parts):
+        self.tree = tree
+        self.parts = parts
+        self.order = None
+        self.start = self.end = self.first = self.last = None
+    
+    def _node(self):
+        node = self.tree
+        for part in self.parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+    
+    def _put(self, parts, value):
+        node = self.tree
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+    
+    def child(self, path):
+        return FakeRef(self.tree, self.parts + [p for p in path.strip("/").split("/") if p])
+    
+    def order_by_key(self):
+        self.order = "key"
+        return self
+    
+    def order_by_child(self, child):
+        self.order = child
+        return self
+    
+    def start_at(self, value):
+        self.start = value
+        return self
+    
+    def end_at(self, value):
+        self.end = value
+        return self
+    
+    def limit_to_first(self, count):
+        self.first = count
+        return self
+    
+    def limit_to_last(self, count):
+        self.last = count
+        return self
+    
+    def get(self, shallow=False):
+        if isinstance(self.tree, FakeDatabase):
+            self.tree.reads.append({
+                "path": "/" + "/".join(self.parts), "order": self.order, "start": self.start,
+                "end": self.end, "first": self.first, "last": self.last, "shallow": shallow,
+            })
+        node = copy.deepcopy(self._node())
+        if shallow and isinstance(node, dict):
+            return {key: True for key in node}
+        if not isinstance(node, dict) or self.order is None:
+            return node
+        value = (lambda item: item[0]) if self.order == "key" else (lambda item: item[1].get(self.order))
+        rows = sorted(
+            (item for item in node.items()
+             if (self.start is None or value(item) >= self.start)
+             and (self.end is None or value(item) <= self.end)),
+            key=lambda item: (value(item), item[0]),
+        )
+        if self.first is not None:
+            rows = rows[:self.first]
+        if self.last is not None:
+            rows = rows[-self.last:]
+        return dict(rows)
+    
+    def set(self, value):
+        if self.parts:
+            self._put(self.parts, value)
+        else:
+            self.tree.clear()
+            self.tree.update(copy.deepcopy(value or {}))
+    
+    def update(self, updates):
+        for path, value in updates.items():
+            self._put(self.parts + [p for p in path.strip("/").split("/") if p], value)
+    
+    def delete(self):
+        self.set(None)
+    
+    def transaction(self, update):
+        value = update(copy.deepcopy(self._node()))
+        self.set(value)
+        return value
+
+
+@pytest.fixture
+def rtdb(mock_firebase):
+    """Back db.reference with an in-memory tree; fill in the returned dict."""
+    tree = FakeDatabase()
+    mock_firebase["db_ref"].side_effect = lambda path="/": FakeRef(tree, [p for p in path.strip("/").split("/") if p])
+    return tree
+
+
+@pytest.fixture(autouse=True)
+def reset_api_caches():
+    """Reset in-process caches and rate limits so state doesn't leak between tests."""
+    from api.cache import clear_all_caches
+    from api.rate_limit import reset_rate_limits
+    clear_all_caches()
+    reset_rate_limits()
+    yield
+    clear_all_caches()
+    reset_rate_limits()
+
+
+@pytest.fixture(autouse=True)
+def derived_queue(monkeypatch):
+    """Hold derived-data updates (rollups) until the test calls `flush()`."""
+    from api import ingest_queue
+    queue = ingest_queue.IngestQueue(flush_size=10**9, flush_interval=3600, writer=ingest_queue.apply_derived)
+    monkeypatch.setattr(ingest_queue, "derived_queue", queue)
+    monkeypatch.setattr(ingest_queue, "DERIVED_WRITE_BEHIND", True)
+    yield queue
+    # Discard what the test left queued rather than writing it after the mocks are gone
+    queue._writer = lambda batch: None
+    queue.drain(timeout=1)
+
 
 @pytest.fixture
 def mock_firebase():
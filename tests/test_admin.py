@@ -116,15 +116,17 @@ class TestAdminEndpoints:
         # Mock Firebase calls
         mock_firebase["ref"].get.side_effect = [
             mock_devices,  # All devices
-            {"record1": {"ts": 1700002000000}},  # Last record for device1
-            {"record2": {"ts": 1700003000000}}   # Last record for device2
+            {  # Device status index
+                "device1": {"last_ts": 1700002000000, "last_user": "user_123"},
+                "device2": {"last_ts": 1700003000000, "last_user": "user_456"}
+            }
         ]
         
-        with patch('firebase_admin.auth.get_user') as mock_get_user:
-            mock_user = Mock()
-            mock_user.email = "user@example.com"
-            mock_user.display_name = "Test User"
-            mock_get_user.return_value = mock_user
+        with patch('firebase_admin.auth.get_users') as mock_get_users:
+            mock_get_users.return_value = Mock(
+                users=[Mock(uid=uid, email="user@example.com", display_name="Test User") for uid in ("user_123", "user_456")],
+                not_found=[],
+            )
             
             response = test_client.get(
                 "/api/admin/devices",
@@ -137,6 +139,10 @@ class TestAdminEndpoints:
         assert data["total"] == 2
         # Should be sorted by registration date descending
         assert data["devices"][0]["registeredAt"] >= data["devices"][1]["registeredAt"]
+        assert data["devices"][0]["lastActive"] == 1700003000000
+        assert data["devices"][0]["userDisplayName"] == "Test User"
+        assert mock_firebase["ref"].get.call_count == 2
+        mock_get_users.assert_called_once()
     
     def test_delete_device_success(self, test_client, mock_firebase, admin_user_token):
         """Test deleting device as admin."""
@@ -186,8 +192,7 @@ class TestAdminEndpoints:
         
         mock_firebase["ref"].get.side_effect = [
             mock_user_devices,  # User devices
-            {"record1": {"ts": 1700002000000}},  # Last record for device1
-            {"record2": {"ts": 1700003000000}}   # Last record for device2
+            {"device1": {"last_ts": 1700002000000}, "device2": {"last_ts": 1700003000000}}  # Device status index
         ]
         
         response = test_client.get(
@@ -298,3 +303,58 @@ class TestAdminEndpoints:
             assert response.status_code == 200
             # Should only update email, not other fields
             mock_update.assert_called_once_with("user_123", email="newemail@example.com")
+    
+    def test_delete_device_invalidates_credentials(self, test_client, mock_firebase, admin_user_token):
+        """Test deleting a device drops its cached secret."""
+        from api.device_auth import get_device_secret
+        mock_firebase["ref"].get.return_value = "device_secret"
+        assert get_device_secret("device_123") == "device_secret"
+        
+        response = test_client.delete(
+            "/api/admin/devices/device_123",
+            headers={"Authorization": "Bearer admin_token"}
+        )
+        assert response.status_code == 200
+        
+        mock_firebase["ref"].get.return_value = None
+        assert get_device_secret("device_123") is None
+    
+    def test_get_metrics(self, test_client, mock_firebase, admin_user_token):
+        """Test cache metrics are reported to admins."""
+        response = test_client.get(
+            "/api/admin/metrics",
+            headers={"Authorization": "Bearer admin_token"}
+        )
+        
+        assert response.status_code == 200
+        names = [c["name"] for c in response.json()["caches"]]
+        assert "device_credentials" in names
+        assert "command_poll" in response.json()["rate_limits"]
+    
+    @patch('firebase_admin.auth.delete_user')
+    @patch('firebase_admin.auth.get_user')
+    def test_delete_user_removes_per_user_data(self, mock_get_user, mock_delete_user, test_client, rtdb, admin_user_token, tmp_path, monkeypatch):
+        """Test deleting a user also drops their v2 copy, rollups, device index and archive."""
+        from api import archive
+        store = archive.LocalArchiveStore(str(tmp_path))
+        monkeypatch.setattr(archive, "_store", store)
+        store.write("user_123", "2023-11-14", b"archived")
+        mock_get_user.return_value = Mock(email="user@example.com", custom_claims=None)
+        rtdb.update({
+            "user_records": {"user_123": {"r1": {"userId": "user_123"}}, "other": {"r2": {"userId": "other"}}},
+            "user_records_v2": {"user_123": {"2023-11-15": {"r1": {"userId": "user_123"}}}},
+            "user_rollups": {"user_123": {"hour": {"0": {"count": 1}}}},
+            "user_devices": {"user_123": {"dev1": {"is_legacy": False}}},
+            "archive_index": {"user_123": {"partitions": {"2023-11-14": 1}}},
+        })
+        
+        response = test_client.delete(
+            "/api/admin/users/user_123",
+            headers={"Authorization": "Bearer admin_token"}
+        )
+        
+        assert response.status_code == 200
+        for root in ("user_records", "user_records_v2", "user_rollups", "user_devices", "archive_index"):
+            assert "user_123" not in rtdb.get(root, {})
+        assert "other" in rtdb["user_records"]
+        assert store.read("user_123", "2023-11-14") is None
@@ -0,0 +1,89 @@
+"""Tests for vectorized bucket aggregation."""
+import numpy as np
+import pytest
+
+from api.aggregate import aggregate_records, record_columns
+from tests.conftest import HOUR, T0, make_record
+
+
+class TestAggregateRecords:
+    """Test per-bucket statistics."""
+    
+    def test_matches_numpy_reference(self):
+        """Test every statistic equals a straightforward per-bucket computation."""
+        rng = np.random.default_rng(7)
+        ts = T0 + rng.integers(0, 3 * HOUR, 2000)
+        heart_rates = rng.integers(50, 130, 2000)
+        records = [make_record(int(t), heart_rate=int(hr), spo2=95) for t, hr in zip(ts, heart_rates)]
+        
+        buckets = aggregate_records(records, HOUR)
+        
+        assert [b["bucket"] for b in buckets] == [T0, T0 + HOUR, T0 + 2 * HOUR]
+        for b in buckets:
+            values = heart_rates[(ts >= b["bucket"]) & (ts < b["bucket"] + HOUR)]
+            stats = b["heart_rate"]
+            assert stats["count"] == b["count"] == len(values)
+            assert stats["mean"] == pytest.approx(values.mean())
+            assert stats["min"] == values.min()
+            assert stats["max"] == values.max()
+            assert stats["p10"] == pytest.approx(np.percentile(values, 10))
+            assert stats["p90"] == pytest.approx(np.percentile(values, 90))
+    
+    def test_missing_values_are_skipped_per_metric(self):
+        """Test a record without spo2 still counts towards heart_rate."""
+        records = [
+            make_record(T0, heart_rate=70, spo2=None),
+            make_record(T0 + 1, heart_rate=80, spo2=97),
+            {"ts": T0 + HOUR, "hr": 60},
+        ]
+        
+        buckets = aggregate_records(records, HOUR)
+        
+        assert buckets[0]["count"] == 2
+        assert buckets[0]["heart_rate"]["count"] == 2
+        assert buckets[0]["spo2"] == {"count": 1, "mean": 97.0, "min": 97.0, "max": 97.0, "p10": 97.0, "p90": 97.0}
+        assert buckets[1]["heart_rate"]["mean"] == 60.0
+        assert buckets[1]["spo2"] is None
+    
+    def test_empty_and_invalid_input(self):
+        """Test records without a numeric ts are ignored."""
+        assert aggregate_records([], HOUR) == []
+        assert aggregate_records([{"ts": None, "heart_rate": 70}], HOUR) == []
+        ts, columns = record_columns([{"ts": T0, "heart_rate": "fast", "spo2": True}])
+        assert np.isnan(columns["heart_rate"][0]) and np.isnan(columns["spo2"][0])
+
+
+class TestAggregateEndpoint:
+    """Test GET /api/records/aggregate."""
+    
+    def test_returns_buckets(self, test_client, auth_headers, mock_firebase):
+        """Test the window is read once and summarized per bucket."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.start_at.return_value = mock_ref
+        mock_ref.end_at.return_value = mock_ref
+        mock_ref.get.return_value = {
+            "k1": make_record(T0 + 1000, heart_rate=60),
+            "k2": make_record(T0 + 2000, heart_rate=80),
+            "k3": make_record(T0 + 300_000, heart_rate=100),
+        }
+        
+        response = test_client.get(
+            "/api/records/aggregate",
+            params={"start": T0, "end": T0 + HOUR - 1, "bucket": "5m"},
+            headers=auth_headers,
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["bucket"] == "5m"
+        assert data["truncated"] is False
+        assert [b["bucket"] for b in data["buckets"]] == [T0, T0 + 300_000]
+        assert data["buckets"][0]["heart_rate"]["mean"] == 70.0
+        mock_ref.start_at.assert_called_once_with(T0)
+    
+    def test_rejects_bad_parameters(self, test_client, auth_headers):
+        """Test unknown buckets, inverted ranges and oversized ranges are client errors."""
+        assert test_client.get("/api/records/aggregate?bucket=2m", headers=auth_headers).status_code == 400
+        assert test_client.get(f"/api/records/aggregate?start={T0 + 1}&end={T0}", headers=auth_headers).status_code == 400
+        response = test_client.get(f"/api/records/aggregate?start=0&end={T0}&bucket=5m", headers=auth_headers)
+        assert response.status_code == 400
@@ -0,0 +1,126 @@
+"""Tests for the cold-storage archive tier and read federation."""
+import pytest
+
+from api import archive
+from api.archive import LocalArchiveStore, archive_cutoff, archive_user_records, decode_partition, with_archived
+from api.export import iter_export_records
+from api.push_ids import push_id_floor
+from api.record_store import query_user_records
+from tests.conftest import DAY, T0, make_record, push_key
+
+CUTOFF = T0 + 2 * DAY
+
+
+@pytest.fixture
+def rtdb(rtdb):
+    """The in-memory RTDB, holding three old and two recent records."""
+    old = {push_key(T0 + i * 3_600_000): make_record(T0 + i * 3_600_000) for i in range(2)}
+    old[push_key(T0 + DAY)] = make_record(T0 + DAY)
+    recent = {push_key(CUTOFF + i * 1000): make_record(CUTOFF + i * 1000) for i in range(2)}
+    rtdb.update({
+        "user_records": {"test_user_123": {**old, **recent}},
+        "user_records_v2": {"test_user_123": {
+            "2023-11-14": {k: v for k, v in old.items() if v["ts"] < T0 + DAY},
+            "2023-11-15": {push_key(T0 + DAY): make_record(T0 + DAY)},
+        }},
+    })
+    return rtdb
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Archive into a temporary directory."""
+    store = LocalArchiveStore(str(tmp_path))
+    monkeypatch.setattr(archive, "_store", store)
+    return store
+
+
+class TestArchiveUserRecords:
+    """Test moving old records out of RTDB."""
+    
+    def test_moves_old_records_into_day_partitions(self, rtdb, store):
+        """Test records before the cutoff land in gzip day files and leave both RTDB layouts."""
+        moved = archive_user_records("test_user_123", CUTOFF, page_size=2)
+        
+        assert moved == 3
+        assert sorted(r["ts"] for r in rtdb["user_records"]["test_user_123"].values()) == [CUTOFF, CUTOFF + 1000]
+        assert rtdb["user_records_v2"]["test_user_123"] == {"2023-11-14": {}, "2023-11-15": {}}
+        assert [r["ts"] for r in decode_partition(store.read("test_user_123", "2023-11-14"))] == [T0, T0 + 3_600_000]
+        index = rtdb["archive_index"]["test_user_123"]
+        assert index["archived_before"] == CUTOFF
+        assert index["archived_key"] == push_id_floor(CUTOFF)
+        assert index["partitions"] == {"2023-11-14": 2, "2023-11-15": 1}
+    
+    def test_rerun_merges_by_key(self, rtdb, store):
+        """Test a record left live by an interrupted run is not archived twice."""
+        archive_user_records("test_user_123", CUTOFF)
+        rtdb["user_records"]["test_user_123"][push_key(T0)] = make_record(T0)
+        
+        assert archive_user_records("test_user_123", CUTOFF) == 1
+        assert len(decode_partition(store.read("test_user_123", "2023-11-14"))) == 2
+        assert rtdb["archive_index"]["test_user_123"]["partitions"]["2023-11-14"] == 2
+    
+    def test_dry_run_changes_nothing(self, rtdb, store):
+        """Test --dry-run only counts."""
+        assert archive_user_records("test_user_123", CUTOFF, dry_run=True) == 3
+        assert len(rtdb["user_records"]["test_user_123"]) == 5
+        assert store.read("test_user_123", "2023-11-14") is None
+    
+    def test_cutoff_is_start_of_utc_day(self):
+        """Test the cutoff rounds down to midnight UTC."""
+        assert archive_cutoff(T0 + 10 * DAY + 12_345, days=8) == CUTOFF
+
+
+class TestFederatedReads:
+    """Test reads that span the archive and RTDB."""
+    
+    def test_query_merges_archived_records(self, rtdb, store):
+        """Test a range reaching past the cutoff gets archived and live rows, newest first."""
+        archive_user_records("test_user_123", CUTOFF)
+        
+        records = query_user_records("test_user_123", 10)
+        
+        assert [r["ts"] for r in records] == [CUTOFF + 1000, CUTOFF, T0 + DAY, T0 + 3_600_000, T0]
+        assert [r["ts"] for r in query_user_records("test_user_123", 10, T0, T0 + DAY - 1)] == [T0 + 3_600_000, T0]
+    
+    def test_live_rows_that_fill_the_page_skip_the_archive(self, rtdb, store, monkeypatch):
+        """Test the archive is not read when the live rows are all newer than the cutoff."""
+        archive_user_records("test_user_123", CUTOFF)
+        reads = []
+        monkeypatch.setattr(store, "read", lambda uid, day: reads.append(day))
+        
+        assert len(query_user_records("test_user_123", 2)) == 2
+        assert reads == []
+    
+    def test_pagination_crosses_tiers(self, test_client, auth_headers, rtdb, store):
+        """Test following next_cursor walks from live records into archived ones."""
+        archive_user_records("test_user_123", CUTOFF)
+        
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, "start_ts": T0}
+            if cursor:
+                params["before"] = cursor
+            body = test_client.get("/api/records/", params=params, headers=auth_headers).json()
+            seen.extend(r["ts"] for r in body["records"])
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        
+        assert seen == [CUTOFF + 1000, CUTOFF, T0 + DAY, T0 + 3_600_000, T0]
+    
+    def test_export_reads_archive_first(self, rtdb, store):
+        """Test the export yields archived partitions, then live rows, without duplicates."""
+        archive_user_records("test_user_123", CUTOFF)
+        rtdb["user_records"]["test_user_123"][push_key(T0)] = make_record(T0)
+        
+        records = list(iter_export_records("test_user_123"))
+        
+        assert [r["ts"] for r in records] == [T0, T0 + 3_600_000, T0 + DAY, CUTOFF, CUTOFF + 1000]
+    
+    def test_disabled_without_store(self, mock_firebase):
+        """Test nothing is read from the archive index when archiving is not configured."""
+        live = [{"id": "k1", **make_record(T0)}]
+        
+        assert with_archived("test_user_123", live, 10, None, None) is live
+        assert mock_firebase["db_ref"].call_count == 0
@@ -0,0 +1,56 @@
+"""Tests for the in-process TTL cache helpers."""
+import time
+
+from api.cache import MISSING, TTLCache
+
+
+class TestTTLCache:
+    """Test bounded TTL caches."""
+    
+    def test_hit_and_miss_counters(self):
+        """Test lookups are counted."""
+        cache = TTLCache("test_counters", maxsize=10, ttl=60)
+        
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+    
+    def test_caches_none_values(self):
+        """Test None is a cacheable value distinct from a miss."""
+        cache = TTLCache("test_none", maxsize=10, ttl=60)
+        cache.set("missing_device", None)
+        
+        assert cache.get("missing_device", MISSING) is None
+        assert cache.get("other", MISSING) is MISSING
+    
+    def test_entries_expire(self):
+        """Test entries disappear after the TTL."""
+        cache = TTLCache("test_expiry", maxsize=10, ttl=0.05)
+        cache.set("a", 1)
+        time.sleep(0.1)
+        
+        assert cache.get("a", MISSING) is MISSING
+    
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when full."""
+        cache = TTLCache("test_lru", maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert cache.contains("a")
+        assert not cache.contains("b")
+    
+    def test_invalidate(self):
+        """Test explicit invalidation."""
+        cache = TTLCache("test_invalidate", maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.invalidate("a")
+        
+        assert cache.get("a", MISSING) is MISSING
@@ -264,3 +264,82 @@ class TestCommandEndpoints:
             assert response.status_code == 200
             data = response.json()
             assert data["status"] == "ok"
+    
+    def test_device_secret_cached_between_requests(self, test_client, mock_firebase, device_headers):
+        """Test repeated polls only read the device secret once."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret verification
+            {"action": "blink", "pattern": [1]},  # Command data
+            {"action": "blink", "pattern": [1]}  # Command data (secret served from cache)
+        ]
+        
+        for _ in range(2):
+            response = test_client.get(
+                "/api/command/test_device_123",
+                headers=device_headers
+            )
+            assert response.status_code == 200
+            assert response.json()["action"] == "blink"
+        
+        assert mock_firebase["ref"].get.call_count == 3
+    
+    def test_reprovisioned_secret_accepted(self, test_client, mock_firebase, device_headers):
+        """Test a stale cached secret is rechecked before rejecting a device."""
+        mock_firebase["ref"].get.side_effect = [
+            "old_secret",  # Cached secret for the first request
+            "test_secret_456",  # Fresh secret after reprovisioning
+            None  # No command exists
+        ]
+        old_headers = {**device_headers, "X-Device-Secret": "old_secret"}
+        
+        response = test_client.post(
+            "/api/command/",
+            json={"action": "noop"},
+            headers=old_headers
+        )
+        assert response.status_code == 200
+        
+        response = test_client.get(
+            "/api/command/test_device_123",
+            headers=device_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["action"] is None
+    
+    def test_wrong_secret_rechecked_once(self, test_client, mock_firebase, device_headers):
+        """Test a device retrying a wrong secret costs one RTDB read, not one per request."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        wrong_headers = {**device_headers, "X-Device-Secret": "wrong"}
+        
+        for _ in range(3):
+            response = test_client.get("/api/command/test_device_123", headers=wrong_headers)
+            assert response.status_code == 401
+        
+        assert mock_firebase["ref"].get.call_count == 1
+    
+    def test_unknown_device_rejected_from_cache(self, test_client, mock_firebase, device_headers):
+        """Test an unprovisioned device ID is not looked up again on every request."""
+        mock_firebase["ref"].get.return_value = None
+        
+        for _ in range(3):
+            response = test_client.get("/api/command/ghost", headers={**device_headers, "X-Device-Id": "ghost"})
+            assert response.status_code == 401
+        
+        assert mock_firebase["ref"].get.call_count == 1
+    
+    def test_get_command_msgpack(self, test_client, mock_firebase, device_headers):
+        """Test command polling can return MessagePack."""
+        import msgpack
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret verification
+            {"action": "blink", "pattern": [1, 0]}  # Command data
+        ]
+        
+        response = test_client.get(
+            "/api/command/test_device_123",
+            headers={**device_headers, "Accept": "application/msgpack"}
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(response.content) == {"action": "blink", "pattern": [1, 0]}
@@ -0,0 +1,109 @@
+"""Tests for seq replay windows."""
+from api.dedup import INGEST_DEDUP_WINDOW, _window_has, find_replays, merge_window, remember_uploads
+from tests.conftest import T0
+
+
+def _seen(window):
+    """The seqs a window marks as stored."""
+    bits = int(window["seen"], 16)
+    return sorted(window["hwm"] - i for i in range(INGEST_DEDUP_WINDOW) if bits >> i & 1)
+
+
+class TestMergeWindow:
+    """Test the high-water mark and seen bitmap merge."""
+    
+    def test_first_batch(self):
+        """Test an empty window starts at the batch."""
+        window = merge_window(None, "b1", [3, 5], T0)
+        
+        assert window["boot"] == "b1"
+        assert window["hwm"] == 5
+        assert _seen(window) == [3, 5]
+        assert window["updated_at"] == T0
+    
+    def test_late_batch_never_lowers_the_mark(self):
+        """Test a batch that lands after a newer one keeps the newer high-water mark."""
+        window = merge_window(merge_window(None, "b1", [10, 11], T0), "b1", [4, 5], T0)
+        
+        assert window["hwm"] == 11
+        assert _seen(window) == [4, 5, 10, 11]
+    
+    def test_window_slides(self):
+        """Test seqs that fall out of the window are forgotten."""
+        window = merge_window(merge_window(None, "b1", [1], T0), "b1", [INGEST_DEDUP_WINDOW + 1], T0)
+        
+        assert _seen(window) == [INGEST_DEDUP_WINDOW + 1]
+    
+    def test_new_boot_starts_over(self):
+        """Test a reboot long before the window fills doesn't inherit the old boot's seqs."""
+        window = merge_window(None, "b1", range(301), T0)
+        
+        assert _window_has(window, "b1", 0)
+        assert not _window_has(window, "b2", 0)
+        
+        window = merge_window(window, "b2", [0, 1], T0)
+        
+        assert window["boot"] == "b2"
+        assert window["hwm"] == 1
+        assert _seen(window) == [0, 1]
+
+
+class TestFindReplays:
+    """Test replays are recognised only for seqs that were stored."""
+    
+    def test_only_seen_seqs_inside_the_window_are_replays(self, rtdb):
+        """Test a retried batch that failed to store is not dropped for sitting below the mark."""
+        rtdb["device_seq"] = {"dev1": {
+            "last": {"boots": ["b1"], "seqs": [9], "keys": ["key_9"]},
+            "window": merge_window(None, "b1", [5, 9], T0),
+        }}
+        
+        replays = find_replays("dev1", [("b1", 5), ("b1", 6), ("b1", 9), ("b1", 10)])
+        
+        assert replays == {("b1", 5): None, ("b1", 9): "key_9"}
+    
+    def test_reboot_with_a_small_high_water_mark(self, rtdb):
+        """Test readings after a reboot aren't replays of the previous boot's seqs, here or in RTDB."""
+        rtdb["device_seq"] = {"dev1": {
+            "last": {"boots": ["b1"], "seqs": [300], "keys": ["key_300"]},
+            "window": merge_window(None, "b1", range(301), T0),
+        }}
+        remember_uploads("dev1", [(("b1", 0), "key_0"), (("b1", 1), "key_1")])
+        
+        assert find_replays("dev1", [("b2", 0), ("b2", 1), ("b2", 300)]) == {}
+        assert find_replays("dev1", [("b1", 0), ("b1", 300)]) == {("b1", 0): "key_0", ("b1", 300): "key_300"}
+    
+    def test_seq_windows_merge_on_the_derived_queue(self, test_client, rtdb, derived_queue, device_headers):
+        """Test stored seqs reach /device_seq/{id}/window when the derived-data queue flushes."""
+        rtdb["devices"] = {"test_device_123": {"secret": "test_secret_456", "user_id": "test_user_123"}}
+        rtdb["device_seq"] = {"test_device_123": {"window": merge_window(None, "b1", [20], T0)}}
+        
+        response = test_client.post(
+            "/api/records/batch",
+            json=[
+                {"spo2": 98, "heart_rate": 75, "seq": 7, "boot": "b1"},
+                {"spo2": 98, "heart_rate": 75, "seq": 8, "boot": "b1"},
+            ],
+            headers=device_headers,
+        )
+        assert response.status_code == 200
+        assert _seen(rtdb["device_seq"]["test_device_123"]["window"]) == [20]
+        
+        derived_queue.flush()
+        
+        window = rtdb["device_seq"]["test_device_123"]["window"]
+        assert window["hwm"] == 20
+        assert _seen(window) == [7, 8, 20]
+        assert rtdb["device_seq"]["test_device_123"]["last"]["seqs"] == [7, 8]
+    
+    def test_seq_without_boot_is_never_a_replay(self, test_client, rtdb, device_headers):
+        """Test a seq sent without a boot ID is stored every time."""
+        rtdb["devices"] = {"test_device_123": {"secret": "test_secret_456", "user_id": "test_user_123"}}
+        payload = {"spo2": 98, "heart_rate": 75, "seq": 0}
+        
+        first = test_client.post("/api/records/", json=payload, headers=device_headers)
+        second = test_client.post("/api/records/", json=payload, headers=device_headers)
+        
+        assert first.json()["key"] != second.json()["key"]
+        assert "duplicate" not in second.json()
+        assert "device_seq" not in rtdb
@@ -0,0 +1,78 @@
+"""Tests for the device last-seen index."""
+from api.device_status import describe_status, merge_status, status_deltas
+from api.ingest import write_records
+from tests.conftest import T0, make_record
+
+TODAY = "2023-11-14"
+
+
+class TestDeviceStatus:
+    """Test status folding and day rollover."""
+    
+    def test_deltas_track_latest_record_and_todays_samples(self):
+        """Test the newest record wins and only today's samples are counted."""
+        deltas = status_deltas([
+            make_record(T0 + 5000, uid="user_b"),
+            make_record(T0 + 1000),
+            make_record(T0 - 1000),
+        ], TODAY)
+        
+        assert deltas["test_device_123"] == {"last_ts": T0 + 5000, "last_user": "user_b", "samples_today": 2}
+    
+    def test_merge_increments_same_day(self):
+        """Test samples accumulate within a day."""
+        current = {"last_ts": T0 + 10, "last_user": "u", "day": TODAY, "samples_today": 5}
+        merged = merge_status(current, {"last_ts": T0 + 20, "last_user": "u", "samples_today": 2}, TODAY)
+        
+        assert merged["samples_today"] == 7
+        assert merged["last_ts"] == T0 + 20
+    
+    def test_merge_resets_on_new_day(self):
+        """Test the counter restarts when the stored day is stale."""
+        current = {"last_ts": T0 - 10, "last_user": "u", "day": "2023-11-13", "samples_today": 500}
+        merged = merge_status(current, {"last_ts": T0 + 20, "last_user": "u", "samples_today": 1}, TODAY)
+        
+        assert merged["day"] == TODAY
+        assert merged["samples_today"] == 1
+    
+    def test_merge_keeps_newer_stored_record(self):
+        """Test a late, older write does not move last_ts backwards."""
+        current = {"last_ts": T0 + 100, "last_user": "newer", "day": TODAY, "samples_today": 1}
+        merged = merge_status(current, {"last_ts": T0 + 50, "last_user": "older", "samples_today": 1}, TODAY)
+        
+        assert merged["last_ts"] == T0 + 100
+        assert merged["last_user"] == "newer"
+    
+    def test_describe_hides_stale_counter(self):
+        """Test yesterday's count is reported as zero today."""
+        status = {"last_ts": T0 - 10, "last_user": "u", "day": "2023-11-13", "samples_today": 9}
+        
+        assert describe_status(status, now_ms=T0 + 1000)["samplesToday"] == 0
+        assert describe_status(status, now_ms=T0 - 1000)["samplesToday"] == 9
+    
+    def test_write_records_sets_last_seen_in_the_record_update(self, mock_firebase):
+        """Test last_ts/last_user ride along in the single multi-path update, with no transaction."""
+        write_records([
+            ("k1", make_record(T0)),
+            ("k2", make_record(T0 + 1, uid="user_b")),
+            ("k3", make_record(T0, device_id="other")),
+        ])
+        
+        mock_firebase["ref"].update.assert_called_once()
+        mock_firebase["ref"].transaction.assert_not_called()
+        updates = mock_firebase["ref"].update.call_args[0][0]
+        assert updates["device_status/test_device_123/last_ts"] == T0 + 1
+        assert updates["device_status/test_device_123/last_user"] == "user_b"
+        assert updates["device_status/other/last_ts"] == T0
+    
+    def test_counter_transaction_runs_on_the_queue(self, mock_firebase, derived_queue):
+        """Test the daily counter gets one transaction per device when the queue flushes."""
+        write_records([("k1", make_record(T0)), ("k2", make_record(T0 + 1))])
+        write_records([("k3", make_record(T0, device_id="other"))])
+        mock_firebase["db_ref"].reset_mock()
+        
+        derived_queue.flush()
+        
+        paths = [call.args[0] for call in mock_firebase["db_ref"].call_args_list]
+        assert paths.count("/device_status/test_device_123") == 1
+        assert paths.count("/device_status/other") == 1
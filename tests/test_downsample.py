@@ -0,0 +1,119 @@
+"""Tests for LTTB downsampling."""
+import numpy as np
+import pytest
+
+from api.downsample import downsample_records, lttb_indices
+from tests.conftest import T0, make_record
+
+
+def _reference_lttb(x, y, n_out):
+    """Straightforward scalar LTTB used as the oracle."""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    selected, a = [0], 0
+    for i in range(n_out - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        next_lo, next_hi = hi, min(int((i + 2) * every) + 1, n)
+        if i == n_out - 3:
+            hi, next_lo, next_hi = n - 1, n - 1, n
+        cx, cy = np.mean(x[next_lo:next_hi]), np.mean(y[next_lo:next_hi])
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+class TestLttbIndices:
+    """Test the vectorized LTTB selection."""
+    
+    def test_matches_reference_implementation(self):
+        """Test the selection equals a scalar LTTB on noisy data."""
+        rng = np.random.default_rng(3)
+        x = np.arange(997, dtype=np.float64)
+        y = np.cumsum(rng.normal(size=997))
+        
+        assert list(lttb_indices(x, y, 50)) == _reference_lttb(x, y, 50)
+    
+    def test_keeps_extremes_and_endpoints(self):
+        """Test a single spike survives heavy downsampling."""
+        x = np.arange(100_000)
+        y = np.zeros(100_000)
+        y[54_321] = 100
+        
+        indices = lttb_indices(x, y, 100)
+        
+        assert len(indices) == 100
+        assert indices[0] == 0 and indices[-1] == 99_999
+        assert 54_321 in indices
+        assert np.all(np.diff(indices) > 0)
+    
+    def test_short_series_and_bad_target(self):
+        """Test series already under the target are returned whole."""
+        assert list(lttb_indices(np.arange(5), np.arange(5), 10)) == [0, 1, 2, 3, 4]
+        with pytest.raises(ValueError):
+            lttb_indices(np.arange(5), np.arange(5), 2)
+
+
+class TestDownsampleRecords:
+    """Test record-level downsampling."""
+    
+    def test_budget_and_both_metrics_keep_shape(self):
+        """Test the result fits max_points and keeps each metric's outlier."""
+        records = [make_record(T0 + i * 1000, heart_rate=70, spo2=98) for i in range(10_000)]
+        records[1234]["heart_rate"] = 180
+        records[8765]["spo2"] = 80
+        
+        result = downsample_records(records, 200)
+        
+        assert len(result) <= 200
+        assert [r["ts"] for r in result] == sorted(r["ts"] for r in result)
+        assert any(r["heart_rate"] == 180 for r in result)
+        assert any(r["spo2"] == 80 for r in result)
+    
+    def test_never_exceeds_a_small_budget(self):
+        """Test budgets too small to split between metrics are still respected."""
+        records = [make_record(T0 + i * 1000, heart_rate=60 + i % 7, spo2=90 + i % 5) for i in range(100)]
+        
+        for max_points in range(3, 8):
+            assert len(downsample_records(records, max_points)) <= max_points
+        with pytest.raises(ValueError):
+            downsample_records(records, 2)
+    
+    def test_small_window_is_untouched(self):
+        """Test windows under the budget come back sorted and complete."""
+        records = [make_record(T0 + 2000), make_record(T0 + 1000)]
+        
+        assert [r["ts"] for r in downsample_records(records, 100)] == [T0 + 1000, T0 + 2000]
+
+
+class TestMaxPointsParameter:
+    """Test GET /api/records?max_points=."""
+    
+    def test_returns_downsampled_window(self, test_client, auth_headers, rtdb):
+        """Test the window is reduced to the budget, newest first."""
+        rtdb["user_records"] = {"test_user_123": {
+            f"k{i:05d}": make_record(T0 + i * 1000, heart_rate=60 + i % 40) for i in range(5000)
+        }}
+        
+        response = test_client.get(
+            "/api/records/",
+            params={"start_ts": T0, "end_ts": T0 + 5_000_000, "max_points": 100},
+            headers=auth_headers,
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["records"]) <= 100
+        assert data["downsampled_from"] == 5000
+        assert data["next_cursor"] is None
+        assert data["records"][0]["ts"] > data["records"][-1]["ts"]
+    
+    def test_rejects_bad_max_points(self, test_client, auth_headers):
+        """Test out-of-range budgets and cursor combinations are client errors."""
+        assert test_client.get("/api/records/?max_points=2", headers=auth_headers).status_code == 400
+        assert test_client.get("/api/records/?max_points=10&before=abc", headers=auth_headers).status_code == 400
@@ -0,0 +1,160 @@
+"""Tests for conditional GET (ETag / If-None-Match) on polled reads."""
+from api.etags import etag_matches, make_etag
+from api.ingest import write_records
+from tests.conftest import T0, make_record
+
+
+def _profile(updated_at):
+    return {
+        "year_of_birth": 1990,
+        "age": 36,
+        "sex": "female",
+        "height": 160.0,
+        "weight": 55.0,
+        "timezone": "Asia/Ho_Chi_Minh",
+        "updated_at": updated_at,
+    }
+
+
+class TestEtagMatching:
+    """Test If-None-Match comparison."""
+    
+    def test_weak_comparison_and_lists(self):
+        """Test W/ prefixes are ignored and any listed tag may match."""
+        etag = make_etag("records", "k1")
+        
+        assert etag_matches(etag, etag)
+        assert etag_matches(etag.removeprefix("W/"), etag)
+        assert etag_matches(f'"other", {etag}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"other"', etag)
+        assert not etag_matches(None, etag)
+    
+    def test_etag_depends_on_parts(self):
+        """Test different validators or parameters give different tags."""
+        assert make_etag("records", "k1", 10) != make_etag("records", "k1", 20)
+        assert make_etag("records", "k1", 10) != make_etag("records", "k2", 10)
+
+
+class TestConditionalRecords:
+    """Test ETags on GET /api/records."""
+    
+    def test_unchanged_poll_skips_rtdb(self, test_client, auth_headers, mock_firebase):
+        """Test a matching If-None-Match gets 304 without reading RTDB again."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.order_by_key.return_value = mock_ref
+        mock_ref.get.return_value = {"k1": make_record(T0)}
+        
+        first = test_client.get("/api/records/?limit=10", headers=auth_headers)
+        reads = mock_ref.get.call_count
+        second = test_client.get(
+            "/api/records/?limit=10", headers={**auth_headers, "If-None-Match": first.headers["etag"]}
+        )
+        
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == "private, no-cache"
+        assert second.status_code == 304
+        assert second.content == b""
+        assert mock_ref.get.call_count == reads
+    
+    def test_new_record_changes_etag(self, test_client, auth_headers, mock_firebase):
+        """Test a record written by this instance invalidates the cached validator."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.order_by_key.return_value = mock_ref
+        mock_ref.get.return_value = {"k1": make_record(T0)}
+        etag = test_client.get("/api/records/?limit=10", headers=auth_headers).headers["etag"]
+        
+        mock_ref.transaction.return_value = None
+        write_records([("k2", make_record(T0 + 1000))])
+        mock_ref.get.return_value = {"k1": make_record(T0), "k2": make_record(T0 + 1000)}
+        response = test_client.get("/api/records/?limit=10", headers={**auth_headers, "If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert len(response.json()) == 2
+    
+    def test_etag_covers_query_parameters(self, test_client, auth_headers, mock_firebase):
+        """Test a tag from one query does not validate a different one."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.order_by_key.return_value = mock_ref
+        mock_ref.get.return_value = {"k1": make_record(T0)}
+        etag = test_client.get("/api/records/?limit=10", headers=auth_headers).headers["etag"]
+        
+        response = test_client.get("/api/records/?limit=20", headers={**auth_headers, "If-None-Match": etag})
+        
+        assert response.status_code == 200
+
+
+class TestConditionalProfile:
+    """Test ETags on GET /api/profile."""
+    
+    def test_unchanged_profile_gets_304(self, test_client, auth_headers, mock_firebase):
+        """Test the cached updated_at validator answers without an RTDB read."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.get.return_value = _profile("2026-01-01T00:00:00")
+        
+        first = test_client.get("/api/profile/", headers=auth_headers)
+        second = test_client.get("/api/profile/", headers={**auth_headers, "If-None-Match": first.headers["etag"]})
+        
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert mock_ref.get.call_count == 1
+    
+    def test_update_invalidates_profile_etag(self, test_client, auth_headers, mock_firebase):
+        """Test a profile update is visible to the next conditional GET."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.get.return_value = _profile("2026-01-01T00:00:00")
+        etag = test_client.get("/api/profile/", headers=auth_headers).headers["etag"]
+        
+        test_client.put("/api/profile/", json={"weight": 56.0}, headers=auth_headers)
+        mock_ref.get.return_value = _profile("2026-01-02T00:00:00")
+        response = test_client.get("/api/profile/", headers={**auth_headers, "If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+
+class TestConditionalDevices:
+    """Test ETags on GET /api/records/user/devices."""
+    
+    def test_unchanged_device_list_gets_304(self, test_client, auth_headers, mock_firebase):
+        """Test a repeated poll is answered from the cached validator."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.get.side_effect = [
+            {"complete": True},  # /user_devices migration marker
+            {"device_1": {"registered_at": T0, "is_legacy": False}},
+            {"secret": "s1"},  # device_1, for its user count
+            {"test_user_123": {"registered_at": T0}},
+        ]
+        
+        first = test_client.get("/api/records/user/devices", headers=auth_headers)
+        second = test_client.get(
+            "/api/records/user/devices", headers={**auth_headers, "If-None-Match": first.headers["etag"]}
+        )
+        
+        assert first.status_code == 200
+        assert first.json()["devices"][0]["device_id"] == "device_1"
+        assert second.status_code == 304
+        assert mock_ref.get.call_count == 4
+    
+    def test_membership_change_invalidates(self, test_client, auth_headers, mock_firebase):
+        """Test device membership changes drop cached device-list validators."""
+        from api.device_access import invalidate_device_access
+        
+        mock_ref = mock_firebase["ref"]
+        mock_ref.get.side_effect = [
+            {"complete": True},  # /user_devices migration marker
+            {"device_1": {"registered_at": T0, "is_legacy": False}},
+            {"secret": "s1"},
+            {"test_user_123": {"registered_at": T0}},
+            {"device_1": {"registered_at": T0, "is_legacy": False}},
+            {"secret": "s1"},
+            {"test_user_123": {"registered_at": T0}, "other_user": {"registered_at": T0}},
+        ]
+        etag = test_client.get("/api/records/user/devices", headers=auth_headers).headers["etag"]
+        
+        invalidate_device_access("device_1")
+        response = test_client.get("/api/records/user/devices", headers={**auth_headers, "If-None-Match": etag})
+        
+        assert response.status_code == 200
+        assert response.json()["devices"][0]["user_count"] == 2
@@ -0,0 +1,89 @@
+"""Tests for the streaming NDJSON/CSV export."""
+import json
+
+from api.export import encode_export, iter_export_records
+from api.push_ids import push_id_floor
+from tests.conftest import T0, make_record, push_key
+
+
+class TestIterExportRecords:
+    """Test the paged reader behind the export."""
+    
+    def test_reads_bounded_pages(self, rtdb):
+        """Test every record is yielded once while each read asks for a small page."""
+        rows = {f"k{i:02d}": make_record(T0 + i * 1000) for i in range(7)}
+        rtdb["user_records"] = {"test_user_123": rows}
+        
+        records = list(iter_export_records("test_user_123", page_size=3))
+        
+        assert [r["id"] for r in records] == sorted(rows)
+        assert all(read["first"] <= 4 for read in rtdb.reads)
+        assert len(rtdb.reads) == 3
+    
+    def test_start_and_end_bound_ts(self, rtdb):
+        """Test start seeks by key and both bounds filter on ts."""
+        rows = {push_key(T0 + i * 60_000): make_record(T0 + i * 60_000) for i in range(5)}
+        rtdb["user_records"] = {"test_user_123": rows}
+        
+        records = list(iter_export_records("test_user_123", T0 + 60_000, T0 + 180_000))
+        
+        assert [r["ts"] for r in records] == [T0 + 60_000, T0 + 120_000, T0 + 180_000]
+        assert rtdb.reads[0]["start"] == push_id_floor(T0 + 60_000 - 5000)
+
+
+class TestEncodeExport:
+    """Test NDJSON and CSV encoding."""
+    
+    def test_ndjson_lines_in_chunks(self):
+        """Test one JSON object per line, emitted a chunk at a time."""
+        records = [{"id": f"k{i}", **make_record(T0 + i)} for i in range(5)]
+        
+        chunks = list(encode_export(iter(records), "ndjson", chunk_size=2))
+        
+        assert len(chunks) == 3
+        lines = "".join(chunks).splitlines()
+        assert [json.loads(line) for line in lines] == records
+    
+    def test_csv_header_and_legacy_fields(self):
+        """Test CSV has a header row and legacy hr fills heart_rate."""
+        records = [{"id": "k1", "ts": T0, "device_id": "d1", "hr": 60, "spo2": 97}]
+        
+        text = "".join(encode_export(iter(records), "csv"))
+        
+        assert text == f"id,ts,device_id,heart_rate,spo2\nk1,{T0},d1,60,97\n"
+
+
+class TestExportEndpoint:
+    """Test GET /api/records/export."""
+    
+    def test_streams_csv_download(self, test_client, auth_headers, rtdb):
+        """Test the history is sent as a CSV attachment."""
+        rtdb["user_records"] = {"test_user_123": {
+            "k1": make_record(T0, heart_rate=70),
+            "k2": make_record(T0 + 1000, heart_rate=80),
+        }}
+        
+        response = test_client.get("/api/records/export?format=csv", headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        assert response.text.splitlines()[1:] == [
+            f"k1,{T0},test_device_123,70,98",
+            f"k2,{T0 + 1000},test_device_123,80,98",
+        ]
+    
+    def test_streams_ndjson(self, test_client, auth_headers, rtdb):
+        """Test NDJSON is the default format."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0)}}
+        
+        response = test_client.get("/api/records/export", headers=auth_headers)
+        
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert json.loads(response.text) == {"id": "k1", **make_record(T0)}
+    
+    def test_rejects_bad_parameters(self, test_client, auth_headers):
+        """Test unknown formats and inverted ranges are client errors."""
+        assert test_client.get("/api/records/export?format=xml", headers=auth_headers).status_code == 400
+        assert test_client.get(f"/api/records/export?start={T0 + 1}&end={T0}", headers=auth_headers).status_code == 400
+        assert test_client.get("/api/records/export").status_code == 401
@@ -0,0 +1,173 @@
+"""Tests for the write-behind ingest queue."""
+import threading
+
+import pytest
+
+from api.ingest_queue import IngestQueue, wants_async
+
+
+def _entries(n, start=0):
+    return [(f"key{i:04d}", {"userId": "u1", "device_id": "d1", "spo2": 98, "heart_rate": 70, "ts": i})
+            for i in range(start, start + n)]
+
+
+class RecordingWriter:
+    """Collects flushed batches; optionally fails the first N calls."""
+    
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+        self.flushed = threading.Event()
+    
+    def __call__(self, batch):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("rtdb unavailable")
+        self.batches.append(list(batch))
+        self.flushed.set()
+
+
+class TestIngestQueue:
+    """Test buffering, coalescing and backpressure."""
+    
+    def test_flushes_on_size(self):
+        """Test a full batch is flushed as one coalesced write."""
+        writer = RecordingWriter()
+        queue = IngestQueue(max_records=100, flush_size=5, flush_interval=60, writer=writer)
+        
+        assert queue.offer(_entries(5))
+        assert writer.flushed.wait(2)
+        queue.drain()
+        
+        assert len(writer.batches) == 1
+        assert len(writer.batches[0]) == 5
+    
+    def test_flushes_on_interval(self):
+        """Test a partial batch is flushed once it has waited long enough."""
+        writer = RecordingWriter()
+        queue = IngestQueue(max_records=100, flush_size=50, flush_interval=0.05, writer=writer)
+        
+        queue.offer(_entries(2))
+        assert writer.flushed.wait(2)
+        queue.drain()
+        
+        assert sum(len(b) for b in writer.batches) == 2
+    
+    def test_backpressure_when_full(self):
+        """Test offers are rejected all-or-nothing once the buffer is full."""
+        writer = RecordingWriter()
+        queue = IngestQueue(max_records=3, flush_size=100, flush_interval=60, writer=writer)
+        
+        assert queue.offer(_entries(2))
+        assert not queue.offer(_entries(2, start=2))
+        assert queue.depth() == 2
+        assert queue.stats()["rejected_total"] == 2
+        queue.drain()
+    
+    def test_drain_writes_remaining_records(self):
+        """Test shutdown drain flushes everything still buffered."""
+        writer = RecordingWriter()
+        queue = IngestQueue(max_records=100, flush_size=100, flush_interval=60, writer=writer)
+        
+        queue.offer(_entries(7))
+        written = queue.drain()
+        
+        assert written == 7
+        assert queue.depth() == 0
+        assert not queue.offer(_entries(1))
+    
+    def test_failed_flush_is_retried(self):
+        """Test records survive a failed flush and keep their order."""
+        writer = RecordingWriter(fail_times=1)
+        queue = IngestQueue(max_records=100, flush_size=3, flush_interval=0.01, writer=writer)
+        
+        queue.offer(_entries(3))
+        assert writer.flushed.wait(2)
+        queue.drain()
+        
+        assert [k for k, _ in writer.batches[0]] == ["key0000", "key0001", "key0002"]
+        stats = queue.stats()
+        assert stats["flush_failures"] == 1
+        assert stats["flushed_records_total"] == 3
+        assert stats["last_flush_ms"] is not None
+    
+    def test_rejected_record_is_isolated_and_dropped(self):
+        """Test a record the writer always refuses no longer blocks the records around it."""
+        def writer(batch):
+            if any(key == "key0001" for key, _ in batch):
+                raise RuntimeError("invalid data")
+            written.extend(key for key, _ in batch)
+        
+        written = []
+        queue = IngestQueue(max_records=100, flush_size=3, flush_interval=60, writer=writer, max_attempts=2)
+        queue.offer(_entries(3))
+        
+        while queue.depth():
+            queue.flush()
+        
+        assert written == ["key0000", "key0002"]
+        stats = queue.stats()
+        assert stats["dead_lettered_total"] == 1
+        assert stats["flushed_records_total"] == 2
+        assert queue.offer(_entries(1, start=3))
+        queue.drain()
+    
+    @pytest.mark.parametrize("header,expected", [
+        (None, False),
+        ("respond-async", True),
+        ("return=minimal, respond-async", True),
+        ("return=representation", False),
+    ])
+    def test_wants_async(self, header, expected):
+        """Test Prefer header parsing."""
+        assert wants_async(header) is expected
+
+
+class TestAsyncIngestEndpoint:
+    """Test write-behind mode on the ingest endpoints."""
+    
+    def test_post_records_async_returns_202(self, test_client, mock_firebase, device_headers, monkeypatch):
+        """Test async ingest queues the record instead of writing inline."""
+        from api import records
+        writer = RecordingWriter()
+        queue = IngestQueue(max_records=10, flush_size=10, flush_interval=60, writer=writer)
+        monkeypatch.setattr(records, "ingest_queue", queue)
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "test_user_123"},  # Device info
+            {}  # Device users
+        ]
+        
+        response = test_client.post(
+            "/api/records/",
+            json={"spo2": 98, "heart_rate": 75},
+            headers={**device_headers, "Prefer": "respond-async"}
+        )
+        
+        assert response.status_code == 202
+        key = response.json()["key"]
+        mock_firebase["ref"].update.assert_not_called()
+        
+        queue.drain()
+        assert writer.batches[0][0][0] == key
+        assert writer.batches[0][0][1]["userId"] == "test_user_123"
+    
+    def test_post_records_async_queue_full(self, test_client, mock_firebase, device_headers, monkeypatch):
+        """Test a full queue answers 429 with Retry-After."""
+        from api import records
+        queue = IngestQueue(max_records=0, flush_size=10, flush_interval=60, writer=RecordingWriter())
+        monkeypatch.setattr(records, "ingest_queue", queue)
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",
+            {"secret": "test_secret_456", "user_id": "test_user_123"},
+            {}
+        ]
+        
+        response = test_client.post(
+            "/api/records/",
+            json={"spo2": 98, "heart_rate": 75},
+            headers={**device_headers, "Prefer": "respond-async"}
+        )
+        
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,248 @@
+"""Tests for MQTT vitals ingestion."""
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from api import mqtt_ingest
+from api.device_auth import device_signature
+from api.ingest import MAX_BATCH_SAMPLES
+from api.ingest_queue import IngestQueue
+
+
+@pytest.fixture
+def ingest_sink(monkeypatch):
+    """Route accepted records into a private queue instead of RTDB."""
+    queue = IngestQueue(max_records=100, flush_size=100, flush_interval=60, writer=lambda batch: None)
+    monkeypatch.setattr(mqtt_ingest, "ingest_queue", queue)
+    yield queue
+    queue.drain()
+
+
+def _device_reads(mock_firebase, members=None):
+    mock_firebase["ref"].get.side_effect = [
+        "test_secret_456",  # Device secret
+        {"secret": "test_secret_456", "user_id": "owner_123"},  # Device info
+        members or {}  # Device users
+    ]
+
+
+def _envelope(body, device_id="test_device_123", secret="test_secret_456", ts=None, nonce="nonce-0001"):
+    """The signed envelope a device publishes, as a dict."""
+    ts = int(time.time() * 1000) if ts is None else ts
+    text = json.dumps(body)
+    sig = device_signature(secret, mqtt_ingest.signing_message(device_id, ts, nonce, text.encode()))
+    return {"ts": ts, "nonce": nonce, "sig": sig, "body": text}
+
+
+def _signed(body, **kwargs):
+    return json.dumps(_envelope(body, **kwargs)).encode()
+
+
+class TestMqttIngest:
+    """Test decoding, authentication and queueing of vitals messages."""
+    
+    def test_topic_parsing(self):
+        """Test only devices/{id}/vitals topics are recognised."""
+        assert mqtt_ingest.vitals_device_id("devices/dev1/vitals") == "dev1"
+        assert mqtt_ingest.vitals_device_id("dev1") is None
+        assert mqtt_ingest.vitals_device_id("devices//vitals") is None
+        assert mqtt_ingest.vitals_device_id("devices/dev1/status") is None
+    
+    def test_single_reading_queued(self, mock_firebase, ingest_sink):
+        """Test a single reading is authenticated and queued for the legacy owner."""
+        _device_reads(mock_firebase)
+        payload = _signed({"spo2": 97, "heart_rate": 71})
+        
+        accepted = mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload)
+        
+        assert accepted == 1
+        assert ingest_sink.depth() == 1
+        record = ingest_sink._buffer[0][1][1]
+        assert record["userId"] == "owner_123"
+        assert record["device_id"] == "test_device_123"
+    
+    def test_batch_queued_for_member(self, mock_firebase, ingest_sink):
+        """Test a buffered batch is queued for the named member."""
+        _device_reads(mock_firebase, {"member_456": {"registered_at": 1}})
+        payload = _signed({
+            "user_id": "member_456",
+            "samples": [
+                {"spo2": 97, "heart_rate": 71, "ts_offset": -1000},
+                {"spo2": 98, "heart_rate": 72, "ts_offset": 0}
+            ]
+        })
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 2
+        assert ingest_sink.depth() == 2
+    
+    def test_msgpack_payload_queued(self, mock_firebase, ingest_sink):
+        """Test MessagePack envelopes carrying a packed body are accepted on the same topic."""
+        import msgpack
+        _device_reads(mock_firebase)
+        body = msgpack.packb({"spo2": 97, "heart_rate": 71})
+        ts = int(time.time() * 1000)
+        sig = device_signature(
+            "test_secret_456", mqtt_ingest.signing_message("test_device_123", ts, "nonce-0001", body)
+        )
+        payload = msgpack.packb({"ts": ts, "nonce": "nonce-0001", "sig": sig, "body": body})
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 1
+    
+    def test_wrong_key_rejected(self, mock_firebase, ingest_sink):
+        """Test messages signed with the wrong secret are dropped."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        before = mqtt_ingest.mqtt_ingest_stats()["messages_unauthorized"]
+        payload = _signed({"spo2": 97, "heart_rate": 71}, secret="nope")
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+        assert ingest_sink.depth() == 0
+        assert mqtt_ingest.mqtt_ingest_stats()["messages_unauthorized"] == before + 1
+    
+    def test_tampered_body_rejected(self, mock_firebase, ingest_sink):
+        """Test the signature covers the body."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        envelope = _envelope({"spo2": 97, "heart_rate": 71})
+        envelope["body"] = json.dumps({"spo2": 70, "heart_rate": 71})
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", json.dumps(envelope).encode()) == 0
+    
+    def test_signature_bound_to_device(self, mock_firebase, ingest_sink):
+        """Test a message signed for one device is not accepted on another's topic."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        payload = _signed({"spo2": 97, "heart_rate": 71}, device_id="other_device")
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+    
+    def test_stale_timestamp_rejected(self, mock_firebase, ingest_sink):
+        """Test envelopes outside the clock skew window are dropped."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        stale = int(time.time() * 1000) - mqtt_ingest.MQTT_SIGNATURE_MAX_SKEW_MS - 1000
+        payload = _signed({"spo2": 97, "heart_rate": 71}, ts=stale)
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+    
+    def test_replayed_nonce_rejected(self, mock_firebase, ingest_sink):
+        """Test a captured message cannot be published again."""
+        _device_reads(mock_firebase)
+        payload = _signed({"spo2": 97, "heart_rate": 71})
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 1
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+        assert ingest_sink.depth() == 1
+    
+    def test_secret_payload_rejected_by_default(self, mock_firebase, ingest_sink):
+        """Test a body carrying the secret in cleartext is not accepted."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        payload = json.dumps({"secret": "test_secret_456", "spo2": 97, "heart_rate": 71}).encode()
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+        mock_firebase["ref"].get.assert_not_called()
+    
+    def test_secret_payload_accepted_while_enabled(self, mock_firebase, ingest_sink, monkeypatch):
+        """Test old firmware keeps working while MQTT_ACCEPT_SECRET_PAYLOADS is set."""
+        monkeypatch.setattr(mqtt_ingest, "MQTT_ACCEPT_SECRET_PAYLOADS", True)
+        _device_reads(mock_firebase)
+        payload = json.dumps({"secret": "test_secret_456", "spo2": 97, "heart_rate": 71}).encode()
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 1
+        
+        payload = json.dumps({"secret": "nope", "spo2": 97, "heart_rate": 71}).encode()
+        mock_firebase["ref"].get.side_effect = None
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+    
+    def test_unknown_device_rejected(self, mock_firebase, ingest_sink):
+        """Test a device with no provisioned secret cannot authenticate."""
+        mock_firebase["ref"].get.return_value = None
+        payload = _signed({"spo2": 97, "heart_rate": 71}, device_id="ghost")
+        
+        assert mqtt_ingest.handle_vitals_message("devices/ghost/vitals", payload) == 0
+        assert ingest_sink.depth() == 0
+    
+    def test_oversized_batch_rejected(self, mock_firebase, ingest_sink):
+        """Test batches are capped at MAX_BATCH_SAMPLES as on the HTTP endpoint."""
+        _device_reads(mock_firebase)
+        before = mqtt_ingest.mqtt_ingest_stats()["messages_invalid"]
+        payload = _signed({"samples": [{"spo2": 97, "heart_rate": 71}] * (MAX_BATCH_SAMPLES + 1)})
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+        assert ingest_sink.depth() == 0
+        assert mqtt_ingest.mqtt_ingest_stats()["messages_invalid"] == before + 1
+    
+    def test_invalid_payload_rejected(self, mock_firebase, ingest_sink):
+        """Test undecodable and incomplete payloads are dropped."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", b"\xff\x00") == 0
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", b'{"sig": "x"}') == 0
+        payload = _signed({"spo2": 97})
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+        assert ingest_sink.depth() == 0
+    
+    def test_non_numeric_vitals_rejected(self, mock_firebase, ingest_sink):
+        """Test a signed batch with a value RTDB can't store never reaches the shared queue."""
+        _device_reads(mock_firebase)
+        before = mqtt_ingest.mqtt_ingest_stats()["messages_invalid"]
+        payload = _signed({"samples": [{"spo2": 97, "heart_rate": 71}, {"spo2": {"a.b": 1}, "heart_rate": 70}]})
+        
+        assert mqtt_ingest.handle_vitals_message("devices/test_device_123/vitals", payload) == 0
+        assert ingest_sink.depth() == 0
+        assert mqtt_ingest.mqtt_ingest_stats()["messages_invalid"] == before + 1
+
+
+def _local_broker():
+    host = os.environ.get("MQTT_TEST_HOST", "localhost")
+    port = int(os.environ.get("MQTT_TEST_PORT", "1883"))
+    try:
+        with socket.create_connection((host, port), timeout=0.5):
+            return host, port
+    except OSError:
+        return None
+
+
+@pytest.mark.integration
+class TestMqttIngestLocalBroker:
+    """Round trip through a local broker (e.g. `mosquitto -p 1883`)."""
+    
+    def test_publish_and_ingest(self, mock_firebase, ingest_sink):
+        """Test a device publish reaches the ingest queue via the broker."""
+        broker = _local_broker()
+        if broker is None:
+            pytest.skip("No local MQTT broker (set MQTT_TEST_HOST/MQTT_TEST_PORT)")
+        import paho.mqtt.client as mqtt
+        
+        _device_reads(mock_firebase)
+        device_id = f"harness_{int(time.time() * 1000)}"
+        received = threading.Event()
+        subscribed = threading.Event()
+        
+        server = mqtt.Client(protocol=mqtt.MQTTv311)
+        server.on_connect = lambda c, u, f, rc: c.subscribe(mqtt_ingest.VITALS_TOPIC, qos=1)
+        server.on_subscribe = lambda c, u, mid, qos: subscribed.set()
+        
+        def on_message(client, userdata, message):
+            if mqtt_ingest.handle_vitals_message(message.topic, message.payload):
+                received.set()
+        
+        server.on_message = on_message
+        server.connect(*broker)
+        server.loop_start()
+        try:
+            assert subscribed.wait(5)
+            device = mqtt.Client(protocol=mqtt.MQTTv311)
+            device.connect(*broker)
+            device.loop_start()
+            payload = _signed({"spo2": 97, "heart_rate": 71}, device_id=device_id)
+            device.publish(f"devices/{device_id}/vitals", payload, qos=1).wait_for_publish()
+            device.loop_stop()
+            device.disconnect()
+            
+            assert received.wait(5)
+            assert ingest_sink.depth() == 1
+        finally:
+            server.loop_stop()
+            server.disconnect()
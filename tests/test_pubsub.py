@@ -0,0 +1,170 @@
+"""Tests for live record streaming (pub/sub broker and SSE endpoint)."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api import record_stream
+from api.pubsub import RecordBroker, record_broker
+from api.push_ids import push_id_floor
+from tests.conftest import T0, make_record, push_key
+
+
+@pytest.fixture
+def short_streams(monkeypatch):
+    """Make streams end quickly and heartbeat often."""
+    monkeypatch.setattr(record_stream, "STREAM_MAX_SECONDS", 0.5)
+    monkeypatch.setattr(record_stream, "STREAM_HEARTBEAT_SECONDS", 0.1)
+    monkeypatch.setattr(record_stream, "STREAM_RESYNC_SECONDS", 0)
+
+
+class TestRecordBroker:
+    """Test per-user fan-out."""
+    
+    def test_delivers_only_to_record_owner(self):
+        """Test subscribers receive their own user's records only."""
+        broker = RecordBroker()
+        
+        async def scenario():
+            mine = broker.subscribe("user_a")
+            other = broker.subscribe("user_b")
+            broker.publish([("k1", make_record(T0, uid="user_a"))])
+            await asyncio.sleep(0)
+            return mine.queue.get_nowait(), other.queue.empty()
+        
+        received, other_empty = asyncio.run(scenario())
+        
+        assert received == ("k1", make_record(T0, uid="user_a"))
+        assert other_empty
+    
+    def test_publish_from_another_thread(self):
+        """Test records published off the event loop reach the subscriber."""
+        broker = RecordBroker()
+        
+        async def scenario():
+            subscription = broker.subscribe("user_a")
+            thread = threading.Thread(target=broker.publish, args=([("k1", make_record(T0, uid="user_a"))],))
+            thread.start()
+            item = await asyncio.wait_for(subscription.queue.get(), timeout=1)
+            thread.join()
+            return item
+        
+        assert asyncio.run(scenario())[0] == "k1"
+    
+    def test_full_queue_marks_overflow(self):
+        """Test a slow subscriber is flagged instead of blocking publishers."""
+        broker = RecordBroker()
+        
+        async def scenario():
+            subscription = broker.subscribe("user_a")
+            subscription.queue = asyncio.Queue(1)
+            broker.publish([("k1", make_record(T0, uid="user_a")), ("k2", make_record(T0, uid="user_a"))])
+            await asyncio.sleep(0)
+            return subscription
+        
+        subscription = asyncio.run(scenario())
+        
+        assert subscription.overflowed
+        assert subscription.queue.qsize() == 1
+    
+    def test_unsubscribe_and_stats(self):
+        """Test stats track subscriptions and deliveries."""
+        broker = RecordBroker()
+        
+        async def scenario():
+            subscription = broker.subscribe("user_a")
+            broker.publish([("k1", make_record(T0, uid="user_a")), ("k2", make_record(T0, uid="user_b"))])
+            during = broker.stats()
+            broker.unsubscribe(subscription)
+            return during, broker.stats()
+        
+        during, after = asyncio.run(scenario())
+        
+        assert during == {"users": 1, "subscriptions": 1, "published_total": 2, "delivered_total": 1}
+        assert after["subscriptions"] == 0
+
+
+class TestRecordStream:
+    """Test GET /api/records/stream."""
+    
+    def test_requires_auth(self, test_client):
+        """Test the stream is only available to signed-in users."""
+        response = test_client.get("/api/records/stream")
+        
+        assert response.status_code == 401
+    
+    def test_streams_published_records(self, test_client, auth_headers, short_streams):
+        """Test records written while connected are sent as SSE events."""
+        key = push_key(T0)
+        
+        def publish_when_subscribed():
+            for _ in range(100):
+                if record_broker.stats()["subscriptions"]:
+                    record_broker.publish([(key, make_record(T0))])
+                    return
+                time.sleep(0.01)
+        
+        thread = threading.Thread(target=publish_when_subscribed)
+        thread.start()
+        response = test_client.get("/api/records/stream", headers=auth_headers)
+        thread.join()
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text.startswith("retry: ")
+        assert f"id: {key}\nevent: record\ndata: " in response.text
+        assert ": heartbeat" in response.text
+        assert record_broker.stats()["subscriptions"] == 0
+    
+    def test_resumes_from_last_event_id(self, test_client, auth_headers, mock_firebase, short_streams):
+        """Test a reconnect replays records stored after the last event, oldest first."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.order_by_key.return_value = mock_ref
+        mock_ref.start_at.return_value = mock_ref
+        mock_ref.limit_to_first.return_value = mock_ref
+        older, newer = push_key(T0 + 1000), push_key(T0 + 2000)
+        mock_ref.get.return_value = {newer: make_record(T0 + 2000), older: make_record(T0 + 1000)}
+        
+        response = test_client.get(
+            "/api/records/stream", headers={**auth_headers, "Last-Event-ID": push_key(T0)}
+        )
+        
+        assert response.status_code == 200
+        assert response.text.index(f"id: {older}") < response.text.index(f"id: {newer}")
+        mock_ref.start_at.assert_called_once_with(push_id_floor(T0 - 5000))
+    
+    def test_catch_up_pages_past_a_burst(self, rtdb, monkeypatch):
+        """Test a resync reaches every record even when more than a page share one overlap window."""
+        monkeypatch.setattr(record_stream, "STREAM_SYNC_LIMIT", 5)
+        keys = [push_key(T0 + 1000, f"{i:012d}") for i in range(12)]
+        rtdb["user_records"] = {"test_user_123": {key: make_record(T0 + 1000) for key in keys}}
+        
+        async def collect():
+            return [event async for event in record_stream._StreamState("test_user_123", T0).sync()]
+        
+        events = asyncio.run(collect())
+        
+        assert [event.split("\n", 1)[0] for event in events] == [f"id: {key}" for key in keys]
+    
+    def test_catch_up_reads_off_the_event_loop(self, monkeypatch):
+        """Test the blocking RTDB reads of a resync run in the threadpool."""
+        threads = []
+        
+        def read_since(uid, since_ms, limit, after_key=None):
+            threads.append(threading.get_ident())
+            return [], since_ms, None
+        
+        monkeypatch.setattr(record_stream, "read_user_records_since", read_since)
+        
+        async def collect():
+            return [event async for event in record_stream._StreamState("test_user_123", T0).sync()]
+        
+        assert asyncio.run(collect()) == []
+        assert threads and threads[0] != threading.get_ident()
+    
+    def test_rejects_malformed_event_id(self, test_client, auth_headers):
+        """Test an unusable Last-Event-ID is a client error."""
+        response = test_client.get("/api/records/stream?last_event_id=bogus", headers=auth_headers)
+        
+        assert response.status_code == 400
@@ -0,0 +1,70 @@
+"""Tests for local push ID generation."""
+import threading
+
+import pytest
+
+from api import push_ids
+from api.push_ids import PUSH_CHARS, generate_push_id, push_id_floor, push_id_timestamp
+
+
+@pytest.fixture(autouse=True)
+def reset_push_id_state(monkeypatch):
+    """Isolate generator state so fixed timestamps don't leak into other tests."""
+    monkeypatch.setattr(push_ids, "_last_ts", 0)
+    monkeypatch.setattr(push_ids, "_last_rand", [0] * 12)
+
+
+class TestPushIds:
+    """Test Firebase-compatible push IDs."""
+    
+    def test_push_id_format(self):
+        """Test IDs are 20 characters from the push alphabet."""
+        push_id = generate_push_id()
+        
+        assert len(push_id) == 20
+        assert all(ch in PUSH_CHARS for ch in push_id)
+    
+    def test_push_id_encodes_timestamp(self):
+        """Test the timestamp prefix round-trips."""
+        push_id = generate_push_id(1700000000000)
+        
+        assert push_id_timestamp(push_id) == 1700000000000
+    
+    def test_push_ids_monotonic_within_millisecond(self):
+        """Test IDs generated in the same millisecond still sort in order."""
+        ids = [generate_push_id(1700000100000) for _ in range(1000)]
+        
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+    
+    def test_push_ids_monotonic_when_clock_moves_back(self):
+        """Test a clock step backwards never produces a smaller ID."""
+        first = generate_push_id(1700000300000)
+        second = generate_push_id(1700000200000)
+        
+        assert second > first
+    
+    def test_push_ids_unique_across_threads(self):
+        """Test concurrent generation yields unique IDs."""
+        results = []
+        lock = threading.Lock()
+        
+        def worker():
+            local = [generate_push_id() for _ in range(500)]
+            with lock:
+                results.extend(local)
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(set(results)) == 8 * 500
+    
+    def test_push_id_floor_bounds_ids_of_that_millisecond(self):
+        """Test the floor sorts before every ID of its millisecond and after earlier ones."""
+        floor = push_id_floor(1700000200000)
+        
+        assert push_id_timestamp(floor) == 1700000200000
+        assert generate_push_id(1700000199999) < floor < generate_push_id(1700000200000)
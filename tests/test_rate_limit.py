@@ -0,0 +1,62 @@
+"""Tests for per-device rate limiting."""
+from api.rate_limit import TokenBucketLimiter
+
+
+class TestTokenBucketLimiter:
+    """Test token bucket accounting."""
+    
+    def test_burst_then_throttle(self):
+        """Test a full bucket allows `burst` requests, then reports the wait."""
+        limiter = TokenBucketLimiter("test_burst", rate=2.0, burst=3)
+        
+        assert [limiter.acquire("dev", now=100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert limiter.acquire("dev", now=100.0) == 0.5
+        assert limiter.stats()["throttled"] == 1
+    
+    def test_refill_over_time(self):
+        """Test tokens refill at `rate` per second up to the burst size."""
+        limiter = TokenBucketLimiter("test_refill", rate=1.0, burst=2)
+        limiter.acquire("dev", now=0.0)
+        limiter.acquire("dev", now=0.0)
+        
+        assert limiter.acquire("dev", now=0.5) > 0
+        assert limiter.acquire("dev", now=1.5) == 0.0
+    
+    def test_devices_have_separate_buckets(self):
+        """Test one device exhausting its bucket does not affect another."""
+        limiter = TokenBucketLimiter("test_separate", rate=1.0, burst=1)
+        limiter.acquire("noisy", now=0.0)
+        
+        assert limiter.acquire("noisy", now=0.0) > 0
+        assert limiter.acquire("quiet", now=0.0) == 0.0
+
+
+class TestDeviceRateLimit:
+    """Test throttling on device routes."""
+    
+    def test_command_polling_throttled_before_auth(self, test_client, mock_firebase, device_headers):
+        """Test polls over the burst get 429 without reaching RTDB."""
+        mock_firebase["ref"].get.side_effect = lambda *args, **kwargs: "test_secret_456"
+        
+        statuses = [
+            test_client.get("/api/command/test_device_123", headers=device_headers).status_code
+            for _ in range(11)
+        ]
+        reads = mock_firebase["ref"].get.call_count
+        response = test_client.get("/api/command/test_device_123", headers=device_headers)
+        
+        assert statuses[:10] == [200] * 10
+        assert statuses[10] == 429
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert mock_firebase["ref"].get.call_count == reads
+    
+    def test_throttled_requests_are_counted(self, test_client, mock_firebase, admin_user_token):
+        """Test throttle counters appear in admin metrics."""
+        headers = {"X-Device-Id": "noisy_device", "X-Device-Secret": "wrong"}
+        for _ in range(11):
+            test_client.get("/api/command/noisy_device", headers=headers)
+        
+        response = test_client.get("/api/admin/metrics", headers={"Authorization": "Bearer admin_token"})
+        
+        assert response.json()["rate_limits"]["command_poll"]["throttled"] == 1
@@ -0,0 +1,130 @@
+"""Tests for the per-user recent-records buffer."""
+from api import recent_records
+from api.ai import _fetch_recent_user_records
+from api.etags import forget_validator
+from api.ingest import write_records
+from api.recent_records import recent_user_records
+from tests.conftest import T0, make_record
+
+
+class TestRecentUserRecords:
+    """Test serving the newest records from memory."""
+    
+    def test_second_read_skips_rtdb(self, rtdb):
+        """Test a warm buffer answers without any RTDB read."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0), "k2": make_record(T0 + 1000)}}
+        
+        first = recent_user_records("test_user_123", 25)
+        reads = len(rtdb.reads)
+        second = recent_user_records("test_user_123", 20)
+        
+        assert [r["id"] for r in first] == ["k2", "k1"]
+        assert second == first
+        assert len(rtdb.reads) == reads
+    
+    def test_local_writes_are_appended(self, rtdb):
+        """Test records stored by this instance appear without re-seeding from RTDB."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0)}}
+        recent_user_records("test_user_123", 25)
+        
+        write_records([("k2", make_record(T0 + 1000))])
+        reads = len(rtdb.reads)
+        records = recent_user_records("test_user_123", 25)
+        
+        assert [r["id"] for r in records] == ["k2", "k1"]
+        assert all(read["order"] == "key" for read in rtdb.reads[reads:])
+    
+    def test_writes_from_other_instances_reseed(self, rtdb):
+        """Test a newer key in RTDB than in the buffer triggers a fresh read."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0)}}
+        recent_user_records("test_user_123", 25)
+        
+        rtdb["user_records"]["test_user_123"]["k2"] = make_record(T0 + 1000)
+        forget_validator("records", "test_user_123")
+        records = recent_user_records("test_user_123", 25)
+        
+        assert [r["id"] for r in records] == ["k2", "k1"]
+    
+    def test_buffer_orders_by_ts_and_is_bounded(self):
+        """Test late-arriving old samples sort by ts and the buffer keeps only the newest."""
+        buffer = recent_records._UserBuffer("k3", [{"id": "k3", **make_record(T0 + 3000)}], size=2)
+        
+        buffer.add("k4", make_record(T0 + 1000))
+        buffer.add("k5", make_record(T0 + 5000))
+        
+        assert [r["id"] for r in buffer.newest(5)] == ["k5", "k3"]
+        assert buffer.newest_key == "k5"
+    
+    def test_large_limits_go_to_rtdb(self, rtdb):
+        """Test limits above the buffer size are not served from memory."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0)}}
+        
+        recent_user_records("test_user_123", recent_records.RECENT_RECORDS_PER_USER + 1)
+        
+        assert not recent_records._buffers.contains("test_user_123")
+        assert [read["order"] for read in rtdb.reads if read["path"].startswith("/user_records/")] == ["ts"]
+
+
+class TestBufferedQueries:
+    """Test ranged queries answered from the buffer when it covers them."""
+    
+    def _buffer(self):
+        records = [{"id": f"k{i}", **make_record(T0 + i * 1000)} for i in range(5, 10)]
+        return recent_records._UserBuffer("k9", records, size=5)
+    
+    def test_enough_records_in_range(self):
+        """Test a query is exact once `count` in-range records are buffered."""
+        rows = self._buffer().query(2, T0, T0 + 8000)
+        
+        assert [r["id"] for r in rows] == ["k8", "k7"]
+    
+    def test_range_inside_the_buffer(self):
+        """Test a range starting after the oldest buffered record is exact however few it holds."""
+        rows = self._buffer().query(10, T0 + 7000, None)
+        
+        assert [r["id"] for r in rows] == ["k9", "k8", "k7"]
+    
+    def test_range_reaching_past_the_buffer(self):
+        """Test the buffer declines when older records it doesn't hold could be in range."""
+        assert self._buffer().query(10, T0, None) is None
+        assert self._buffer().query(10, T0 + 5000, None) is None
+    
+    def test_whole_history(self):
+        """Test a buffer that is not full holds everything."""
+        buffer = recent_records._UserBuffer("k1", [{"id": "k1", **make_record(T0)}], size=5)
+        
+        assert [r["id"] for r in buffer.query(10, 0, None)] == ["k1"]
+    
+    def test_dashboard_pages_come_from_the_buffer(self, test_client, auth_headers, rtdb):
+        """Test a repeated first page of a live window needs no records query, and its cursor still works."""
+        rtdb["user_records"] = {"test_user_123": {f"k{i}": make_record(T0 + i * 1000) for i in range(3)}}
+        params = {"limit": 2, "start_ts": T0}
+        
+        first = test_client.get("/api/records/", params=params, headers=auth_headers).json()
+        reads = len(rtdb.reads)
+        forget_validator("records", "test_user_123")
+        again = test_client.get("/api/records/", params=params, headers=auth_headers).json()
+        older = test_client.get(
+            "/api/records/", params={**params, "before": again["next_cursor"]}, headers=auth_headers
+        ).json()
+        
+        assert [r["id"] for r in again["records"]] == ["k2", "k1"]
+        assert again["records"] == first["records"]
+        assert [read["order"] for read in rtdb.reads[reads:]] == ["key"]
+        assert [r["id"] for r in older["records"]] == ["k0"]
+        assert older["next_cursor"] is None
+
+
+class TestAiRecentRecords:
+    """Test the AI context helper reads through the buffer."""
+    
+    def test_maps_fields_newest_first(self, rtdb):
+        """Test the AI helper gets the compact newest-first view."""
+        rtdb["user_records"] = {"test_user_123": {
+            "k1": make_record(T0, heart_rate=70),
+            "k2": make_record(T0 + 1000, heart_rate=80),
+        }}
+        
+        records = _fetch_recent_user_records("test_user_123", limit=1)
+        
+        assert records == [{"ts": T0 + 1000, "heart_rate": 80, "spo2": 98, "device_id": "test_device_123"}]
@@ -0,0 +1,219 @@
+"""Tests for the day-partitioned record layout."""
+import pytest
+
+from api.ingest import record_fanout_updates
+from api.push_ids import push_id_floor
+from api.record_store import (
+    iter_user_record_pages,
+    partition_for,
+    query_user_records,
+    read_recent_user_records,
+)
+from tests.conftest import DAY, T0, make_record, push_key
+
+
+class TestPartitions:
+    """Test partition naming and range coverage."""
+    
+    def test_partition_for_uses_utc_day(self):
+        """Test timestamps map to their UTC day."""
+        assert partition_for(T0) == "2023-11-14"
+        assert partition_for(T0 + DAY - 1) == "2023-11-14"
+        assert partition_for(T0 + DAY) == "2023-11-15"
+    
+    def test_fanout_includes_partitioned_copy(self):
+        """Test ingest writes the record into its day partition."""
+        updates = record_fanout_updates("key1", make_record(T0 + 1000))
+        
+        assert updates["user_records_v2/test_user_123/2023-11-14/key1"]["ts"] == T0 + 1000
+        assert "user_records/test_user_123/key1" in updates
+
+
+class TestReaders:
+    """Test partition-aware readers."""
+    
+    def test_range_read_only_queries_touched_partitions(self, rtdb):
+        """Test a two-day range queries exactly two partitions on their ts index and trims the edges."""
+        rtdb["user_records_v2"] = {"test_user_123": {
+            "2023-11-13": {"z": make_record(T0 - 1000)},
+            "2023-11-14": {"a": make_record(T0 + 1000), "b": make_record(T0 + 50_000)},
+            "2023-11-15": {"c": make_record(T0 + DAY + 1000), "d": make_record(T0 + DAY + 90_000)},
+            "2023-11-16": {"e": make_record(T0 + 2 * DAY + 1000)},
+        }}
+        
+        records = read_recent_user_records("test_user_123", 10, T0 + 10_000, T0 + DAY + 10_000)
+        
+        assert [r["id"] for r in records] == ["c", "b"]
+        assert [(r["path"], r["order"], r["last"]) for r in rtdb.reads[1:]] == [
+            ("/user_records_v2/test_user_123/2023-11-15", "ts", 10),
+            ("/user_records_v2/test_user_123/2023-11-14", "ts", 9),
+        ]
+    
+    def test_recent_read_walks_newest_partitions_first(self, mock_firebase):
+        """Test older partitions are not read once enough records are collected."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.get.side_effect = [
+            {"2023-11-13": True, "2023-11-14": True, "2023-11-15": True},
+            {"c": make_record(T0 + DAY + 1000), "d": make_record(T0 + DAY + 2000)},
+        ]
+        
+        records = read_recent_user_records("test_user_123", limit=2)
+        
+        assert [r["id"] for r in records] == ["d", "c"]
+        assert mock_ref.get.call_args_list[0].kwargs == {"shallow": True}
+        assert mock_ref.get.call_count == 2
+    
+    def test_iter_pages_resumes_after_cursor(self, mock_firebase):
+        """Test paging excludes the inclusive start_at cursor row."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.order_by_key.return_value = mock_ref
+        mock_ref.start_at.return_value = mock_ref
+        mock_ref.limit_to_first.return_value = mock_ref
+        mock_ref.get.side_effect = [
+            {"k1": make_record(T0), "k2": make_record(T0 + 1)},
+            {"k2": make_record(T0 + 1), "k3": make_record(T0 + 2)},
+        ]
+        
+        pages = list(iter_user_record_pages("test_user_123", page_size=2))
+        
+        assert [[key for key, _ in page] for page in pages] == [["k1", "k2"], ["k3"]]
+        mock_ref.start_at.assert_called_once_with("k2")
+
+
+class TestMigratedReads:
+    """Test ranged reads switch to the partitions once a user is migrated."""
+    
+    @pytest.fixture
+    def layouts(self, rtdb):
+        """The same user with different records in each layout, so reads show which was used."""
+        rtdb["user_records"] = {"test_user_123": {"flat": make_record(T0 + 2000)}}
+        rtdb["user_records_v2"] = {"test_user_123": {"2023-11-14": {"a": make_record(T0 + 1000)}}}
+        return rtdb
+    
+    def test_flat_layout_until_migrated(self, layouts):
+        """Test the flat node is read while the checkpoint is incomplete."""
+        layouts["migrations"] = {"user_records_v2": {"test_user_123": {"complete": False}}}
+        
+        assert [r["id"] for r in query_user_records("test_user_123", 10)] == ["flat"]
+    
+    def test_get_records_reads_partitions_once_migrated(self, test_client, auth_headers, layouts):
+        """Test GET /api/records is served from the partitions, not a query on the flat node."""
+        layouts["migrations"] = {"user_records_v2": {"test_user_123": {"complete": True, "last_key": "k9"}}}
+        
+        response = test_client.get("/api/records/?limit=10", headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert [r["id"] for r in response.json()] == ["a"]
+        flat = [r for r in layouts.reads if r["path"] == "/user_records/test_user_123"]
+        # Only the one-key newest-record probe of api/recent_records.py
+        assert [(r["order"], r["last"]) for r in flat] == [("key", 1)]
+    
+    def test_checkpoint_is_cached(self, layouts):
+        """Test repeated reads don't re-read the migration checkpoint."""
+        layouts["migrations"] = {"user_records_v2": {"test_user_123": {"complete": True}}}
+        
+        query_user_records("test_user_123", 10)
+        query_user_records("test_user_123", 10)
+        
+        checkpoint_reads = [r for r in layouts.reads if r["path"].startswith("/migrations/")]
+        assert len(checkpoint_reads) == 1
+
+
+class TestPagedRecords:
+    """Test time-range and cursor pagination on GET /api/records."""
+    
+    def test_pages_cover_range_without_gaps_or_repeats(self, test_client, auth_headers, rtdb):
+        """Test following next_cursor visits every record once, including same-ms ties."""
+        data = {f"k{i:02d}": make_record(T0 + (i // 3) * 1000) for i in range(12)}
+        rtdb["user_records"] = {"test_user_123": data}
+        
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 4, "start_ts": T0}
+            if cursor:
+                params["before"] = cursor
+            body = test_client.get("/api/records/", params=params, headers=auth_headers).json()
+            seen.extend(r["id"] for r in body["records"])
+            cursor = body["next_cursor"]
+            pages += 1
+            if not cursor:
+                break
+        
+        assert seen == sorted(data, reverse=True)
+        assert pages == 3
+    
+    def test_time_window(self, test_client, auth_headers, rtdb):
+        """Test start_ts/end_ts bound the returned records."""
+        rtdb["user_records"] = {"test_user_123": {f"k{i}": make_record(T0 + i * 1000) for i in range(10)}}
+        
+        response = test_client.get(
+            "/api/records/",
+            params={"start_ts": T0 + 2000, "end_ts": T0 + 4000},
+            headers=auth_headers,
+        )
+        
+        assert response.status_code == 200
+        assert [r["id"] for r in response.json()["records"]] == ["k4", "k3", "k2"]
+        assert response.json()["next_cursor"] is None
+    
+    def test_legacy_list_response(self, test_client, auth_headers, rtdb):
+        """Test requests without range parameters still get a plain list."""
+        rtdb["user_records"] = {"test_user_123": {f"k{i}": make_record(T0 + i) for i in range(3)}}
+        
+        response = test_client.get("/api/records/?limit=2", headers=auth_headers)
+        
+        assert [r["id"] for r in response.json()] == ["k2", "k1"]
+    
+    def test_invalid_cursor(self, test_client, auth_headers, mock_firebase):
+        """Test malformed cursors are rejected."""
+        response = test_client.get("/api/records/?before=not-a-cursor", headers=auth_headers)
+        
+        assert response.status_code == 400
+
+
+class TestRecordsSince:
+    """Test GET /api/records/since delta sync."""
+    
+    def test_returns_new_records_and_watermark(self, test_client, auth_headers, rtdb):
+        """Test records are selected by ingest time and the watermark advances."""
+        rtdb["user_records"] = {"test_user_123": {
+            push_key(T0, "zzzzzzzzzzzz"): make_record(T0),  # before the overlap
+            push_key(T0 + 9000, "abcdefghijkl"): make_record(T0 + 1000),  # batched sample stored late
+            push_key(T0 + 7000): make_record(T0 + 7000),
+        }}
+        
+        response = test_client.get(f"/api/records/since?ts={T0 + 6000}", headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["ts"] for r in data["records"]] == [T0 + 7000, T0 + 1000]
+        assert data["watermark"] == T0 + 9000
+        assert data["has_more"] is False
+        assert data["next_after"] is None
+        assert rtdb.reads[-1]["start"] == push_id_floor(T0 + 1000)
+    
+    def test_no_new_records_keeps_watermark(self, test_client, auth_headers, rtdb):
+        """Test an idle poll returns nothing and the same watermark."""
+        response = test_client.get(f"/api/records/since?ts={T0}", headers=auth_headers)
+        
+        assert response.json() == {"records": [], "watermark": T0, "has_more": False, "next_after": None}
+    
+    def test_burst_inside_overlap_is_paged_by_key(self, test_client, auth_headers, rtdb):
+        """Test more than `limit` records within the overlap are all reached by following next_after."""
+        rows = {push_key(T0 + 1000, f"{i:012d}"): make_record(T0 + 1000) for i in range(1200)}
+        rtdb["user_records"] = {"test_user_123": rows}
+        
+        seen, params = set(), {"ts": T0, "limit": 500}
+        for _ in range(3):
+            data = test_client.get("/api/records/since", params=params, headers=auth_headers).json()
+            seen.update(r["id"] for r in data["records"])
+            params = {"ts": data["watermark"], "limit": 500, "after": data["next_after"]}
+        
+        assert seen == set(rows)
+        assert data["has_more"] is False
+    
+    def test_rejects_malformed_after(self, test_client, auth_headers):
+        """Test `after` must be a push ID."""
+        response = test_client.get(f"/api/records/since?ts={T0}&after=bogus", headers=auth_headers)
+        
+        assert response.status_code == 400
@@ -65,6 +65,24 @@ class TestRecordsEndpoints:
         assert response.status_code == 400
         assert "Missing spo2 or heart_rate" in response.json()["detail"]
     
+    @pytest.mark.parametrize("payload", [
+        {"spo2": {"a.b": 1}, "heart_rate": 75},
+        {"spo2": "98", "heart_rate": 75},
+        {"spo2": 98, "heart_rate": True},
+    ])
+    def test_post_records_non_numeric_vitals(self, test_client, mock_firebase, device_headers, payload):
+        """Test vitals that aren't plain numbers are refused before anything is written."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        
+        response = test_client.post(
+            "/api/records/",
+            json=payload,
+            headers=device_headers
+        )
+        assert response.status_code == 400
+        assert "Invalid spo2 or heart_rate" in response.json()["detail"]
+        mock_firebase["ref"].update.assert_not_called()
+    
     def test_post_records_device_not_registered(self, test_client, mock_firebase, device_headers):
         """Test record submission from unregistered device."""
         mock_firebase["ref"].get.side_effect = [
@@ -86,7 +104,8 @@ class TestRecordsEndpoints:
         """Test record submission with X-User-Id header."""
         mock_firebase["ref"].get.side_effect = [
             "test_secret_456",  # Device secret
-            {"registered_at": int(time.time() * 1000)}  # User allowed for device
+            {"secret": "test_secret_456"},  # Device info
+            {"specific_user_123": {"registered_at": int(time.time() * 1000)}}  # Device users
         ]
         
         headers = {**device_headers, "X-User-Id": "specific_user_123"}
@@ -243,7 +262,7 @@ class TestRecordsEndpoints:
     def test_register_device_already_registered(self, test_client, mock_firebase, auth_headers):
         """Test device registration when already registered."""
         existing_device = {"secret": "device_secret_123"}
-        existing_registration = {"registered_at": int(time.time() * 1000)}
+        existing_registration = {"test_user_123": {"registered_at": int(time.time() * 1000)}}
         
         mock_firebase["ref"].get.side_effect = [
             existing_device,
@@ -284,7 +303,7 @@ class TestRecordsEndpoints:
             }
         }
         
-        mock_firebase["ref"].get.side_effect = [all_devices, all_device_users]
+        mock_firebase["ref"].get.side_effect = [None, all_devices, all_device_users]
         
         response = test_client.get(
             "/api/records/user/devices",
@@ -306,12 +325,11 @@ class TestRecordsEndpoints:
         
         # Mock device and permissions
         device_info = {"secret": "device_secret_123"}
-        current_user_access = {"registered_at": int(time.time() * 1000)}
+        device_users = {"test_user_123": {"registered_at": int(time.time() * 1000)}}
         
         mock_firebase["ref"].get.side_effect = [
             device_info,
-            current_user_access,
-            None  # Target user not yet registered
+            device_users  # Target user not yet registered
         ]
         
         payload = {
@@ -332,18 +350,14 @@ class TestRecordsEndpoints:
     def test_remove_user_from_device_success(self, test_client, mock_firebase, auth_headers):
         """Test removing user from device successfully."""
         device_info = {"secret": "device_secret"}
-        current_user_access = {"registered_at": int(time.time() * 1000)}
         all_device_users = {
             "test_user_123": {"registered_at": int(time.time() * 1000)},
             "target_user_123": {"registered_at": int(time.time() * 1000)}
         }
-        target_user_access = {"registered_at": int(time.time() * 1000)}
         
         mock_firebase["ref"].get.side_effect = [
             device_info,
-            current_user_access,
-            all_device_users,
-            target_user_access
+            all_device_users
         ]
         
         response = test_client.delete(
@@ -355,17 +369,20 @@ class TestRecordsEndpoints:
         data = response.json()
         assert "removed from device successfully" in data["message"]
     
-    @patch('firebase_admin.auth.get_user')
-    def test_get_device_users_success(self, mock_get_user, test_client, mock_firebase, auth_headers):
+    @patch('firebase_admin.auth.get_users')
+    def test_get_device_users_success(self, mock_get_users, test_client, mock_firebase, auth_headers):
         """Test getting device users successfully."""
-        # Mock user info lookup
-        mock_user = Mock()
-        mock_user.email = "user@example.com"
-        mock_get_user.return_value = mock_user
+        # Mock batched user info lookup
+        mock_get_users.return_value = Mock(
+            users=[Mock(uid=uid, email="user@example.com", display_name=None) for uid in ("test_user_123", "user_123")],
+            not_found=[],
+        )
         
         device_info = {"secret": "device_secret"}
-        current_user_access = {"registered_at": int(time.time() * 1000)}
         device_users = {
+            "test_user_123": {
+                "registered_at": int(time.time() * 1000)
+            },
             "user_123": {
                 "registered_at": int(time.time() * 1000)
             }
@@ -373,7 +390,6 @@ class TestRecordsEndpoints:
         
         mock_firebase["ref"].get.side_effect = [
             device_info,
-            current_user_access,
             device_users
         ]
         
@@ -386,3 +402,245 @@ class TestRecordsEndpoints:
         data = response.json()
         assert "users" in data
         assert data["device_id"] == "test_device"
+        assert [u["email"] for u in data["users"]] == ["user@example.com", "user@example.com"]
+        mock_get_users.assert_called_once()
+    
+    def test_post_records_batch_success(self, test_client, mock_firebase, device_headers):
+        """Test batched submission writes every sample in one update."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456"},  # Device info
+            {"test_user_123": {"registered_at": int(time.time() * 1000)}}  # Device users
+        ]
+        
+        headers = {**device_headers, "X-User-Id": "test_user_123"}
+        payload = [
+            {"spo2": 98, "heart_rate": 75, "ts_offset": -2000},
+            {"spo2": 97, "heart_rate": 76, "ts_offset": -1000},
+            {"spo2": 99, "heart_rate": 74, "ts_offset": 0}
+        ]
+        
+        response = test_client.post(
+            "/api/records/batch",
+            json=payload,
+            headers=headers
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 3
+        assert len(data["keys"]) == 3
+        
+        mock_firebase["ref"].update.assert_called_once()
+        updates = mock_firebase["ref"].update.call_args[0][0]
+        user_paths = [p for p in updates if p.startswith("user_records/test_user_123/")]
+        assert len(user_paths) == 3
+        timestamps = sorted(updates[p]["ts"] for p in user_paths)
+        assert timestamps[2] - timestamps[0] == 2000
+    
+    def test_post_records_batch_rejects_invalid_sample(self, test_client, mock_firebase, device_headers):
+        """Test batched submission validates every sample before writing."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        
+        payload = {"samples": [
+            {"spo2": 98, "heart_rate": 75},
+            {"spo2": 97}
+        ]}
+        
+        response = test_client.post(
+            "/api/records/batch",
+            json=payload,
+            headers=device_headers
+        )
+        
+        assert response.status_code == 400
+        assert "sample 1" in response.json()["detail"]
+        mock_firebase["ref"].update.assert_not_called()
+    
+    def test_post_records_batch_rejects_future_offset(self, test_client, mock_firebase, device_headers):
+        """Test batched submission rejects samples stamped in the future."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        
+        payload = [{"spo2": 98, "heart_rate": 75, "ts_offset": 5000}]
+        
+        response = test_client.post(
+            "/api/records/batch",
+            json=payload,
+            headers=device_headers
+        )
+        
+        assert response.status_code == 400
+        assert "ts_offset" in response.json()["detail"]
+    
+    def test_device_access_cached_between_samples(self, test_client, mock_firebase, device_headers):
+        """Test warm device access checks cost no further reads."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456"},  # Device info
+            {"test_user_123": {"registered_at": int(time.time() * 1000)}}  # Device users
+        ]
+        headers = {**device_headers, "X-User-Id": "test_user_123"}
+        
+        for _ in range(3):
+            response = test_client.post(
+                "/api/records/",
+                json={"spo2": 98, "heart_rate": 75},
+                headers=headers
+            )
+            assert response.status_code == 200
+        
+        assert mock_firebase["ref"].get.call_count == 3
+    
+    def test_post_records_user_not_allowed(self, test_client, mock_firebase, device_headers):
+        """Test samples for a user not bound to the device are rejected."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "owner_123"},  # Device info
+            {}  # Device users
+        ]
+        headers = {**device_headers, "X-User-Id": "stranger_123"}
+        
+        response = test_client.post(
+            "/api/records/",
+            json={"spo2": 98, "heart_rate": 75},
+            headers=headers
+        )
+        assert response.status_code == 401
+    
+    def test_post_records_msgpack(self, test_client, mock_firebase, device_headers):
+        """Test devices can send and receive MessagePack."""
+        import msgpack
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "test_user_123"},  # Device info
+            {}  # Device users
+        ]
+        headers = {
+            **device_headers,
+            "Content-Type": "application/msgpack",
+            "Accept": "application/msgpack"
+        }
+        
+        response = test_client.post(
+            "/api/records/",
+            content=msgpack.packb({"spo2": 98, "heart_rate": 75}),
+            headers=headers
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        data = msgpack.unpackb(response.content)
+        assert data["status"] == "ok"
+        updates = mock_firebase["ref"].update.call_args[0][0]
+        record = updates[f"user_records/test_user_123/{data['key']}"]
+        assert record["spo2"] == 98
+    
+    def test_post_records_invalid_msgpack(self, test_client, mock_firebase, device_headers):
+        """Test malformed MessagePack bodies are rejected."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        
+        response = test_client.post(
+            "/api/records/",
+            content=b"\xc1\xc1",
+            headers={**device_headers, "Content-Type": "application/msgpack"}
+        )
+        
+        assert response.status_code == 400
+    
+    def test_post_records_seq_replay_returns_original_key(self, test_client, mock_firebase, device_headers):
+        """Test a retried upload is answered from the replay window without a second write."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "test_user_123"},  # Device info
+            {},  # Device users
+            None  # No seq state yet
+        ]
+        payload = {"spo2": 98, "heart_rate": 75, "seq": 7, "boot": "b1"}
+        
+        first = test_client.post("/api/records/", json=payload, headers=device_headers)
+        retry = test_client.post("/api/records/", json=payload, headers=device_headers)
+        
+        assert first.status_code == 200
+        assert retry.status_code == 200
+        assert retry.json() == {"status": "ok", "key": first.json()["key"], "duplicate": True}
+        mock_firebase["ref"].update.assert_called_once()
+        updates = mock_firebase["ref"].update.call_args[0][0]
+        assert updates["device_seq/test_device_123/last"]["boots"] == ["b1"]
+        assert updates["device_seq/test_device_123/last"]["seqs"] == [7]
+        assert updates["device_seq/test_device_123/last"]["keys"] == [first.json()["key"]]
+        assert mock_firebase["ref"].get.call_count == 4
+    
+    def test_post_records_seq_replay_from_persistent_state(self, test_client, mock_firebase, device_headers):
+        """Test a retry reaching another instance is recognised from /device_seq."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "test_user_123"},  # Device info
+            {},  # Device users
+            {"last": {"boots": ["b1"], "seqs": [7], "keys": ["original_key"]}}  # Seq state
+        ]
+        
+        response = test_client.post(
+            "/api/records/",
+            json={"spo2": 98, "heart_rate": 75, "seq": 7, "boot": "b1"},
+            headers=device_headers
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["key"] == "original_key"
+        mock_firebase["ref"].update.assert_not_called()
+    
+    def test_post_records_seq_after_reboot_is_new_data(self, test_client, mock_firebase, device_headers):
+        """Test a seq already stored under an earlier boot ID is written."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "test_user_123"},  # Device info
+            {},  # Device users
+            {"last": {"boots": ["b1"], "seqs": [0], "keys": ["old_key"]}}  # Seq state
+        ]
+        
+        response = test_client.post(
+            "/api/records/",
+            json={"spo2": 98, "heart_rate": 75, "seq": 0, "boot": "b2"},
+            headers=device_headers
+        )
+        
+        assert response.status_code == 200
+        assert "duplicate" not in response.json()
+        mock_firebase["ref"].update.assert_called_once()
+    
+    def test_post_records_batch_skips_replayed_samples(self, test_client, mock_firebase, device_headers):
+        """Test only samples with unseen seqs are written from a retried batch."""
+        mock_firebase["ref"].get.side_effect = [
+            "test_secret_456",  # Device secret
+            {"secret": "test_secret_456", "user_id": "test_user_123"},  # Device info
+            {},  # Device users
+            {"last": {"boots": ["b1", "b1"], "seqs": [1, 2], "keys": ["key_1", "key_2"]}}  # Seq state
+        ]
+        payload = [
+            {"spo2": 98, "heart_rate": 75, "ts_offset": -2000, "seq": 1, "boot": "b1"},
+            {"spo2": 97, "heart_rate": 76, "ts_offset": -1000, "seq": 2, "boot": "b1"},
+            {"spo2": 99, "heart_rate": 74, "ts_offset": 0, "seq": 3, "boot": "b1"}
+        ]
+        
+        response = test_client.post("/api/records/batch", json=payload, headers=device_headers)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 1
+        assert data["duplicates"] == 2
+        assert data["keys"][:2] == ["key_1", "key_2"]
+        updates = mock_firebase["ref"].update.call_args[0][0]
+        assert [p for p in updates if p.startswith("user_records/")] == [f"user_records/test_user_123/{data['keys'][2]}"]
+        assert updates["device_seq/test_device_123/last"]["seqs"] == [3]
+    
+    def test_post_records_rejects_invalid_seq(self, test_client, mock_firebase, device_headers):
+        """Test seq must be a non-negative integer."""
+        mock_firebase["ref"].get.return_value = "test_secret_456"
+        
+        response = test_client.post(
+            "/api/records/",
+            json={"spo2": 98, "heart_rate": 75, "seq": "7"},
+            headers=device_headers
+        )
+        
+        assert response.status_code == 400
@@ -0,0 +1,101 @@
+"""Tests for the columnar GET /api/records format and compact encoding."""
+import json
+
+from api.codec import columnar, encode_json
+from tests.conftest import T0, make_record
+
+
+class TestColumnar:
+    """Test the row-to-column transform."""
+    
+    def test_columns_follow_record_order(self):
+        """Test each field becomes one list and legacy hr fills heart_rate."""
+        records = [{"id": "k2", **make_record(T0 + 1000, heart_rate=80)}, {"id": "k1", "ts": T0, "hr": 60, "spo2": 97}]
+        
+        assert columnar(records) == {
+            "id": ["k2", "k1"],
+            "ts": [T0 + 1000, T0],
+            "heart_rate": [80, 60],
+            "spo2": [98, 97],
+        }
+    
+    def test_encode_json_is_compact(self):
+        """Test the encoder output parses back and has no padding."""
+        body = encode_json({"a": [1, 2], "b": None})
+        
+        assert json.loads(body) == {"a": [1, 2], "b": None}
+        assert b" " not in body
+
+
+class TestColumnarEndpoint:
+    """Test GET /api/records?format=columnar."""
+    
+    def test_plain_list_as_columns(self, test_client, auth_headers, rtdb):
+        """Test the newest-first list comes back as parallel arrays."""
+        rtdb["user_records"] = {"test_user_123": {
+            "k1": make_record(T0, heart_rate=70),
+            "k2": make_record(T0 + 1000, heart_rate=80),
+        }}
+        
+        response = test_client.get("/api/records/?format=columnar", headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == {
+            "id": ["k2", "k1"],
+            "ts": [T0 + 1000, T0],
+            "heart_rate": [80, 70],
+            "spo2": [98, 98],
+        }
+    
+    def test_envelope_keeps_cursor_fields(self, test_client, auth_headers, rtdb):
+        """Test paginated reads keep next_cursor and watermark next to the columns."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0)}}
+        
+        response = test_client.get(f"/api/records/?format=columnar&end_ts={T0}", headers=auth_headers)
+        
+        data = response.json()
+        assert data["records"]["id"] == ["k1"]
+        assert data["next_cursor"] is None
+        assert "watermark" in data
+    
+    def test_large_body_is_gzipped(self, test_client, auth_headers, rtdb):
+        """Test bodies over the threshold are compressed when the client accepts gzip."""
+        rtdb["user_records"] = {"test_user_123": {f"k{i:03d}": make_record(T0 + i * 1000) for i in range(100)}}
+        
+        response = test_client.get(
+            "/api/records/?format=columnar&limit=100",
+            headers={**auth_headers, "Accept-Encoding": "gzip"},
+        )
+        
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert len(response.json()["id"]) == 100
+        assert int(response.headers["content-length"]) < len(response.content)
+    
+    def test_identity_when_not_accepted(self, test_client, auth_headers, rtdb):
+        """Test clients that refuse compression get a plain body."""
+        rtdb["user_records"] = {"test_user_123": {f"k{i:03d}": make_record(T0 + i * 1000) for i in range(100)}}
+        
+        response = test_client.get(
+            "/api/records/?format=columnar&limit=100",
+            headers={**auth_headers, "Accept-Encoding": "gzip;q=0, identity"},
+        )
+        
+        assert "content-encoding" not in response.headers
+    
+    def test_format_is_part_of_etag(self, test_client, auth_headers, rtdb):
+        """Test a rows ETag does not validate a columnar request."""
+        rtdb["user_records"] = {"test_user_123": {"k1": make_record(T0)}}
+        etag = test_client.get("/api/records/", headers=auth_headers).headers["etag"]
+        
+        response = test_client.get(
+            "/api/records/?format=columnar", headers={**auth_headers, "If-None-Match": etag}
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+    
+    def test_rejects_unknown_format(self, test_client, auth_headers):
+        """Test an unsupported format is a client error."""
+        assert test_client.get("/api/records/?format=csv", headers=auth_headers).status_code == 400
@@ -0,0 +1,155 @@
+"""Tests for per-user vitals rollups."""
+import itertools
+
+from api import ingest_queue
+from api.ingest import write_records
+from api.rollups import bucket_start, compute_rollups, merge_rollups, record_rollup
+from tests.conftest import HOUR, T0, make_record
+
+
+class TestRollupMath:
+    """Test bucket alignment and merging."""
+    
+    def test_bucket_start_alignment(self):
+        """Test buckets are aligned to UTC boundaries."""
+        ts = T0 + 2 * HOUR + 61_000
+        assert bucket_start(ts, "minute") == T0 + 2 * HOUR + 60_000
+        assert bucket_start(ts, "hour") == T0 + 2 * HOUR
+        assert bucket_start(ts, "day") == T0
+    
+    def test_merge_is_order_independent(self):
+        """Test any merge order gives the same rollup."""
+        parts = [record_rollup(make_record(T0, heart_rate=hr, spo2=spo2)) for hr, spo2 in [(60, 97), (90, 99), (75, 95)]]
+        results = []
+        for order in itertools.permutations(parts):
+            merged = None
+            for part in order:
+                merged = merge_rollups(merged, part)
+            results.append(merged)
+        
+        assert all(result == results[0] for result in results)
+        assert results[0] == {
+            "count": 3,
+            "heart_rate": {"count": 3, "sum": 225, "min": 60, "max": 90},
+            "spo2": {"count": 3, "sum": 291, "min": 95, "max": 99},
+        }
+    
+    def test_merge_with_empty_bucket(self):
+        """Test merging into a missing bucket yields the delta."""
+        delta = record_rollup(make_record(T0, heart_rate=72, spo2=98))
+        assert merge_rollups(None, delta) == delta
+    
+    def test_non_numeric_values_are_counted_but_not_aggregated(self):
+        """Test bad metric values do not poison the bucket."""
+        rollup = record_rollup(make_record(T0, heart_rate="n/a", spo2=98))
+        assert rollup["count"] == 1
+        assert "heart_rate" not in rollup
+        assert rollup["spo2"]["sum"] == 98
+    
+    def test_compute_rollups_groups_by_user_and_bucket(self):
+        """Test a batch folds into one delta per touched bucket."""
+        records = [
+            make_record(T0 + 1_000, heart_rate=70, spo2=98),
+            make_record(T0 + 2_000, heart_rate=80, spo2=96),
+            make_record(T0 + HOUR, heart_rate=90, spo2=97),
+            make_record(T0 + 3_000, heart_rate=65, spo2=99, uid="other_user"),
+        ]
+        rollups = compute_rollups(records, ["hour", "day"])
+        
+        assert rollups[("test_user_123", "hour", T0)]["count"] == 2
+        assert rollups[("test_user_123", "hour", T0 + HOUR)]["count"] == 1
+        assert rollups[("test_user_123", "day", T0)]["heart_rate"]["max"] == 90
+        assert rollups[("other_user", "day", T0)]["count"] == 1
+        assert len(rollups) == 5
+
+
+class TestRollupIngest:
+    """Test rollups are maintained on ingest."""
+    
+    def test_write_records_leaves_rollups_to_the_queue(self, mock_firebase, derived_queue):
+        """Test the request path makes one multi-path update and no rollup transaction."""
+        write_records([("k1", make_record(T0, heart_rate=70, spo2=98))])
+        
+        mock_firebase["ref"].update.assert_called_once()
+        paths = [call.args[0] for call in mock_firebase["db_ref"].call_args_list]
+        assert not [p for p in paths if p.startswith("/user_rollups/")]
+        assert derived_queue.depth() == 1
+    
+    def test_flush_applies_one_transaction_per_bucket(self, mock_firebase, derived_queue):
+        """Test queued records from two writes share each touched bucket's transaction."""
+        mock_ref = mock_firebase["ref"]
+        write_records([("k1", make_record(T0 + 1_000, heart_rate=70, spo2=98))])
+        write_records([("k2", make_record(T0 + 2_000, heart_rate=80, spo2=96))])
+        mock_firebase["db_ref"].reset_mock()
+        mock_ref.transaction.reset_mock()
+        
+        derived_queue.flush()
+        
+        paths = [call.args[0] for call in mock_firebase["db_ref"].call_args_list]
+        rollup_paths = [p for p in paths if p.startswith("/user_rollups/")]
+        # one minute, one hour and one day bucket
+        assert len(rollup_paths) == 3
+        assert f"/user_rollups/test_user_123/hour/{T0}" in rollup_paths
+        
+        merge = mock_ref.transaction.call_args_list[0].args[0]
+        stored = {"count": 1, "heart_rate": {"count": 1, "sum": 100, "min": 100, "max": 100}}
+        merged = merge(stored)
+        assert merged["count"] == 3
+        assert merged["heart_rate"] == {"count": 3, "sum": 250, "min": 70, "max": 100}
+        assert merged["spo2"]["count"] == 2
+    
+    def test_rollup_failure_is_not_retried(self, mock_firebase, derived_queue):
+        """Test a failed rollup transaction is dropped rather than re-applied."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.transaction.side_effect = RuntimeError("transaction aborted")
+        write_records([("k1", make_record(T0, heart_rate=70, spo2=98))])
+        
+        assert derived_queue.flush() == 1
+        assert derived_queue.depth() == 0
+        mock_ref.update.assert_called_once()
+    
+    def test_inline_when_write_behind_is_off(self, mock_firebase, monkeypatch):
+        """Test DERIVED_WRITE_BEHIND=false applies rollups during the write."""
+        monkeypatch.setattr(ingest_queue, "DERIVED_WRITE_BEHIND", False)
+        
+        write_records([("k1", make_record(T0, heart_rate=70, spo2=98))])
+        
+        paths = [call.args[0] for call in mock_firebase["db_ref"].call_args_list]
+        assert len([p for p in paths if p.startswith("/user_rollups/")]) == 3
+
+
+class TestRollupsEndpoint:
+    """Test GET /api/records/rollups."""
+    
+    def test_get_rollups(self, test_client, auth_headers, mock_firebase):
+        """Test stored buckets are returned in time order with means."""
+        mock_ref = mock_firebase["ref"]
+        mock_ref.order_by_key.return_value = mock_ref
+        mock_ref.start_at.return_value = mock_ref
+        mock_ref.end_at.return_value = mock_ref
+        mock_ref.get.return_value = {
+            str(T0 + HOUR): {"count": 1, "heart_rate": {"count": 1, "sum": 90, "min": 90, "max": 90}},
+            str(T0): {
+                "count": 2,
+                "heart_rate": {"count": 2, "sum": 150, "min": 70, "max": 80},
+                "spo2": {"count": 2, "sum": 194, "min": 96, "max": 98},
+            },
+        }
+        
+        response = test_client.get(
+            f"/api/records/rollups?granularity=hour&start_ts={T0}&end_ts={T0 + 2 * HOUR}",
+            headers=auth_headers,
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [b["bucket"] for b in data["buckets"]] == [T0, T0 + HOUR]
+        assert data["buckets"][0]["heart_rate"]["mean"] == 75
+        assert data["buckets"][1]["spo2"] is None
+        mock_firebase["db_ref"].assert_any_call("/user_rollups/test_user_123/hour")
+    
+    def test_get_rollups_rejects_unknown_granularity(self, test_client, auth_headers, mock_firebase):
+        """Test invalid granularity is rejected."""
+        response = test_client.get("/api/records/rollups?granularity=week", headers=auth_headers)
+        
+        assert response.status_code == 400
@@ -0,0 +1,288 @@
+"""Tests for the /user_devices reverse index."""
+from unittest.mock import Mock, call, patch
+
+import pytest
+
+from api.device_access import load_device_access, user_device_entries
+
+# 2023-11-14T00:00:00Z
+T0 = 1_699_920_000_000
+
+
+def _members_transaction(mock_firebase, members):
+    """Run /device_users transactions against `members`, keeping what each commits."""
+    stored = [members]
+    
+    def transaction(update):
+        stored[0] = update(stored[0])
+        return stored[0]
+    
+    mock_firebase["ref"].transaction.side_effect = transaction
+
+
+class TestUserDeviceEntries:
+    """Test index entries computed from a device's membership."""
+    
+    def test_members_and_legacy_owner(self):
+        """Test members and the legacy owner get entries describing their own membership."""
+        entries = user_device_entries(
+            "dev1", {"a": {"registered_at": T0, "added_by": "b"}}, owner="b", registered_at=T0 - 1, removed=["c"]
+        )
+        
+        assert entries == {
+            "user_devices/c/dev1": None,
+            "user_devices/a/dev1": {"registered_at": T0, "added_by": "b", "is_legacy": False},
+            "user_devices/b/dev1": {"registered_at": T0 - 1, "is_legacy": True},
+        }
+    
+    def test_owner_who_is_also_a_member_gets_one_entry(self):
+        """Test a legacy owner listed under /device_users gets a single member entry."""
+        entries = user_device_entries("dev1", {"a": {"registered_at": T0}}, owner="a")
+        
+        assert list(entries) == ["user_devices/a/dev1"]
+        assert entries["user_devices/a/dev1"]["is_legacy"] is False
+
+
+class TestMembershipWrites:
+    """Test membership changes commit the members, then write the changed users' entries."""
+    
+    def test_register_adds_index_entry(self, test_client, rtdb, auth_headers):
+        """Test registration writes the membership and the user's entry, leaving others alone."""
+        rtdb["devices"] = {"dev1": {"secret": "s1", "registered_at": T0}}
+        rtdb["device_users"] = {"dev1": {"other_user": {"registered_at": T0}}}
+        
+        response = test_client.post(
+            "/api/records/device/register", json={"device_id": "dev1", "device_secret": "s1"}, headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        assert rtdb["device_users"]["dev1"]["test_user_123"]["registered_at"] >= T0
+        assert rtdb["user_devices"]["test_user_123"]["dev1"]["is_legacy"] is False
+        assert "other_user" not in rtdb["user_devices"]
+    
+    def test_register_migrates_legacy_owner(self, test_client, rtdb, auth_headers):
+        """Test the legacy owner moves to /device_users and loses is_legacy."""
+        rtdb["devices"] = {"dev1": {"secret": "s1", "user_id": "owner", "registered_at": T0}}
+        
+        test_client.post(
+            "/api/records/device/register", json={"device_id": "dev1", "device_secret": "s1"}, headers=auth_headers
+        )
+        
+        assert "user_id" not in rtdb["devices"]["dev1"]
+        assert rtdb["device_users"]["dev1"]["owner"] == {"registered_at": T0}
+        assert rtdb["user_devices"]["owner"]["dev1"] == {"registered_at": T0, "added_by": None, "is_legacy": False}
+    
+    @patch("firebase_admin.auth.get_user_by_email")
+    def test_add_user_adds_target_entry(self, mock_get_user, test_client, rtdb, auth_headers):
+        """Test sharing adds only the target's entry."""
+        mock_get_user.return_value = Mock(uid="target")
+        rtdb["devices"] = {"dev1": {"secret": "s1"}}
+        rtdb["device_users"] = {"dev1": {"test_user_123": {"registered_at": T0}}}
+        
+        test_client.post(
+            "/api/records/device/dev1/add-user",
+            json={"user_email": "t@example.com", "device_secret": "s1"},
+            headers=auth_headers,
+        )
+        
+        assert rtdb["user_devices"]["target"]["dev1"]["added_by"] == "test_user_123"
+        assert set(rtdb["user_devices"]) == {"target"}
+    
+    @patch("firebase_admin.auth.get_user_by_email")
+    def test_interleaved_adds_both_land(self, mock_get_user, test_client, rtdb, auth_headers):
+        """Test a share committed by another instance mid-request is kept and counted."""
+        rtdb["devices"] = {"dev1": {"secret": "s1"}}
+        rtdb["device_users"] = {"dev1": {"test_user_123": {"registered_at": T0}}}
+        
+        def other_instance_adds_b(email):
+            # Lands after this request read the device, before it writes
+            rtdb["device_users"]["dev1"]["b"] = {"registered_at": T0, "added_by": "test_user_123"}
+            rtdb["user_devices"] = {"b": {"dev1": {"registered_at": T0, "added_by": "test_user_123", "is_legacy": False}}}
+            return Mock(uid="a")
+        
+        mock_get_user.side_effect = other_instance_adds_b
+        
+        response = test_client.post(
+            "/api/records/device/dev1/add-user",
+            json={"user_email": "a@example.com", "device_secret": "s1"},
+            headers=auth_headers,
+        )
+        
+        assert response.status_code == 200
+        assert set(rtdb["device_users"]["dev1"]) == {"test_user_123", "a", "b"}
+        assert set(rtdb["user_devices"]) == {"a", "b"}
+        assert set(load_device_access("dev1").members) == {"test_user_123", "a", "b"}
+    
+    def test_remove_drops_entry(self, test_client, rtdb, auth_headers):
+        """Test removal deletes the target's membership and entry."""
+        rtdb["devices"] = {"dev1": {"secret": "s1"}}
+        rtdb["device_users"] = {"dev1": {"test_user_123": {"registered_at": T0}, "target": {"registered_at": T0}}}
+        rtdb["user_devices"] = {"target": {"dev1": {"user_count": 2}}}
+        
+        test_client.delete("/api/records/device/dev1/remove-user/target", headers=auth_headers)
+        
+        assert set(rtdb["device_users"]["dev1"]) == {"test_user_123"}
+        assert "dev1" not in rtdb["user_devices"]["target"]
+
+
+class TestRoundTrips:
+    """Test each membership change reads the device fresh, commits the members and writes the index once."""
+    
+    DEVICE = {"secret": "s1", "registered_at": T0}
+    
+    @pytest.fixture
+    def warm(self, mock_firebase):
+        """Cache dev1's policy as an authorization check would, then count from zero."""
+        mock_firebase["ref"].get.side_effect = [self.DEVICE, {"test_user_123": {"registered_at": T0}}]
+        load_device_access("dev1")
+        mock_firebase["db_ref"].reset_mock()
+        mock_firebase["ref"].reset_mock()
+        return mock_firebase
+    
+    def _assert_fresh_read_one_write(self, mock_firebase):
+        assert mock_firebase["db_ref"].call_args_list == [
+            call("/devices/dev1"), call("/device_users/dev1"), call("/device_users/dev1"), call("/")
+        ]
+        assert mock_firebase["ref"].get.call_count == 2
+        assert mock_firebase["ref"].transaction.call_count == 1
+        assert mock_firebase["ref"].update.call_count == 1
+        mock_firebase["ref"].set.assert_not_called()
+        mock_firebase["ref"].delete.assert_not_called()
+    
+    def test_register(self, test_client, warm, auth_headers):
+        """Test registering a second user ignores the cached policy."""
+        warm["ref"].get.side_effect = [self.DEVICE, {"other_user": {"registered_at": T0}}]
+        _members_transaction(warm, {"other_user": {"registered_at": T0}})
+        
+        response = test_client.post(
+            "/api/records/device/register", json={"device_id": "dev1", "device_secret": "s1"}, headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        self._assert_fresh_read_one_write(warm)
+    
+    @patch("firebase_admin.auth.get_user_by_email")
+    def test_add_user(self, mock_get_user, test_client, warm, auth_headers):
+        """Test sharing ignores the cached policy."""
+        mock_get_user.return_value = Mock(uid="target")
+        warm["ref"].get.side_effect = [self.DEVICE, {"test_user_123": {"registered_at": T0}}]
+        _members_transaction(warm, {"test_user_123": {"registered_at": T0}})
+        
+        response = test_client.post(
+            "/api/records/device/dev1/add-user",
+            json={"user_email": "t@example.com", "device_secret": "s1"},
+            headers=auth_headers,
+        )
+        
+        assert response.status_code == 200
+        self._assert_fresh_read_one_write(warm)
+    
+    def test_remove_user(self, test_client, warm, auth_headers):
+        """Test removal ignores the cached policy."""
+        warm["ref"].get.side_effect = [
+            self.DEVICE, {"test_user_123": {"registered_at": T0}, "target": {"registered_at": T0}}
+        ]
+        _members_transaction(warm, {"test_user_123": {"registered_at": T0}, "target": {"registered_at": T0}})
+        
+        response = test_client.delete("/api/records/device/dev1/remove-user/target", headers=auth_headers)
+        
+        assert response.status_code == 200
+        self._assert_fresh_read_one_write(warm)
+    
+    def test_register_after_legacy_owner_was_removed(self, test_client, rtdb, auth_headers):
+        """Test a legacy owner another instance migrated and then removed is not re-added."""
+        rtdb["devices"] = {"dev1": {"secret": "s1", "registered_at": T0, "user_id": "legacy"}}
+        assert load_device_access("dev1").owner == "legacy"
+        # Another instance migrates the owner into /device_users, then removes them
+        rtdb["devices"]["dev1"].pop("user_id")
+        rtdb["device_users"] = {"dev1": {"other_user": {"registered_at": T0}}}
+        
+        response = test_client.post(
+            "/api/records/device/register", json={"device_id": "dev1", "device_secret": "s1"}, headers=auth_headers
+        )
+        
+        assert response.status_code == 200
+        assert set(rtdb["device_users"]["dev1"]) == {"other_user", "test_user_123"}
+        assert "legacy" not in rtdb.get("user_devices", {})
+        assert load_device_access("dev1").owner is None
+    
+    @patch("firebase_admin.auth.get_user_by_email")
+    def test_changes_keep_the_cache_warm(self, mock_get_user, test_client, mock_firebase, auth_headers):
+        """Test the policy a change wrote is what the next authorization check sees."""
+        mock_get_user.return_value = Mock(uid="target")
+        mock_firebase["ref"].get.side_effect = [
+            self.DEVICE, None, self.DEVICE, {"test_user_123": {"registered_at": T0}}
+        ]
+        _members_transaction(mock_firebase, None)
+        
+        test_client.post(
+            "/api/records/device/register", json={"device_id": "dev1", "device_secret": "s1"}, headers=auth_headers
+        )
+        test_client.post(
+            "/api/records/device/dev1/add-user",
+            json={"user_email": "t@example.com", "device_secret": "s1"},
+            headers=auth_headers,
+        )
+        
+        assert mock_firebase["ref"].get.call_count == 4
+        assert mock_firebase["ref"].update.call_count == 2
+        assert list(mock_firebase["ref"].update.call_args[0][0]) == ["user_devices/target/dev1"]
+        assert set(load_device_access("dev1").members) == {"test_user_123", "target"}
+
+
+class TestUserDevicesEndpoint:
+    """Test GET /api/records/user/devices reads the index once it is complete."""
+    
+    INDEX = {
+        "dev2": {"registered_at": T0, "added_by": "x", "is_legacy": False},
+        "dev1": {"registered_at": T0 - 1, "is_legacy": True},
+    }
+    DEVICES = {"dev1": {"secret": "s", "registered_at": T0 - 1, "user_id": "test_user_123"}, "dev2": {"secret": "s"}}
+    DEVICE_USERS = {"dev2": {"test_user_123": {"registered_at": T0, "added_by": "x"}, "b": {}, "c": {}}}
+    EXPECTED = [
+        {"device_id": "dev1", "registered_at": T0 - 1, "is_legacy": True, "user_count": 1},
+        {"device_id": "dev2", "registered_at": T0, "is_legacy": False, "user_count": 3, "added_by": "x"},
+    ]
+    
+    def test_one_read_of_the_index(self, test_client, mock_firebase, auth_headers):
+        """Test the list comes from /user_devices/{uid} alone once the marker and devices are cached."""
+        mock_firebase["ref"].get.side_effect = [
+            {"complete": True},
+            self.INDEX,
+            self.DEVICES["dev1"], None,  # dev1's policy, for its user count
+            self.DEVICES["dev2"], self.DEVICE_USERS["dev2"],
+            self.INDEX,
+        ]
+        
+        test_client.get("/api/records/user/devices", headers=auth_headers)
+        mock_firebase["db_ref"].reset_mock()
+        response = test_client.get("/api/records/user/devices", headers={**auth_headers, "If-None-Match": "x"})
+        
+        assert response.json()["devices"] == self.EXPECTED
+        mock_firebase["db_ref"].assert_called_once_with("/user_devices/test_user_123")
+    
+    def test_scans_devices_until_the_index_is_complete(self, test_client, mock_firebase, auth_headers):
+        """Test users keep seeing their devices before scripts/rebuild_user_devices.py has run."""
+        mock_firebase["ref"].get.side_effect = [None, self.DEVICES, self.DEVICE_USERS]
+        
+        response = test_client.get("/api/records/user/devices", headers=auth_headers)
+        
+        assert response.json()["devices"] == self.EXPECTED
+        assert mock_firebase["db_ref"].call_args_list == [
+            call("/migrations/user_devices"), call("/devices"), call("/device_users")
+        ]
+    
+    def test_user_count_comes_from_the_device(self, test_client, rtdb, auth_headers):
+        """Test counts reflect current membership and entries for devices the user left are skipped."""
+        rtdb["migrations"] = {"user_devices": {"complete": True}}
+        rtdb["devices"] = {**self.DEVICES, "dev3": {"secret": "s"}}
+        rtdb["device_users"] = {**self.DEVICE_USERS, "dev3": {"b": {}}}
+        rtdb["user_devices"] = {"test_user_123": {
+            **self.INDEX,
+            "dev2": {**self.INDEX["dev2"], "user_count": 2},  # Written before counts were derived
+            "dev3": {"registered_at": T0, "is_legacy": False},
+        }}
+        
+        response = test_client.get("/api/records/user/devices", headers=auth_headers)
+        
+        assert response.json()["devices"] == self.EXPECTED
@@ -0,0 +1,89 @@
+"""Tests for batched, cached Firebase Auth user lookups."""
+from unittest.mock import Mock, patch
+
+import pytest
+
+from api.user_info import AUTH_BATCH_SIZE, forget_user_info, lookup_users
+
+
+def _get_users(identifiers):
+    """Fake auth.get_users: every uid exists except those starting with "gone"."""
+    uids = [identifier.uid for identifier in identifiers]
+    return Mock(
+        users=[Mock(uid=uid, email=f"{uid}@example.com", display_name=uid.upper()) for uid in uids if not uid.startswith("gone")],
+        not_found=[identifier for identifier in identifiers if identifier.uid.startswith("gone")],
+    )
+
+
+@pytest.fixture
+def get_users():
+    with patch("firebase_admin.auth.get_users", side_effect=_get_users) as mock_get_users:
+        yield mock_get_users
+
+
+class TestLookupUsers:
+    """Test uid -> user info resolution."""
+    
+    def test_batches_of_one_hundred(self, get_users):
+        """Test 250 uids cost three Auth calls of at most AUTH_BATCH_SIZE identifiers."""
+        uids = [f"user_{i}" for i in range(250)]
+        
+        infos = lookup_users(uids)
+        
+        assert infos["user_7"] == {"email": "user_7@example.com", "display_name": "USER_7"}
+        assert [len(call.args[0]) for call in get_users.call_args_list] == [AUTH_BATCH_SIZE, AUTH_BATCH_SIZE, 50]
+    
+    def test_cached_and_missing_users(self, get_users):
+        """Test repeat lookups hit the cache, including users that don't exist."""
+        lookup_users(["a", "gone_b"])
+        
+        infos = lookup_users(["a", "gone_b", None, "a"])
+        
+        assert infos == {"a": {"email": "a@example.com", "display_name": "A"}, "gone_b": None}
+        assert get_users.call_count == 1
+    
+    def test_forget_refetches(self, get_users):
+        """Test an invalidated user is looked up again."""
+        lookup_users(["a"])
+        forget_user_info("a")
+        
+        lookup_users(["a"])
+        
+        assert get_users.call_count == 2
+    
+    def test_failed_batch_falls_back_to_uids(self, get_users):
+        """Test an Auth error only affects its batch, and those users are retried next time."""
+        uids = [f"user_{i}" for i in range(AUTH_BATCH_SIZE + 1)]
+        
+        def first_batch_fails(identifiers):
+            if get_users.call_count == 1:
+                raise Exception("Auth unavailable")
+            return _get_users(identifiers)
+        
+        get_users.side_effect = first_batch_fails
+        
+        infos = lookup_users(uids)
+        
+        assert infos["user_0"] == {"email": None, "display_name": None}
+        assert infos[f"user_{AUTH_BATCH_SIZE}"]["email"] == f"user_{AUTH_BATCH_SIZE}@example.com"
+        
+        assert lookup_users(["user_0"])["user_0"]["email"] == "user_0@example.com"
+        assert get_users.call_count == 3
+
+
+class TestAdminInvalidation:
+    """Test admin user changes drop cached entries."""
+    
+    @patch("firebase_admin.auth.update_user")
+    def test_update_user_forgets_entry(self, mock_update_user, test_client, mock_firebase, admin_user_token, get_users):
+        """Test a changed email is not served from the cache."""
+        lookup_users(["user_123"])
+        
+        test_client.put(
+            "/api/admin/users/user_123",
+            json={"email": "new@example.com"},
+            headers={"Authorization": "Bearer admin_token"},
+        )
+        lookup_users(["user_123"])
+        
+        assert get_users.call_count == 2